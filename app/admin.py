@@ -1,8 +1,15 @@
 from django.contrib import admin
 
 from app.models.customers.models import Customer
+from app.models.idempotency.models import IdempotencyKey
 from app.models.orders.models import Order
+from app.models.notifications.models import Notification
+from app.models.rollups.models import CustomerOrderRollup, OrderRollup
 
 # Register your models here.
 admin.site.register(Customer)
 admin.site.register(Order)
+admin.site.register(Notification)
+admin.site.register(OrderRollup)
+admin.site.register(CustomerOrderRollup)
+admin.site.register(IdempotencyKey)
@@ -0,0 +1,108 @@
+"""
+Cached OAuth2 bearer token validation.
+
+Validated access tokens are kept in the shared cache, keyed by the
+token's checksum, for no longer than the token has left to live. An
+entry holds the token's scopes and expiry, its user's fields but for the
+password hash, and its application's id; never the application's row or
+any secret. A hit rebuilds the token with its user as if loaded with
+`.defer('password')`, so `request.user` is the real user, staff flags
+and all, without a query. Entries are dropped by the signals in
+app/signals.py when a token is saved or deleted, which covers the revoke
+endpoint, and when its user is saved, so a cached user never outlives a
+change such as a deactivation.
+
+Within a request the outcome of the first verification is remembered on
+the request, so `OAuth2TokenMiddleware` and DRF's `OAuth2Authentication`
+don't each validate the same header.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils import timezone
+from oauth2_provider.models import (
+    get_access_token_model, get_application_model
+)
+from oauth2_provider.oauth2_backends import OAuthLibCore
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+from app import metrics
+
+
+def token_cache_key(checksum):
+    return f'oauth2:access_token:{checksum}'
+
+
+def invalidate_token(checksum):
+    cache.delete(token_cache_key(checksum))
+
+
+# Left out of cached users, and loaded only if something reads them
+USER_SECRET_FIELDS = frozenset({'password'})
+
+
+def token_entry(access_token):
+    user = access_token.user
+    return {'id': access_token.pk, 'scope': access_token.scope,
+            'expires': access_token.expires,
+            'user_id': access_token.user_id,
+            'application_id': access_token.application_id,
+            'user': None if user is None else {
+                field.attname: getattr(user, field.attname)
+                for field in user._meta.concrete_fields
+                if field.attname not in USER_SECRET_FIELDS}}
+
+
+def rebuild_token(token, entry):
+    """
+    The access token `entry` was cached from, with its user and a stand-in
+    application carrying just its id.
+    """
+    entry = dict(entry)
+    user = entry.pop('user')
+    access_token = get_access_token_model()(token=token, **entry)
+    if user is not None:
+        User = get_user_model()
+        access_token.user = User.from_db(router.db_for_write(User),
+                                         list(user), list(user.values()))
+    if entry['application_id'] is not None:
+        access_token.application = get_application_model()(
+            pk=entry['application_id'])
+    return access_token
+
+
+class CachedOAuth2Validator(OAuth2Validator):
+    def _load_access_token(self, token):
+        checksum = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        key = token_cache_key(checksum)
+        entry = cache.get(key)
+        if entry is not None:
+            metrics.incr('cache.access_token.hit')
+            return rebuild_token(token, entry)
+        metrics.incr('cache.access_token.miss')
+
+        access_token = super()._load_access_token(token)
+        if access_token is not None:
+            remaining = int(
+                (access_token.expires - timezone.now()).total_seconds())
+            timeout = min(settings.OAUTH2_TOKEN_CACHE_TIMEOUT, remaining)
+            if timeout > 0:
+                cache.set(key, token_entry(access_token), timeout=timeout)
+        return access_token
+
+
+class CachedOAuthLibCore(OAuthLibCore):
+    def verify_request(self, request, scopes):
+        # DRF passes its own Request wrapping the Django one
+        django_request = getattr(request, '_request', request)
+        lookup = (request.META.get('HTTP_AUTHORIZATION'), tuple(scopes))
+        verified = getattr(django_request, '_oauth2_verified', None)
+        if verified is not None and verified[0] == lookup:
+            return verified[1]
+
+        result = super().verify_request(request, scopes)
+        django_request._oauth2_verified = (lookup, result)
+        return result
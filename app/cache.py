@@ -0,0 +1,129 @@
+"""
+Cache for serialized customer and order representations.
+
+Entries are keyed by API version, model, pk and the object's generation,
+a random token the model signals in app/signals.py replace once a write
+commits. Invalidating leaves old entries unreachable rather than
+deleting them, so a fill that read the object before the write can't
+store it where readers will find it. An order entry holds the order's
+own fields only; its `customer_details` are read from the customer's
+entry, so a customer change is a single invalidation however many
+orders embed that customer.
+"""
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from app import metrics, routers
+
+
+def generation_key(model_name, pk):
+    return f'api:generation:{model_name}:{pk}'
+
+
+def new_generation(model_name, pk):
+    # Outlives the entries stored under it; if it is evicted anyway, the
+    # next read starts a new generation and they are merely missed
+    generation = uuid.uuid4().hex
+    cache.set(generation_key(model_name, pk), generation,
+              timeout=settings.API_CACHE_TIMEOUT * 2)
+    return generation
+
+
+def cache_key(model_name, pk, version):
+    generation = cache.get(generation_key(model_name, pk))
+    if generation is None:
+        cache.add(generation_key(model_name, pk), uuid.uuid4().hex,
+                  timeout=settings.API_CACHE_TIMEOUT * 2)
+        generation = cache.get(generation_key(model_name, pk))
+    return f'api:{version}:{model_name}:{pk}:{generation}'
+
+
+def invalidate(model_name, pk):
+    new_generation(model_name, pk)
+
+
+def get_or_render(key, render, metric):
+    """
+    Return the cached value for `key`, rendering and storing it on a miss.
+
+    Only one caller renders a missing key at a time; the others wait for
+    its result rather than all hitting the database at once. A render
+    slower than API_CACHE_LOCK_TIMEOUT loses its lock to one waiter,
+    which renders in its place while the rest keep waiting. Timeouts are
+    jittered so entries written together don't all expire together.
+    """
+    value = cache.get(key)
+    if value is not None:
+        metrics.incr(f'cache.{metric}.hit')
+        return value
+    metrics.incr(f'cache.{metric}.miss')
+
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token,
+                     timeout=settings.API_CACHE_LOCK_TIMEOUT):
+        while True:
+            time.sleep(0.05)
+            value = cache.get(key)
+            if value is not None:
+                metrics.incr(f'cache.{metric}.wait_hit')
+                return value
+            if cache.add(lock_key, token,
+                         timeout=settings.API_CACHE_LOCK_TIMEOUT):
+                break
+        metrics.incr(f'cache.{metric}.wait_timeout')
+        # Stored just before the lock was released
+        value = cache.get(key)
+        if value is not None:
+            cache.delete(lock_key)
+            return value
+
+    try:
+        # Never from a replica: a stale fill would outlive invalidation
+        with routers.primary_reads():
+            value = render()
+        timeout = settings.API_CACHE_TIMEOUT
+        cache.set(key, value,
+                  timeout=timeout + random.randint(0, timeout // 10))
+        return value
+    finally:
+        # Unless it lapsed and another caller holds it now
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def get_customer(pk, version, render):
+    return get_or_render(cache_key('customer', pk, version), render,
+                         'customer')
+
+
+def get_order(pk, version, render_order, render_customer):
+    """
+    Assemble an order representation from the order's and its customer's
+    cache entries. `render_order` returns the full serialized order; its
+    customer_details are stored under the customer's key.
+    """
+    rendered = {}
+
+    def render():
+        data = dict(render_order())
+        rendered['customer_details'] = data['customer_details']
+        data['customer_details'] = None
+        return data
+
+    data = dict(get_or_render(cache_key('order', pk, version), render,
+                              'order'))
+    if 'customer_details' in rendered:
+        # Freshly rendered; share the customer we just serialized
+        customer = rendered['customer_details']
+        cache.add(cache_key('customer', data['customer'], version),
+                  customer, timeout=settings.API_CACHE_TIMEOUT)
+    else:
+        customer = get_customer(data['customer'], version,
+                                lambda: render_customer(data['customer']))
+    data['customer_details'] = customer
+    return data
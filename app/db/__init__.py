@@ -0,0 +1,33 @@
+"""
+Database backends that record connection acquire time.
+
+`ENGINE` points at `app.db.postgresql` or `app.db.sqlite3`, thin
+subclasses of Django's backends. Every new connection is timed as
+`db.<alias>.connect` in app.metrics: with persistent connections that is
+the connect and auth round trip, with the psycopg pool it is the wait for
+a free pooled connection, which grows as the pool saturates.
+"""
+from django.db import connections
+
+from app import metrics
+
+
+class ConnectionMetricsMixin:
+    def get_new_connection(self, conn_params):
+        with metrics.timer(f'db.{self.alias}.connect'):
+            return super().get_new_connection(conn_params)
+
+    def pool_stats(self):
+        return None
+
+
+def db_metrics():
+    """Connection timings and, per pooled alias, the pool's counters."""
+    stats = {name: timing
+             for name, timing in metrics.snapshot()['timings'].items()
+             if name.startswith('db.')}
+    pools = {conn.alias: conn.pool_stats()
+             for conn in connections.all(initialized_only=True)
+             if isinstance(conn, ConnectionMetricsMixin)}
+    return {'timings': stats,
+            'pools': {alias: pool for alias, pool in pools.items() if pool}}
@@ -0,0 +1,15 @@
+from django.db.backends.postgresql import base
+
+from app.db import ConnectionMetricsMixin
+
+
+class DatabaseWrapper(ConnectionMetricsMixin, base.DatabaseWrapper):
+    def pool_stats(self):
+        # Don't create the pool just to report on it
+        pool = self._connection_pools.get(self.alias)
+        if pool is None:
+            return None
+        stats = pool.get_stats()
+        stats['saturation'] = ((stats['pool_size'] - stats['pool_available'])
+                               / stats['pool_max'])
+        return stats
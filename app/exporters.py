@@ -0,0 +1,83 @@
+"""
+Streaming order export.
+
+Rows are read through a server-side cursor as plain tuples and encoded
+straight to NDJSON or CSV, so no model instances or serializers are built
+and memory stays flat whatever the size of the export.
+"""
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from app.models.orders.models import Order
+
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'customer_code': 'customer__code',
+    'customer_name': 'customer__name',
+    'customer_phone_number': 'customer__phone_number',
+    'item': 'item',
+    'amount': 'amount',
+    'status': 'status',
+    'order_date': 'order_date',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """File-like object that hands back what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(filters, chunk_size=None, using=None):
+    chunk_size = chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE
+    return (Order.objects.using(using).filter(**filters)
+            .order_by('order_date', 'id')
+            .values_list(*EXPORT_COLUMNS.values())
+            .iterator(chunk_size=chunk_size))
+
+
+def _chunked(lines, chunk_size):
+    # Yield a few hundred rows at a time instead of one tiny write per row
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def encode_ndjson(rows, chunk_size=None):
+    encoder = DjangoJSONEncoder()
+    columns = list(EXPORT_COLUMNS)
+    return _chunked(
+        (encoder.encode(dict(zip(columns, row))) + '\n' for row in rows),
+        chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE)
+
+
+def encode_csv(rows, chunk_size=None):
+    writer = csv.writer(Echo())
+    header = [writer.writerow(list(EXPORT_COLUMNS))]
+
+    def lines():
+        yield from header
+        for row in rows:
+            yield writer.writerow(row)
+
+    return _chunked(lines(), chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE)
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'csv': encode_csv,
+}
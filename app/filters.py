@@ -0,0 +1,57 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from app.models.customers.models import normalize_phone
+from app.serializers import CustomerSearchSerializer, OrderFilterSerializer
+
+PHONE_TERM = re.compile(r'^\+?[\d\s-]+$')
+
+
+def search_customers(queryset, term):
+    """
+    Customers whose email or phone number starts with `term`, or whose
+    name resembles it. Phone numbers are compared in normalized form, so
+    0722… and +254722… find the same customers.
+
+    On PostgreSQL names match by trigram word similarity, which tolerates
+    typos, and every branch is served by a GIN trigram index; elsewhere
+    names match by substring.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        match = Q(name__trigram_word_similar=term)
+    else:
+        match = Q(name__icontains=term)
+    match |= Q(email__istartswith=term)
+    if PHONE_TERM.match(term):
+        match |= Q(phone_normalized__startswith=normalize_phone(term))
+    return queryset.filter(match)
+
+
+class CustomerSearchBackend(BaseFilterBackend):
+    """Narrows customers down to those matching `?search=`."""
+    def filter_queryset(self, request, queryset, view):
+        query = CustomerSearchSerializer(data=request.query_params)
+        if not query.is_valid():
+            raise ValidationError(query.errors)
+        term = query.validated_data.get('search', '').strip()
+        if not term:
+            return queryset
+        return search_customers(queryset, term)
+
+
+class OrderFilterBackend(BaseFilterBackend):
+    """
+    Filters orders by `status`, `customer` (id) or `customer_code`,
+    `order_date_after`/`order_date_before` and `amount_min`/`amount_max`.
+    Each filter, combined with the list's ordering, is served by one of
+    the indexes on Order.
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = OrderFilterSerializer(data=request.query_params)
+        if not query.is_valid():
+            raise ValidationError(query.errors)
+        return queryset.filter(**query.get_filters())
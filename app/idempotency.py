@@ -0,0 +1,165 @@
+"""
+Idempotent creates.
+
+Clients retry a POST that timed out. Sent with the same `Idempotency-Key`
+header, a retry of a create that already succeeded gets the original
+status and body back, without validating, saving or notifying again; a
+retry that arrives while the original is still running gets 409. A key
+reused for a different request is rejected with 422.
+
+Keys are scoped to the user and kept in IdempotencyKey for
+IDEMPOTENCY_KEY_TTL seconds. The unique (user, key) row is also the
+lock: the first request inserts it and its duplicates can't. The
+response is stored in the transaction that creates the object, so a
+request killed after that commits can never be run twice. A request
+that fails releases its key, so it can be retried with the same key.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from app.models.idempotency.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+class RequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = f'A request with this {HEADER} is still in progress.'
+    default_code = 'request_in_progress'
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = f'This {HEADER} was used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def request_key(request):
+    """The request's Idempotency-Key, or None if it has none."""
+    key = request.headers.get(HEADER)
+    if key is not None and not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise ValidationError(
+            {HEADER: [f'Must be 1 to {MAX_KEY_LENGTH} characters.']})
+    return key
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, cls=JSONEncoder, sort_keys=True,
+                      separators=(',', ':'))
+    return hashlib.sha256(
+        f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def claim(request, key):
+    """
+    Take `key` for `request`, returning its new IdempotencyKey, or the
+    finished one to replay if the request has run before.
+    """
+    digest = fingerprint(request)
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=request.user, key=key, fingerprint=digest,
+                    expires_at=now + timedelta(
+                        seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT))
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=request.user,
+                                                   key=key).first()
+        if record is None:
+            # Released meanwhile
+            continue
+        if record.expires_at > now:
+            break
+        # Expired, or held by a request that died
+        IdempotencyKey.objects.filter(pk=record.pk,
+                                      expires_at__lte=now).delete()
+
+    if record.fingerprint != digest:
+        raise KeyReused()
+    if record.status_code is None:
+        raise RequestInProgress()
+    return record
+
+
+def replay(record):
+    response = Response(json.loads(record.response),
+                        status=record.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def complete(record, data, status_code):
+    """Keep the response for replay. Call it in the create's transaction."""
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status_code=status_code,
+        response=json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                            separators=(',', ':')),
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TTL))
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+class IdempotentCreateMixin:
+    """`Idempotency-Key` support for a create view, sync or async."""
+    idempotency_record = None
+
+    def create(self, request, *args, **kwargs):
+        key = request_key(request)
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        record = claim(request, key)
+        if record.status_code is not None:
+            return replay(record)
+        try:
+            with transaction.atomic():
+                response = super().create(request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    complete(record, response.data, response.status_code)
+            record.status_code = response.status_code
+            return response
+        finally:
+            if not status.is_success(record.status_code or 0):
+                release(record)
+
+    async def acreate(self, request, *args, **kwargs):
+        key = request_key(request)
+        if key is None:
+            return await super().acreate(request, *args, **kwargs)
+        record = await sync_to_async(claim)(request, key)
+        if record.status_code is not None:
+            return replay(record)
+        self.idempotency_record = record
+        try:
+            return await super().acreate(request, *args, **kwargs)
+        finally:
+            if record.status_code is None:
+                await sync_to_async(release)(record)
+
+    async def aperform_create(self, serializer):
+        if self.idempotency_record is None:
+            return await super().aperform_create(serializer)
+        await sync_to_async(self.perform_idempotent_create)(serializer)
+
+    def perform_idempotent_create(self, serializer):
+        record = self.idempotency_record
+        with transaction.atomic():
+            self.perform_create(serializer)
+            complete(record, serializer.data, status.HTTP_201_CREATED)
+        record.status_code = status.HTTP_201_CREATED
@@ -0,0 +1,181 @@
+"""
+Streaming customer import.
+
+Rows are read one at a time from a CSV or JSON Lines text stream and
+written in bounded chunks, so memory use stays flat however large the
+file is. Uniqueness of `code`, `email` and `customer_id` is checked with
+one query per chunk instead of one per row.
+"""
+import csv
+from dataclasses import dataclass
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from app.models.customers.models import Customer
+
+IMPORT_FIELDS = ['name', 'code', 'phone_number', 'email', 'customer_id']
+UNIQUE_FIELDS = ['code', 'email', 'customer_id']
+FORMATS = ('csv', 'jsonl')
+
+
+@dataclass
+class ImportResult:
+    processed: int = 0
+    imported: int = 0
+    rejected: int = 0
+
+
+def detect_format(filename):
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def read_rows(stream, file_format):
+    """
+    Yield (line_number, row, error) for every record in the stream. Rows
+    that can't be parsed are yielded with an error instead of stopping
+    the import.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, {'non_field_errors': [str(e)]}
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, {
+                'non_field_errors': ['Expected a JSON object']}
+            continue
+        yield line_number, row, None
+
+
+class CustomerImporter:
+    """
+    Imports customers from an iterable of rows.
+
+    `on_reject(line_number, errors)` is called for every rejected row and
+    `on_progress(result)` after every chunk, so callers can report as they
+    go without the importer holding on to anything.
+    """
+
+    def __init__(self, chunk_size=None, ignore_conflicts=False,
+                 on_reject=None, on_progress=None):
+        self.chunk_size = chunk_size or settings.CUSTOMER_IMPORT_CHUNK_SIZE
+        self.ignore_conflicts = ignore_conflicts
+        self.on_reject = on_reject or (lambda line_number, errors: None)
+        self.on_progress = on_progress or (lambda result: None)
+        self.result = ImportResult()
+
+    def run(self, rows):
+        chunk = []
+        for line_number, row, error in rows:
+            self.result.processed += 1
+            if error:
+                self.reject(line_number, error)
+                continue
+            customer = self.build(line_number, row)
+            if customer is not None:
+                chunk.append((line_number, customer))
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk)
+                chunk = []
+        if chunk:
+            self.flush(chunk)
+        return self.result
+
+    def reject(self, line_number, errors):
+        self.result.rejected += 1
+        self.on_reject(line_number, errors)
+
+    def build(self, line_number, row):
+        customer = Customer(**{
+            field: str(row.get(field) or '').strip()
+            for field in IMPORT_FIELDS
+        })
+        try:
+            # Field validators only; uniqueness is checked per chunk
+            customer.full_clean(validate_unique=False,
+                                validate_constraints=False)
+        except ValidationError as e:
+            self.reject(line_number, e.message_dict)
+            return None
+        return customer
+
+    def flush(self, chunk):
+        customers = self.unique(chunk)
+        if customers:
+            self.insert(customers)
+        self.on_progress(self.result)
+
+    def unique(self, chunk):
+        """Drop rows clashing with existing customers or earlier rows."""
+        query = Q()
+        for field in UNIQUE_FIELDS:
+            query |= Q(**{f'{field}__in': [getattr(customer, field)
+                                           for _, customer in chunk]})
+        taken = {field: set() for field in UNIQUE_FIELDS}
+        for values in Customer.objects.filter(query).values_list(
+                *UNIQUE_FIELDS):
+            for field, value in zip(UNIQUE_FIELDS, values):
+                taken[field].add(value)
+
+        customers = []
+        for line_number, customer in chunk:
+            clashes = {field: [f'{field} already exists']
+                       for field in UNIQUE_FIELDS
+                       if getattr(customer, field) in taken[field]}
+            if clashes:
+                self.reject(line_number, clashes)
+                continue
+            for field in UNIQUE_FIELDS:
+                taken[field].add(getattr(customer, field))
+            customers.append((line_number, customer))
+        return customers
+
+    def insert(self, customers):
+        objs = [customer for _, customer in customers]
+        if self.ignore_conflicts:
+            # Rows lost to a concurrent writer are skipped by the database;
+            # see which ones landed so the skipped ones are reported
+            Customer.objects.bulk_create(objs, ignore_conflicts=True)
+            landed = set(Customer.objects.filter(
+                code__in=[customer.code for customer in objs],
+            ).values_list(*UNIQUE_FIELDS))
+            for line_number, customer in customers:
+                if tuple(getattr(customer, field)
+                         for field in UNIQUE_FIELDS) in landed:
+                    self.result.imported += 1
+                else:
+                    self.reject(line_number, {'non_field_errors': [
+                        'Skipped, clashes with a customer added meanwhile']})
+            return
+
+        try:
+            with transaction.atomic():
+                Customer.objects.bulk_create(objs)
+            self.result.imported += len(objs)
+        except IntegrityError:
+            # Someone else inserted a clashing row since the pre-check;
+            # fall back to row by row so only that row is rejected
+            for line_number, customer in customers:
+                try:
+                    with transaction.atomic():
+                        customer.save(force_insert=True)
+                    self.result.imported += 1
+                except IntegrityError as e:
+                    self.reject(line_number, {'non_field_errors': [str(e)]})
@@ -0,0 +1,703 @@
+import asyncio
+import io
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator
+from unittest.mock import patch
+
+from celery.contrib.testing.worker import start_worker
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.test import AsyncClient
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment,
+    teardown_test_environment
+)
+from django.urls import reverse
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework import throttling
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+from rest_framework.test import APIClient
+
+from app import rollups
+from app.filters import search_customers
+from app.models.customers.models import Customer
+from app.models.notifications.models import Notification
+from app.models.orders.models import Order
+from app.models.rollups.models import CustomerOrderRollup, OrderRollup
+from app.pagination import OrderPagination
+from app.parsers import ORJSONParser
+from app.renderers import ORJSONRenderer
+from app.serializers import CustomerSerializer, OrderSerializer
+from app.throttling import UserRateThrottle
+from app.tasks.sms_service import reset_sms_client
+from app.tasks.tasks import send_order_notification
+from app.views.customers.views import CustomerListCreateView
+from app.views.orders.views import (
+    OrderBulkCreateView, OrderListCreateView, OrderStatsView, order_queryset
+)
+from ta_celery import app as celery_app
+
+
+class Command(BaseCommand):
+    help: str = ("Run a performance benchmark against a throwaway "
+                 "test database")
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument(
+            'scenario', choices=sorted(
+                name[len('bench_'):] for name in dir(self)
+                if name.startswith('bench_')))
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Requests (or rows) per run")
+        parser.add_argument('--sms-latency', type=float, default=0.2,
+                            help="Simulated SMS gateway latency in seconds")
+        parser.add_argument('--sms-error-rate', type=float, default=0.0,
+                            help="Share of recipients the simulated SMS "
+                            "gateway fails")
+        parser.add_argument('--rows', type=int, default=10000,
+                            help="Orders to seed for read benchmarks")
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help="Threads for concurrent benchmarks")
+        parser.add_argument('--timeout', type=float, default=300,
+                            help="Seconds to wait for notifications to "
+                            "be sent")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        # Keep Celery's broker and result backend in-process. Celery gives
+        # these environment variables precedence over Django settings.
+        os.environ['CELERY_BROKER_URL'] = 'memory://'
+        os.environ['CELERY_RESULT_BACKEND'] = 'cache+memory://'
+        setup_test_environment()
+        settings.DEBUG = False
+        if connection.vendor == 'sqlite':
+            # A file, with writes locking it up front, so threads such as
+            # a Celery worker's wait for each other instead of failing
+            # with "database is locked"
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), 'benchmark.sqlite3')
+            connection.settings_dict['OPTIONS']['transaction_mode'] = (
+                'IMMEDIATE')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+        try:
+            getattr(self, f"bench_{options['scenario']}")(**options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    # Helpers
+
+    def api_client(self) -> APIClient:
+        user = User.objects.create_user(username='benchmark',
+                                        password='benchmark')
+        application = Application.objects.create(
+            name='Benchmark', user=user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_CLIENT_CREDENTIALS)
+        token = AccessToken.objects.create(
+            user=user, application=application, token='benchmark-token',
+            scope='read write',
+            expires=timezone.now() + timedelta(hours=1))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.token}')
+        return client
+
+    def seed_orders(self, rows: int, customers: int = 100) -> None:
+        Customer.objects.bulk_create([
+            Customer(name=f'Customer {i}', phone_number=f'+2547{i:08d}',
+                     email=f'customer{i}@example.com', code=f'C{i:08d}',
+                     customer_id=f'C{i:08d}')
+            for i in range(customers)
+        ])
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+        statuses = Order.OrderStatus.values
+        for start in range(0, rows, 5000):
+            Order.objects.bulk_create([
+                Order(customer_id=customer_ids[i % len(customer_ids)],
+                      item=f'Item {i}', amount=(i % 1000) + 0.99,
+                      status=statuses[i % len(statuses)])
+                for i in range(start, min(rows, start + 5000))
+            ])
+
+    @contextmanager
+    def fake_sms_gateway(self, **options: Any) -> Iterator[None]:
+        """Send SMS through FakeSMSGateway with the options' latency."""
+        reset_sms_client()
+        try:
+            with override_settings(
+                    SMS_BACKEND='app.tasks.sms_service.FakeSMSGateway',
+                    SMS_FAKE_LATENCY=options['sms_latency'],
+                    SMS_FAKE_ERROR_RATE=options['sms_error_rate']):
+                yield
+        finally:
+            reset_sms_client()
+
+    def wait_for_notifications(self, order_ids: list[Any],
+                               timeout: float) -> int:
+        """
+        Wait until the orders' notifications are sent or failed, for at
+        most `timeout` seconds, and report any still unsent.
+        """
+        pending = Notification.objects.filter(
+            order_id__in=order_ids,
+            status__in=[Notification.NotificationStatus.QUEUED,
+                        Notification.NotificationStatus.SENDING])
+        deadline = time.monotonic() + timeout
+        while (unsent := pending.count()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if unsent:
+            self.stdout.write(
+                msg=f"{unsent} notifications still unsent after "
+                f"{timeout:.0f}s",
+                style_func=self.style.WARNING)
+        return unsent
+
+    def measure(self, func: Callable[[int], Any], runs: int) -> list[float]:
+        samples = []
+        for i in range(runs):
+            start = time.perf_counter()
+            func(i)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def report(self, label: str, samples: list[float]) -> None:
+        ordered = sorted(samples)
+
+        def pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+        self.stdout.write(
+            f"{label:<28} n={len(samples):<6} "
+            f"mean={statistics.mean(samples) * 1000:8.2f}ms "
+            f"p50={pct(0.50) * 1000:8.2f}ms "
+            f"p99={pct(0.99) * 1000:8.2f}ms "
+            f"rps={len(samples) / sum(samples):8.1f}"
+        )
+
+    # Scenarios
+
+    def bench_order_create(self, **options: Any) -> None:
+        """
+        POST /api/v1/orders/ with the SMS sent inline (eager Celery, the
+        old behaviour) versus queued through an in-memory broker.
+        """
+        client = self.api_client()
+        Customer.objects.create(name='Bench', phone_number='+254722000001',
+                                email='bench@example.com', code='BENCH',
+                                customer_id='BENCH')
+        url = reverse('order-list-create')
+
+        def post(i: int) -> None:
+            response = client.post(url, {
+                'customer_code': 'BENCH', 'item': f'Item {i}',
+                'amount': '100.00', 'status': 'pending'}, format='json')
+            assert response.status_code == 201, response.content
+
+        self.stdout.write(
+            f"SMS gateway latency: {options['sms_latency'] * 1000:.0f}ms")
+        with CaptureQueriesContext(connection) as queries:
+            post(-1)
+        self.stdout.write(f"Queries per POST: {len(queries)}")
+        with patch.object(OrderListCreateView, 'throttle_classes', []), \
+                self.fake_sms_gateway(**options):
+            for label, eager in (('inline (eager celery)', True),
+                                 ('queued (memory broker)', False)):
+                celery_app.conf.CELERY_TASK_ALWAYS_EAGER = eager
+                self.report(label, self.measure(post, options['requests']))
+
+    def bench_order_bulk(self, **options: Any) -> None:
+        """
+        Orders per second through one POST per order versus the bulk
+        endpoint, with notifications queued to an in-memory broker.
+        """
+        client = self.api_client()
+        Customer.objects.create(name='Bench', phone_number='+254722000001',
+                                email='bench@example.com', code='BENCH',
+                                customer_id='BENCH')
+        count = options['requests']
+        orders = [{'customer_code': 'BENCH', 'item': f'Item {i}',
+                   'amount': '100.00', 'status': 'pending'}
+                  for i in range(count)]
+        chunk = settings.ORDER_BULK_MAX_ITEMS
+
+        def post_single(i: int) -> None:
+            response = client.post(reverse('order-list-create'), orders[i],
+                                   format='json')
+            assert response.status_code == 201, response.content
+
+        def post_bulk(i: int) -> None:
+            response = client.post(reverse('order-bulk-create'),
+                                   orders[i * chunk:(i + 1) * chunk],
+                                   format='json')
+            assert response.status_code == 201, response.content
+
+        with patch.object(OrderListCreateView, 'throttle_classes', []), \
+                patch.object(OrderBulkCreateView, 'throttle_classes', []):
+            for label, func, runs in (
+                    ('single POST per order', post_single, count),
+                    ('bulk POST', post_bulk, -(-count // chunk))):
+                samples = self.measure(func, runs)
+                self.report(label, samples)
+                self.stdout.write(
+                    f"{'':<28} orders/s={count / sum(samples):10.1f}")
+
+    def bench_pagination(self, **options: Any) -> None:
+        """
+        Latency of the first and the deepest pages of GET /api/v1/orders/
+        in cursor mode versus ?page= mode.
+        """
+        client = self.api_client()
+        self.seed_orders(options['rows'])
+        url = reverse('order-list-create')
+
+        with patch.object(OrderListCreateView, 'throttle_classes', []):
+            cursor_samples = []
+            next_url = url
+            while next_url:
+                start = time.perf_counter()
+                response = client.get(next_url)
+                cursor_samples.append(time.perf_counter() - start)
+                next_url = response.data['next']
+
+            pages = len(cursor_samples)
+            depth = min(10, pages)
+            deep = range(pages - depth + 1, pages + 1)
+
+            def get_page(page: int) -> None:
+                response = client.get(url, {'page': page})
+                assert response.status_code == 200, response.content
+
+            self.report('cursor, first pages', cursor_samples[:depth])
+            self.report('cursor, deepest pages', cursor_samples[-depth:])
+            self.report('page number, first pages',
+                        self.measure(lambda i: get_page(i + 1), depth))
+            self.report('page number, deepest pages',
+                        self.measure(lambda i: get_page(deep[i]), depth))
+
+    def bench_auth(self, **options: Any) -> None:
+        """
+        Queries and latency of an authenticated GET /api/v1/customers/
+        with the access token cache cold versus warm.
+        """
+        client = self.api_client()
+        url = reverse('customer-list-create')
+
+        def get(i: int) -> None:
+            response = client.get(url)
+            assert response.status_code == 200, response.content
+
+        def get_cold(i: int) -> None:
+            cache.clear()
+            get(i)
+
+        with patch.object(CustomerListCreateView, 'throttle_classes', []):
+            for label, func in (('token cache cold', get_cold),
+                                ('token cache warm', get)):
+                with CaptureQueriesContext(connection) as queries:
+                    func(-1)
+                tokens = sum('oauth2_provider_accesstoken' in query['sql']
+                             for query in queries)
+                self.stdout.write(f"{label:<28} queries/request="
+                                  f"{len(queries)} (token lookups={tokens})")
+                self.report(label, self.measure(func, options['requests']))
+
+    def bench_throttle(self, **options: Any) -> None:
+        """
+        Many threads calling one user's throttle at once: how many calls
+        each throttle lets through against the limit it was given.
+        """
+        limit = options['requests']
+        calls = limit * 5
+        request = SimpleNamespace(
+            user=SimpleNamespace(is_authenticated=True, pk=1))
+        self.stdout.write(f"Limit {limit}/hour, {calls} calls from "
+                          f"{options['concurrency']} threads, cache "
+                          f"{settings.CACHES['default']['BACKEND']}")
+
+        for label, base in (('drf timestamp list',
+                             throttling.UserRateThrottle),
+                            ('token bucket', UserRateThrottle)):
+            throttle_class = type('BenchThrottle', (base,),
+                                  {'rate': f'{limit}/hour'})
+            cache.clear()
+
+            def check(i: int) -> bool:
+                return throttle_class().allow_request(request, None)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                allowed = sum(pool.map(check, range(calls)))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{label:<28} allowed={allowed:<6} "
+                              f"over limit={max(0, allowed - limit):<6} "
+                              f"checks/s={calls / elapsed:10.1f}")
+
+    def bench_asgi(self, **options: Any) -> None:
+        """
+        Sync versus async views through Django's ASGI handler, the way
+        daphne or uvicorn would call them, with --concurrency requests in
+        flight at once.
+        """
+        self.api_client()
+        self.seed_orders(min(options['rows'], 1000))
+        customer = Customer.objects.first()
+        client = AsyncClient()
+        headers = {'Authorization': 'Bearer benchmark-token'}
+        concurrency = options['concurrency']
+        count = options['requests']
+
+        async def run(method: str, url: str,
+                      payload: Any = None) -> tuple[list[float], float]:
+            samples = []
+            queue = iter(range(count))
+
+            async def worker() -> None:
+                for i in queue:
+                    start = time.perf_counter()
+                    if method == 'post':
+                        response = await client.post(
+                            url, payload, content_type='application/json',
+                            headers=headers)
+                    else:
+                        response = await client.get(url, headers=headers)
+                    samples.append(time.perf_counter() - start)
+                    assert response.status_code < 300, response.content
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return samples, time.perf_counter() - start
+
+        order = {'customer_code': customer.code, 'item': 'Item',
+                 'amount': '100.00', 'status': 'pending'}
+        cases = (
+            ('customer list', 'get', 'customer-list-create', (), None),
+            ('customer detail', 'get', 'customer-detail', (customer.id,),
+             None),
+            ('order create', 'post', 'order-list-create', (), order),
+        )
+        self.stdout.write(f"{count} requests per case, concurrency "
+                          f"{concurrency}")
+        with patch.object(APIView, 'throttle_classes', []):
+            for label, method, name, args, payload in cases:
+                for stack, prefix in (('sync', ''), ('async', 'async-')):
+                    samples, elapsed = asyncio.run(run(
+                        method, reverse(f'{prefix}{name}', args=args),
+                        payload))
+                    self.report(f'{label} ({stack})', samples)
+                    self.stdout.write(
+                        f"{'':<28} wall-clock rps={count / elapsed:10.1f}")
+
+    def bench_order_filters(self, **options: Any) -> None:
+        """
+        Query plan and latency of GET /api/v1/orders/ for each filter over
+        a generated dataset of --rows orders.
+        """
+        client = self.api_client()
+        call_command('generate_dataset',
+                     customers=max(1, options['rows'] // 100),
+                     orders=options['rows'], stdout=io.StringIO())
+        customer = Customer.objects.order_by('id').first()
+        month_ago = timezone.now() - timedelta(days=30)
+        cases = (
+            ('customer', {'customer': customer.id},
+             {'customer_id': customer.id}),
+            ('customer_code', {'customer_code': customer.code},
+             {'customer__code': customer.code}),
+            ('status=pending', {'status': 'pending'}, {'status': 'pending'}),
+            ('status=completed', {'status': 'completed'},
+             {'status': 'completed'}),
+            ('last 30 days', {'order_date_after': month_ago.isoformat()},
+             {'order_date__gte': month_ago}),
+            ('amount range', {'amount_min': '100', 'amount_max': '110'},
+             {'amount__gte': 100, 'amount__lte': 110}),
+        )
+        url = reverse('order-list-create')
+        with patch.object(OrderListCreateView, 'throttle_classes', []):
+            for label, params, filters in cases:
+                plan = (order_queryset.filter(**filters)
+                        .order_by('-order_date', 'id')[:20].explain())
+                self.stdout.write(f"{label}:\n  "
+                                  + plan.replace('\n', '\n  '))
+
+                def get(i: int) -> None:
+                    response = client.get(url, params)
+                    assert response.status_code == 200, response.content
+
+                self.report(label, self.measure(get, options['requests']))
+
+    def bench_customer_search(self, **options: Any) -> None:
+        """
+        Query plan and latency of GET /api/v1/customers/?search= for
+        phone, email and name terms over --rows generated customers.
+        """
+        client = self.api_client()
+        call_command('generate_dataset', customers=options['rows'],
+                     orders=0, stdout=io.StringIO())
+        cases = (
+            ('local phone prefix', '07000001'),
+            ('international phone prefix', '+25470000'),
+            ('email prefix', 'customer1234'),
+            ('name', 'Wanjiru'),
+            ('misspelt name', 'Wanjru Kamua'),
+        )
+        url = reverse('customer-list-create')
+        with patch.object(CustomerListCreateView, 'throttle_classes', []):
+            for label, term in cases:
+                plan = (search_customers(Customer.objects.all(), term)
+                        [:20].explain())
+                self.stdout.write(f"{label} ({term}):\n  "
+                                  + plan.replace('\n', '\n  '))
+
+                def get(i: int) -> None:
+                    response = client.get(url, {'search': term})
+                    assert response.status_code == 200, response.content
+
+                self.report(label, self.measure(get, options['requests']))
+
+    def bench_order_stats(self, **options: Any) -> None:
+        """
+        GET /api/v1/orders/stats/ over a year of --rows generated orders,
+        against computing the same stats by aggregating the orders.
+        """
+        client = self.api_client()
+        call_command('generate_dataset',
+                     customers=max(1, options['rows'] // 100),
+                     orders=options['rows'], stdout=io.StringIO())
+        date_to = timezone.localdate()
+        date_from = date_to - timedelta(days=364)
+        params = {'date_from': date_from.isoformat(),
+                  'date_to': date_to.isoformat()}
+        self.stdout.write(
+            f"Rollup rows: {OrderRollup.objects.count()} daily, "
+            f"{CustomerOrderRollup.objects.count()} per customer; "
+            f"orders: {Order.objects.count()}")
+
+        def aggregate(i: int) -> None:
+            orders = Order.objects.filter(
+                order_date__gte=rollups.start_of_day(date_from))
+            earning = orders.exclude(status=Order.OrderStatus.CANCELLED)
+            totals = {'orders': Count('id'), 'revenue': Sum('amount')}
+            list(orders.values('status').annotate(**totals))
+            list(earning.annotate(day=TruncDate('order_date'))
+                 .values('day').annotate(**totals).order_by('day'))
+            list(earning.values('customer').annotate(**totals)
+                 .order_by('-revenue')[:10])
+
+        def get(i: int) -> None:
+            response = client.get(reverse('order-stats'), params)
+            assert response.status_code == 200, response.content
+
+        self.report('aggregate orders', self.measure(
+            aggregate, options['requests']))
+        with patch.object(OrderStatsView, 'throttle_classes', []):
+            self.report('stats from rollups', self.measure(
+                get, options['requests']))
+
+    def bench_sparse_fields(self, **options: Any) -> None:
+        """
+        Rows serialized per second by GET /api/v1/orders/ with 100-row
+        pages: full representation, ?fields=id,status,amount through the
+        values() read path, and the same with ?expand=customer.
+        """
+        client = self.api_client()
+        self.seed_orders(options['rows'])
+        page_size = 100
+        cases = (
+            ('full', {}),
+            ('fields=id,status,amount', {'fields': 'id,status,amount'}),
+            ('fields + expand=customer', {'fields': 'id,status,amount',
+                                          'expand': 'customer'}),
+        )
+        url = reverse('order-list-create')
+        with patch.object(OrderListCreateView, 'throttle_classes', []), \
+                patch.object(OrderPagination, 'page_size', page_size):
+            for label, params in cases:
+                def get(i: int) -> None:
+                    response = client.get(url, params)
+                    assert response.status_code == 200, response.content
+
+                samples = self.measure(get, options['requests'])
+                self.report(label, samples)
+                rate = page_size * len(samples) / sum(samples)
+                self.stdout.write(f"  rows/s: {rate:.0f}")
+
+    def bench_json(self, **options: Any) -> None:
+        """
+        Rendering 20-row order and customer pages, and parsing order
+        bodies, with DRF's stdlib JSON renderer and parser against the
+        orjson ones. Rendered bytes and parsed data must be identical.
+        """
+        self.seed_orders(options['rows'])
+        payloads = {
+            'order page': {'results': OrderSerializer(
+                order_queryset[:20], many=True).data},
+            'customer page': {'results': CustomerSerializer(
+                Customer.objects.select_related('summary')[:20], many=True,
+                context={'include_summary': True}).data},
+            # UUIDs, Decimals and datetimes as the ORM returns them
+            'order rows': list(Order.objects.values()[:20]),
+        }
+        for label, data in payloads.items():
+            rendered = JSONRenderer().render(data)
+            assert ORJSONRenderer().render(data) == rendered, label
+            self.stdout.write(f"{label}: {len(rendered)} bytes")
+            for name, renderer in (('json', JSONRenderer()),
+                                   ('orjson', ORJSONRenderer())):
+                self.report(
+                    f"{label}, {name}",
+                    self.measure(lambda i: renderer.render(data),
+                                 options['requests']))
+
+        order = {'customer_code': 'C00000001', 'item': 'Laptop',
+                 'amount': '1299.99', 'status': 'pending'}
+        bodies = {'order': order, 'bulk of 100': [order] * 100}
+        for label, data in bodies.items():
+            body = JSONRenderer().render(data)
+            assert (ORJSONParser().parse(io.BytesIO(body))
+                    == JSONParser().parse(io.BytesIO(body))), label
+            for name, parser in (('json', JSONParser()),
+                                 ('orjson', ORJSONParser())):
+                self.report(
+                    f"parse {label}, {name}",
+                    self.measure(lambda i: parser.parse(io.BytesIO(body)),
+                                 options['requests']))
+
+    def bench_sms_workers(self, **options: Any) -> None:
+        """
+        Notifications per second from a Celery worker draining the
+        notifications queue: one task at a time, as a prefork process
+        runs them, against the notifications profile's thread pool. Both
+        prefetch every task; the in-memory broker only tops up a
+        worker's prefetch every 2 seconds, so it can't measure prefetch.
+        """
+        count = options['requests']
+        self.seed_orders(count)
+        order_ids = list(Order.objects.values_list('id', flat=True))
+        Notification.objects.bulk_create([
+            Notification(order_id=order_id, phone_number='+254722000001',
+                         message=f'Order {order_id} received')
+            for order_id in order_ids
+        ])
+        profile = settings.WORKER_PROFILES['notifications']
+        # The gateway's quota is not what's being measured
+        celery_app.conf.worker_disable_rate_limits = True
+        celery_app.conf.worker_prefetch_multiplier = count
+
+        def drain(pool: str, concurrency: int) -> tuple[float, int]:
+            Notification.objects.update(
+                status=Notification.NotificationStatus.QUEUED, attempts=0)
+            for order_id in order_ids:
+                send_order_notification.delay(order_id)
+            start = time.perf_counter()
+            with start_worker(celery_app, pool=pool, concurrency=concurrency,
+                              queues=['notifications'],
+                              perform_ping_check=False):
+                unsent = self.wait_for_notifications(order_ids,
+                                                     options['timeout'])
+                return time.perf_counter() - start, unsent
+
+        self.stdout.write(
+            f"{count} notifications, SMS gateway latency: "
+            f"{options['sms_latency'] * 1000:.0f}ms")
+        with self.fake_sms_gateway(**options):
+            for label, pool, concurrency in (
+                    ('one at a time', 'solo', 1),
+                    (f"{profile['pool']} x{profile['concurrency']}",
+                     profile['pool'], profile['concurrency'])):
+                elapsed, unsent = drain(pool, concurrency)
+                self.stdout.write(
+                    f"{label:<28} {elapsed:8.2f}s "
+                    f"notifications/s={(count - unsent) / elapsed:8.1f}")
+
+    def bench_order_notifications(self, **options: Any) -> None:
+        """
+        Orders end to end: POST /api/v1/orders/, Celery, and the SMS
+        through the fake gateway. Celery is eager, sending inline, or a
+        notifications-profile worker behind an in-memory broker standing
+        in for Redis. Latency runs from the POST to the SMS being sent;
+        messages/s is over the whole run, POSTs included.
+        """
+        client = self.api_client()
+        Customer.objects.create(name='Bench', phone_number='+254722000001',
+                                email='bench@example.com', code='BENCH',
+                                customer_id='BENCH')
+        url = reverse('order-list-create')
+        count = options['requests']
+        profile = settings.WORKER_PROFILES['notifications']
+        celery_app.conf.worker_disable_rate_limits = True
+        celery_app.conf.worker_prefetch_multiplier = count
+        # Redis hands a waiting worker new tasks at once; the in-memory
+        # broker makes it poll, every second by default
+        celery_app.conf.broker_transport_options = {'polling_interval': 0.01}
+
+        def run(label: str, eager: bool) -> None:
+            celery_app.conf.CELERY_TASK_ALWAYS_EAGER = eager
+            worker = nullcontext() if eager else start_worker(
+                celery_app, pool=profile['pool'],
+                concurrency=profile['concurrency'],
+                queues=['notifications'], perform_ping_check=False)
+            posted = {}
+            start = time.perf_counter()
+            with worker:
+                for i in range(count):
+                    posted_at = timezone.now()
+                    response = client.post(url, {
+                        'customer_code': 'BENCH', 'item': f'Item {i}',
+                        'amount': '100.00', 'status': 'pending'},
+                        format='json')
+                    assert response.status_code == 201, response.content
+                    posted[response.data['id']] = posted_at
+                self.wait_for_notifications(list(posted),
+                                            options['timeout'])
+                elapsed = time.perf_counter() - start
+
+            sent = Notification.objects.filter(
+                order_id__in=posted,
+                status=Notification.NotificationStatus.SENT)
+            latencies = sorted(
+                (sent_at - posted[str(order_id)]).total_seconds()
+                for order_id, sent_at in sent.values_list('order_id',
+                                                          'sent_at'))
+            if not latencies:
+                self.stdout.write(f"{label:<28} nothing sent")
+                return
+
+            def pct(p: float) -> float:
+                return latencies[min(len(latencies) - 1,
+                                     int(len(latencies) * p))]
+
+            self.stdout.write(
+                f"{label:<28} sent={len(latencies)}/{count} "
+                f"p50={pct(0.50) * 1000:8.2f}ms "
+                f"p95={pct(0.95) * 1000:8.2f}ms "
+                f"p99={pct(0.99) * 1000:8.2f}ms "
+                f"messages/s={len(latencies) / elapsed:8.1f}")
+
+        self.stdout.write(
+            f"{count} orders, SMS gateway latency: "
+            f"{options['sms_latency'] * 1000:.0f}ms, error rate: "
+            f"{options['sms_error_rate']:.0%}")
+        with patch.object(OrderListCreateView, 'throttle_classes', []), \
+                self.fake_sms_gateway(**options):
+            for label, eager in (
+                    ('eager celery', True),
+                    (f"worker, {profile['pool']} x{profile['concurrency']}",
+                     False)):
+                run(label, eager)
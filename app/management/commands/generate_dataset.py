@@ -0,0 +1,102 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Iterator
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from app import rollups
+from app.models.customers.models import Customer, CustomerSummary
+from app.models.orders.models import Order
+
+FIRST_NAMES = ['Amina', 'Brian', 'Caroline', 'David', 'Esther', 'Faith',
+               'George', 'Halima', 'Ian', 'Joy', 'Kevin', 'Lucy', 'Mercy',
+               'Nelson', 'Otieno', 'Purity', 'Samuel', 'Wanjiru']
+LAST_NAMES = ['Achieng', 'Kamau', 'Kariuki', 'Kiprono', 'Mutua', 'Mwangi',
+              'Njoroge', 'Ochieng', 'Odhiambo', 'Otieno', 'Wambui',
+              'Wanjiku']
+ITEMS = ['Laptop', 'Phone', 'Tablet', 'Monitor', 'Keyboard', 'Mouse',
+         'Headphones', 'Printer', 'Router', 'Camera']
+# Most orders are long finished; pending ones are the small hot set
+STATUS_WEIGHTS = {
+    Order.OrderStatus.COMPLETED: 70,
+    Order.OrderStatus.PROCESSING: 15,
+    Order.OrderStatus.CANCELLED: 10,
+    Order.OrderStatus.PENDING: 5,
+}
+
+
+@contextmanager
+def explicit_order_dates() -> Iterator[None]:
+    # order_date is auto_now_add, which would stamp every row with now
+    field = Order._meta.get_field('order_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help: str = ("Generate customers and orders with a realistic spread of "
+                 "statuses, dates and amounts for benchmarks")
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365,
+                            help="Spread order dates over this many days")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        rng = random.Random(options['seed'])
+        batch_size: int = options['batch_size']
+
+        start = Customer.objects.count()
+        for offset in range(0, options['customers'], batch_size):
+            customers = Customer.objects.bulk_create([
+                Customer(
+                    name=(f'{rng.choice(FIRST_NAMES)} '
+                          f'{rng.choice(LAST_NAMES)}'),
+                    # Both formats customers give their numbers in
+                    phone_number=(f'07{i:08d}' if i % 2
+                                  else f'+2547{i:08d}'),
+                    email=f'customer{i}@example.com',
+                    code=f'GEN{i:08d}', customer_id=f'GEN{i:08d}')
+                for i in range(start + offset, start + min(
+                    options['customers'], offset + batch_size))
+            ])
+            CustomerSummary.objects.bulk_create(
+                CustomerSummary(customer=customer) for customer in customers)
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+
+        now = timezone.now()
+        period = timedelta(days=options['days']).total_seconds()
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+        with explicit_order_dates():
+            for offset in range(0, options['orders'], batch_size):
+                count = min(batch_size, options['orders'] - offset)
+                orders = Order.objects.bulk_create([
+                    Order(customer_id=rng.choice(customer_ids),
+                          item=rng.choice(ITEMS),
+                          amount=Decimal(rng.randint(100, 20000000)) / 100,
+                          status=status,
+                          order_date=now - timedelta(
+                              seconds=rng.random() * period))
+                    for status in rng.choices(statuses, weights, k=count)
+                ])
+                rollups.record_created(orders)
+                self.stdout.write(f"Orders: {offset + count}")
+
+        # Fresh planner statistics, so EXPLAIN reflects the new data
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(
+            msg=(f"Generated {options['customers']} customers and "
+                 f"{options['orders']} orders"),
+            style_func=self.style.SUCCESS)
@@ -0,0 +1,64 @@
+import json
+import sys
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.importers import (
+    FORMATS, CustomerImporter, ImportResult, detect_format, read_rows
+)
+
+
+class Command(BaseCommand):
+    help: str = "Import customers from a CSV or JSON Lines file"
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('path', help="File to import, or - for stdin")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int,
+                            help="Rows checked and inserted per batch")
+        parser.add_argument('--ignore-conflicts', action='store_true',
+                            help="Skip rows that clash with concurrent "
+                            "inserts instead of retrying them one by one")
+        parser.add_argument('--rejects',
+                            help="Write rejected rows as JSON Lines here "
+                            "instead of stderr")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        path: str = options['path']
+        file_format = options['format'] or detect_format(path)
+        if not file_format:
+            raise CommandError("Can't tell the file format, use --format")
+
+        rejects = (open(options['rejects'], 'w') if options['rejects']
+                   else sys.stderr)
+
+        def on_reject(line_number: int, errors: dict) -> None:
+            rejects.write(json.dumps({'line': line_number,
+                                      'errors': errors}) + '\n')
+
+        def on_progress(result: ImportResult) -> None:
+            self.stdout.write(
+                f"Processed {result.processed}: imported "
+                f"{result.imported}, rejected {result.rejected}")
+
+        importer = CustomerImporter(
+            chunk_size=options['chunk_size'],
+            ignore_conflicts=options['ignore_conflicts'],
+            on_reject=on_reject, on_progress=on_progress)
+        stream = (sys.stdin if path == '-' else
+                  open(path, newline='', encoding='utf-8-sig'))
+        try:
+            result = importer.run(read_rows(stream, file_format))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects is not sys.stderr:
+                rejects.close()
+
+        self.stdout.write(
+            msg=f"Imported {result.imported} customers, rejected "
+            f"{result.rejected} of {result.processed} rows.",
+            style_func=self.style.SUCCESS
+        )
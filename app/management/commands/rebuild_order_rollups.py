@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from app import rollups
+from app.models.orders.models import Order
+from app.models.rollups.models import CustomerOrderRollup, OrderRollup
+
+
+class Command(BaseCommand):
+    help: str = ("Backfill or rebuild the order rollups from the orders, "
+                 "a few days at a time")
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help="First day to rebuild (YYYY-MM-DD), by "
+                            "default the first day with orders or rollups")
+        parser.add_argument('--until', type=date.fromisoformat,
+                            help="Last day to rebuild, by default the last "
+                            "day with orders or rollups")
+        parser.add_argument('--chunk-days', type=int, default=7,
+                            help="Days rebuilt per transaction")
+
+    def bounds(self) -> tuple[date | None, date | None]:
+        orders = Order.objects.aggregate(first=Min('order_date'),
+                                         last=Max('order_date'))
+        days = [timezone.localdate(value) for value in orders.values()
+                if value is not None]
+        for model in (OrderRollup, CustomerOrderRollup):
+            days += [value for value in model.objects.aggregate(
+                first=Min('day'), last=Max('day')).values()
+                if value is not None]
+        if not days:
+            return None, None
+        return min(days), max(days)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+        first, last = self.bounds()
+        since = options['since'] or first
+        until = options['until'] or last
+        if since is None or until is None:
+            self.stdout.write("No orders to roll up")
+            return
+
+        start = since
+        while start <= until:
+            end = min(start + timedelta(days=options['chunk_days'] - 1),
+                      until)
+            # Orders written meanwhile adjust the rows rebuilt here as
+            # usual once this commits
+            with transaction.atomic():
+                for model in (OrderRollup, CustomerOrderRollup):
+                    model.objects.filter(day__gte=start,
+                                         day__lte=end).delete()
+                rollups.apply(rollups.aggregate_orders(start, end))
+            self.stdout.write(f"Rebuilt {start} to {end}")
+            start = end + timedelta(days=1)
+
+        self.stdout.write(
+            msg=f"Rebuilt order rollups from {since} to {until}",
+            style_func=self.style.SUCCESS)
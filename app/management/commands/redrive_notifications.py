@@ -0,0 +1,57 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from app.models.notifications.models import Notification
+from app.tasks.outbox import dispatch_notification_batch
+
+NotificationStatus = Notification.NotificationStatus
+
+
+class Command(BaseCommand):
+    help: str = ("Send dead notifications again, a batch at a time, with "
+                 "a fresh set of attempts")
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.NOTIFICATION_OUTBOX_BATCH_SIZE,
+                            help="Notifications requeued per transaction "
+                            "and batch task")
+        parser.add_argument('--limit', type=int,
+                            help="Requeue at most this many, oldest first")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        batch_size: int = options['batch_size']
+        limit: int | None = options['limit']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        # Only rows dead now, however quickly a redriven one dies again
+        dead = Notification.objects.filter(status=NotificationStatus.DEAD)
+        max_id = dead.order_by('-id').values_list('id', flat=True).first()
+        redriven = 0
+        after_id = 0
+        while max_id is not None and (limit is None or redriven < limit):
+            size = batch_size if limit is None else min(batch_size,
+                                                        limit - redriven)
+            with transaction.atomic():
+                notification_ids = list(
+                    dead.filter(id__gt=after_id, id__lte=max_id)
+                    .select_for_update(skip_locked=True).order_by('id')
+                    .values_list('id', flat=True)[:size])
+                if not notification_ids:
+                    break
+                Notification.objects.filter(id__in=notification_ids).update(
+                    status=NotificationStatus.QUEUED, attempts=0,
+                    next_attempt_at=None, updated_at=timezone.now())
+                transaction.on_commit(dispatch_notification_batch)
+            redriven += len(notification_ids)
+            after_id = notification_ids[-1]
+            self.stdout.write(f"Requeued {redriven} notifications")
+
+        self.stdout.write(
+            msg=f"Redrove {redriven} dead notifications",
+            style_func=self.style.SUCCESS)
@@ -0,0 +1,35 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ta_celery import app as celery_app
+
+
+class Command(BaseCommand):
+    help: str = ("Start a Celery worker for one queue with its profile "
+                 "from WORKER_PROFILES")
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('queue', choices=sorted(settings.WORKER_PROFILES))
+        parser.add_argument('--loglevel', default='INFO')
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Print the worker's arguments and exit")
+
+    def worker_argv(self, queue: str, loglevel: str) -> list[str]:
+        profile = settings.WORKER_PROFILES[queue]
+        return [
+            'worker', '--queues', queue, '--hostname', f'{queue}@%h',
+            '--pool', profile['pool'],
+            '--concurrency', str(profile['concurrency']),
+            '--prefetch-multiplier', str(profile['prefetch_multiplier']),
+            '--loglevel', loglevel,
+        ]
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        argv = self.worker_argv(options['queue'], options['loglevel'])
+        if options['dry_run']:
+            self.stdout.write(msg=' '.join(argv),
+                              style_func=self.style.SUCCESS)
+            return
+        celery_app.worker_main(argv)
@@ -0,0 +1,54 @@
+"""
+Lightweight in-process metrics.
+
+Counters and timings are kept per process and read with `snapshot()`, which
+is what the periodic log lines and the benchmark command report. They are
+not meant to replace a metrics backend, only to make hot paths observable
+without one.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import threading
+import time
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = defaultdict(lambda: {'count': 0, 'total': 0.0, 'max': 0.0})
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds):
+    with _lock:
+        timing = _timings[name]
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot():
+    with _lock:
+        timings = {
+            name: {**timing, 'mean': (timing['total'] / timing['count']
+                                      if timing['count'] else 0.0)}
+            for name, timing in _timings.items()
+        }
+        return {'counters': dict(_counters), 'timings': timings}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
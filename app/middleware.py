@@ -0,0 +1,55 @@
+"""
+Async-capable versions of third-party middleware.
+
+Django runs a sync-only middleware in a worker thread under ASGI, which
+would put every request, async views included, back on a thread. These
+subclasses behave exactly like the originals but also run natively on
+the event loop.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth import aauthenticate
+from django.utils.cache import patch_vary_headers
+from oauth2_provider import middleware as oauth2_middleware
+from whitenoise import middleware as whitenoise_middleware
+
+
+class AsyncCapableMixin:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+
+class OAuth2TokenMiddleware(AsyncCapableMixin,
+                            oauth2_middleware.OAuth2TokenMiddleware):
+    async def __acall__(self, request):
+        if request.META.get('HTTP_AUTHORIZATION', '').startswith('Bearer'):
+            if not hasattr(request, 'user') or request.user.is_anonymous:
+                user = await aauthenticate(request=request)
+                if user:
+                    request.user = request._cached_user = user
+
+        response = await self.get_response(request)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class WhiteNoiseMiddleware(AsyncCapableMixin,
+                           whitenoise_middleware.WhiteNoiseMiddleware):
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_notification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['-created_at', 'id'], name='app_custome_created_9c5a95_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-order_date', 'id'], name='app_order_order_d_319edc_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:37
+
+import django.db.models.functions.text
+import django.db.models.lookups
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# GIN trigram indexes for customer search, see app.filters. Each matches
+# the SQL Django emits for its lookup: name <% (trigram word similarity),
+# UPPER(email) LIKE (istartswith) and phone_normalized LIKE (startswith).
+SEARCH_INDEXES = {
+    'customer_name_trgm_idx': 'name gin_trgm_ops',
+    'customer_email_trgm_idx': '(UPPER(email::text)) gin_trgm_ops',
+    'customer_phone_trgm_idx': 'phone_normalized gin_trgm_ops',
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in SEARCH_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON app_customer '
+            f'USING gin ({column})')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_order_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(phone_number__startswith='+', then=django.db.models.functions.text.Substr('phone_number', 2)), models.When(phone_number__startswith='0', then=django.db.models.functions.text.Concat(models.Value('254'), django.db.models.functions.text.Substr('phone_number', 2))), models.When(django.db.models.lookups.Exact(django.db.models.functions.text.Length('phone_number'), 9), then=django.db.models.functions.text.Concat(models.Value('254'), 'phone_number')), default=models.F('phone_number')), output_field=models.CharField(max_length=255)),
+        ),
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
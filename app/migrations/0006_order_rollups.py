@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_customer_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=255)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'verbose_name': 'Order rollup',
+                'verbose_name_plural': 'Order rollups',
+                'ordering': ['day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='order_rollup_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=255)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('customer', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='order_rollups', to='app.customer')),
+            ],
+            options={
+                'verbose_name': 'Customer order rollup',
+                'verbose_name_plural': 'Customer order rollups',
+                'ordering': ['day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status', 'customer'), name='customer_order_rollup_unique')],
+            },
+        ),
+    ]
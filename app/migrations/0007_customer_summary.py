@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+CHUNK_SIZE = 1000
+
+
+def backfill_summaries(apps, schema_editor):
+    Customer = apps.get_model('app', 'Customer')
+    CustomerSummary = apps.get_model('app', 'CustomerSummary')
+    Order = apps.get_model('app', 'Order')
+    last_id = 0
+    while True:
+        customer_ids = list(
+            Customer.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', flat=True)[:CHUNK_SIZE])
+        if not customer_ids:
+            break
+        totals = {
+            row['customer_id']: row for row in
+            Order.objects.filter(customer_id__in=customer_ids)
+            .values('customer_id')
+            .annotate(order_count=Count('id'),
+                      total_spent=Sum('amount',
+                                      filter=~Q(status='cancelled')),
+                      last_order_date=Max('order_date'))
+            .order_by()
+        }
+        summaries = []
+        for customer_id in customer_ids:
+            row = totals.get(customer_id, {})
+            summaries.append(CustomerSummary(
+                customer_id=customer_id,
+                order_count=row.get('order_count', 0),
+                total_spent=row.get('total_spent') or 0,
+                last_order_date=row.get('last_order_date')))
+        CustomerSummary.objects.bulk_create(summaries)
+        last_id = customer_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_order_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSummary',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='app.customer')),
+                ('order_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('last_order_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Customer summary',
+                'verbose_name_plural': 'Customer summaries',
+            },
+        ),
+        migrations.RunPython(backfill_summaries,
+                             migrations.RunPython.noop),
+    ]
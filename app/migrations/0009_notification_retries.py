@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+def failed_to_dead(apps, schema_editor):
+    # `failed` used to mean out of attempts, which is now `dead`
+    Notification = apps.get_model('app', 'Notification')
+    Notification.objects.filter(status='failed').update(status='dead')
+
+
+def dead_to_failed(apps, schema_editor):
+    Notification = apps.get_model('app', 'Notification')
+    Notification.objects.filter(status='dead').update(status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed'), ('dead', 'Dead')], default='queued', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='app_notific_status_b4c75f_idx'),
+        ),
+        migrations.RunPython(failed_to_dead, dead_to_failed),
+    ]
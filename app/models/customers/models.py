@@ -1,6 +1,32 @@
+import re
+
 from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Concat, Length, Substr
+from django.db.models.lookups import Exact
 from django.core.validators import RegexValidator
 
+# Kenyan numbers are stored as 07XXXXXXXX, 7XXXXXXXX and +2547XXXXXXXX;
+# all normalize to 2547XXXXXXXX, the number SMS are sent to
+LOCAL_PREFIX = '0'
+COUNTRY_CODE = '254'
+NATIONAL_LENGTH = 9
+
+
+def normalize_phone(value: str) -> str:
+    """
+    Python twin of Customer.phone_normalized, for search terms and SMS
+    recipients.
+    """
+    digits = re.sub(r'\D', '', value)
+    if value.lstrip().startswith('+'):
+        return digits
+    if digits.startswith(LOCAL_PREFIX):
+        return COUNTRY_CODE + digits[len(LOCAL_PREFIX):]
+    if len(digits) == NATIONAL_LENGTH:
+        return COUNTRY_CODE + digits
+    return digits
+
 
 class Customer(models.Model):
     name = models.CharField(max_length=255)
@@ -14,6 +40,18 @@ class Customer(models.Model):
     email = models.EmailField(max_length=255, unique=True)
     customer_id = models.CharField(max_length=255, unique=True)
     code = models.CharField(max_length=255, unique=True)
+    # Computed by the database, so bulk inserts fill it in too
+    phone_normalized = models.GeneratedField(
+        expression=Case(
+            When(phone_number__startswith='+',
+                 then=Substr('phone_number', 2)),
+            When(phone_number__startswith=LOCAL_PREFIX,
+                 then=Concat(Value(COUNTRY_CODE), Substr('phone_number', 2))),
+            When(Exact(Length('phone_number'), NATIONAL_LENGTH),
+                 then=Concat(Value(COUNTRY_CODE), 'phone_number')),
+            default=F('phone_number')),
+        output_field=models.CharField(max_length=255),
+        db_persist=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -28,4 +66,27 @@ class Customer(models.Model):
         indexes = [
             models.Index(fields=['phone_number']),
             models.Index(fields=['email']),
+            # Search indexes are PostgreSQL only, see migration 0005
+            # Keyset pagination order, see app.pagination.KeysetPagination
+            models.Index(fields=['-created_at', 'id']),
         ]
+
+
+class CustomerSummary(models.Model):
+    """
+    A customer's lifetime order count, spend (cancelled orders excluded)
+    and latest order, kept up to date by app.rollups as orders change.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE,
+                                    primary_key=True, related_name='summary')
+    order_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=16, decimal_places=2,
+                                      default=0)
+    last_order_date = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f'Customer {self.customer_id}: {self.order_count} orders'
+
+    class Meta:
+        verbose_name = 'Customer summary'
+        verbose_name_plural = 'Customer summaries'
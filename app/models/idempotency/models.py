@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """
+    An `Idempotency-Key` a client sent with a create request, see
+    app/idempotency.py. While the request runs the row is the lock that
+    keeps its duplicates out; once it has succeeded the row holds the
+    response to replay to them, until `expires_at`.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,
+                             related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # SHA-256 of the request's method, path and body
+    fingerprint = models.CharField(max_length=64)
+    # Null while the request is running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f'{self.key} - user {self.user_id} - {self.status_code}'
+
+    class Meta:
+        verbose_name = 'Idempotency key'
+        verbose_name_plural = 'Idempotency keys'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'],
+                                    name='idempotency_key_unique'),
+        ]
@@ -0,0 +1,52 @@
+from django.db import models
+
+from app.models.orders.models import Order
+
+
+class Notification(models.Model):
+    """
+    Outbox row for an SMS notification.
+
+    Rows are written in the same transaction as the order they belong to,
+    so a notification survives even if the broker is unreachable when the
+    order is committed; the outbox drain task picks up anything that was
+    never dispatched.
+
+    A send the gateway fails leaves the row `failed` until
+    `next_attempt_at`, when it is retried. Rows that run out of attempts,
+    or that the gateway rejects for good, are `dead`: the dead-letter
+    queue, sent again only by the `redrive_notifications` command.
+    """
+    class NotificationStatus(models.TextChoices):
+        QUEUED = 'queued'
+        SENDING = 'sending'
+        SENT = 'sent'
+        FAILED = 'failed'
+        DEAD = 'dead'
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE,
+                              related_name='notifications')
+    phone_number = models.CharField(max_length=255)
+    message = models.TextField()
+    status = models.CharField(max_length=255,
+                              choices=NotificationStatus.choices,
+                              default=NotificationStatus.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return (f'Notification {self.id} - order {self.order_id} - '
+                f'{self.status}')
+
+    class Meta:
+        verbose_name = 'Notification'
+        verbose_name_plural = 'Notifications'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 import uuid
 
 from app.models.customers.models import Customer
@@ -24,10 +24,33 @@ class Order(models.Model):
     def __str__(self) -> str:
         return f'Order {self.id} - for {self.customer.name} - {self.status}'
 
+    def save(self, *args, **kwargs):
+        # The rollup signals lock the row it replaces in pre_save and
+        # apply the difference in post_save, so both hold one transaction;
+        # an error marks it for rollback, as Django's own save does
+        using = kwargs.get('using') or router.db_for_write(type(self),
+                                                           instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
         ordering = ['-order_date']
         indexes = [
             models.Index(fields=['order_date']),
+            # Keyset pagination order, see app.pagination.OrderPagination
+            models.Index(fields=['-order_date', 'id']),
+            # Filtered lists, see app.filters.OrderFilterBackend. Each
+            # leads with the filter and ends with the list's ordering so
+            # a page is a bounded index range scan with no sort
+            models.Index(fields=['customer', '-order_date', 'id'],
+                         name='order_customer_date_idx'),
+            models.Index(fields=['status', '-order_date', 'id'],
+                         name='order_status_date_idx'),
+            # Pending orders are the small, hot subset
+            models.Index(fields=['-order_date', 'id'],
+                         condition=models.Q(status='pending'),
+                         name='order_pending_date_idx'),
+            models.Index(fields=['amount'], name='order_amount_idx'),
         ]
@@ -0,0 +1,57 @@
+from django.db import models
+
+from app.models.customers.models import Customer
+from app.models.orders.models import Order
+
+
+class OrderRollup(models.Model):
+    """
+    Number and total amount of the orders in one status on one day (in
+    TIME_ZONE), kept up to date by app.rollups as orders change.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=255,
+                              choices=Order.OrderStatus.choices)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2,
+                                  default=0)
+
+    def __str__(self) -> str:
+        return f'{self.day} - {self.status}: {self.order_count}'
+
+    class Meta:
+        verbose_name = 'Order rollup'
+        verbose_name_plural = 'Order rollups'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'],
+                                    name='order_rollup_unique'),
+        ]
+
+
+class CustomerOrderRollup(models.Model):
+    """OrderRollup broken down by customer."""
+    day = models.DateField()
+    status = models.CharField(max_length=255,
+                              choices=Order.OrderStatus.choices)
+    # No constraint: deleting a customer first removes their orders,
+    # which empties and deletes these rows
+    customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING,
+                                 db_constraint=False,
+                                 related_name='order_rollups')
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2,
+                                  default=0)
+
+    def __str__(self) -> str:
+        return (f'{self.day} - customer {self.customer_id} - {self.status}: '
+                f'{self.order_count}')
+
+    class Meta:
+        verbose_name = 'Customer order rollup'
+        verbose_name_plural = 'Customer order rollups'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status', 'customer'],
+                                    name='customer_order_rollup_unique'),
+        ]
@@ -0,0 +1,35 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination: each page seeks from the last row of the
+    previous one through an index on `ordering`, so deep pages cost the
+    same as the first and there is no COUNT(*).
+
+    Page-number pagination is still available by passing `?page=`.
+    """
+    ordering = ('-created_at', 'id')
+    page_number_class = PageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_number = None
+        if self.page_number_class.page_query_param in request.query_params:
+            self.page_number = self.page_number_class()
+            return self.page_number.paginate_queryset(
+                queryset.order_by(*self.ordering), request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number is not None:
+            return self.page_number.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.page_number is not None:
+            return self.page_number.to_html()
+        return super().to_html()
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-order_date', 'id')
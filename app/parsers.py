@@ -0,0 +1,39 @@
+"""
+JSON parsing with orjson.
+
+`ORJSONParser` returns the same data as DRF's `JSONParser`. Bodies
+orjson would read differently are left to `JSONParser`: ones not in
+UTF-8, ones with integers too long for 64 bits, which orjson reads as
+floats, and ones orjson rejects, so invalid JSON gets the usual error.
+
+Without orjson installed the parser is `JSONParser`.
+"""
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from app.renderers import ORJSONRenderer, orjson
+
+# Numbers of 20 digits or more may not fit in 64 bits. They are found by
+# turning every digit into a 0, which is much faster than a regex.
+ZERO_DIGITS = bytes.maketrans(b'123456789', b'0' * 9)
+LONG_NUMBER = b'0' * 20
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding',
+                                              settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if LONG_NUMBER not in body.translate(ZERO_DIGITS):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,68 @@
+"""
+JSON rendering with orjson.
+
+`ORJSONRenderer` writes the same bytes as DRF's `JSONRenderer`, several
+times faster. orjson encodes UUIDs, dates and datetimes itself; anything
+else, such as the `Decimal` values the stdlib encoder writes as floats,
+goes through DRF's encoder. Output orjson would write differently is
+rendered by `JSONRenderer` as before: indented output, and data orjson
+rejects, e.g. non-string keys or integers beyond 64 bits, or holds
+floats orjson formats unlike `json.dumps`, such as the health check's
+sub-millisecond timings (0.000052 for 5.2e-05, 1e-7 for 1e-07). The one
+difference left is NaN and infinity, written as null where
+`JSONRenderer` raises.
+
+Without orjson installed the renderer is `JSONRenderer`.
+"""
+import json
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The stdlib encoder escapes these so output stays a JavaScript subset
+LINE_SEPARATORS = (('\u2028'.encode(), b'\\u2028'),
+                   ('\u2029'.encode(), b'\\u2029'))
+# Floats orjson writes unlike json.dumps: below 1e-4 without an exponent,
+# or with a one-digit exponent. A string that looks like one only costs
+# a slower render.
+FLOAT_MISMATCH = re.compile(rb'0\.0000|\de-\d(?!\d)')
+
+
+class ORJSONRenderer(JSONRenderer):
+    def use_orjson(self, accepted_media_type, renderer_context):
+        return (orjson is not None and self.compact and not self.ensure_ascii
+                and self.get_indent(accepted_media_type,
+                                    renderer_context or {}) is None)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.use_orjson(accepted_media_type,
+                                               renderer_context):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        encode = self.encoder_class().default
+
+        def default(obj):
+            value = encode(obj)
+            if isinstance(value, float):
+                # Formatted like json.dumps, e.g. 1e-05 rather than 0.00001
+                return orjson.Fragment(json.dumps(value))
+            return value
+
+        try:
+            ret = orjson.dumps(data, default=default,
+                               option=(orjson.OPT_UTC_Z
+                                       | orjson.OPT_PASSTHROUGH_DATACLASS))
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        if FLOAT_MISMATCH.search(ret):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        for char, escaped in LINE_SEPARATORS:
+            ret = ret.replace(char, escaped)
+        return ret
@@ -0,0 +1,262 @@
+"""
+Incremental order rollups.
+
+CustomerOrderRollup holds the number and total amount of orders per day,
+status and customer, and OrderRollup the same per day and status only,
+so the stats endpoint reads a few hundred rollup rows instead of
+aggregating every Order. CustomerSummary holds each customer's lifetime
+totals, so customer lists render them without touching Order.
+
+Each write adjusts all three in the same transaction as the orders
+themselves: saves and deletes through the Order signals in
+app/signals.py, and bulk inserts, which send no signals, through
+`record_created`. The `rebuild_order_rollups` command recomputes the
+rollups from Order, and the `reconcile_customer_summaries` task the
+summaries.
+
+Adjustments are additive upserts and F() updates, so concurrent writers
+touching the same row never overwrite each other's counts.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Count, DateTimeField, F, Max, Q, Subquery, Sum, Value
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from app.models.customers.models import CustomerSummary
+from app.models.orders.models import Order
+from app.models.rollups.models import CustomerOrderRollup, OrderRollup
+
+# Fields of Order that rollups depend on
+ROLLUP_FIELDS = ('order_date', 'status', 'customer_id', 'amount')
+
+UPSERT_SQL = """
+    INSERT INTO {table} ({keys}, order_count, revenue)
+    VALUES ({placeholders})
+    ON CONFLICT ({keys}) DO UPDATE SET
+        order_count = {table}.order_count + excluded.order_count,
+        revenue = {table}.revenue + excluded.revenue
+"""
+
+
+def _add(deltas, summaries, order_date, status, customer_id, amount,
+         sign):
+    key = (timezone.localdate(order_date), status, customer_id)
+    count, revenue = deltas.get(key, (0, Decimal(0)))
+    deltas[key] = (count + sign, revenue + sign * Decimal(amount))
+
+    # [order_count, total_spent, latest order added, whether one left]
+    summary = summaries.setdefault(customer_id, [0, Decimal(0), None, False])
+    summary[0] += sign
+    if status != Order.OrderStatus.CANCELLED:
+        summary[1] += sign * Decimal(amount)
+    if sign > 0:
+        summary[2] = max(summary[2] or order_date, order_date)
+    else:
+        summary[3] = True
+
+
+def _upsert(model, keys, deltas):
+    ops = connection.ops
+    rows = [(ops.adapt_datefield_value(key[0]), *key[1:], count,
+             ops.adapt_decimalfield_value(revenue, 16, 2))
+            for key, (count, revenue) in deltas.items() if count or revenue]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(UPSERT_SQL.format(
+                table=ops.quote_name(model._meta.db_table),
+                keys=', '.join(keys),
+                placeholders=', '.join(['%s'] * (len(keys) + 2))), rows)
+    for key, (count, revenue) in deltas.items():
+        if count < 0:
+            model.objects.filter(order_count__lte=0,
+                                 **dict(zip(keys, key))).delete()
+
+
+def apply(deltas):
+    """
+    Add `deltas`, a mapping of (day, status, customer_id) to
+    (order_count, revenue), to the rollups. Rows left with no orders are
+    removed.
+    """
+    daily = {}
+    for (day, status, customer_id), (count, revenue) in deltas.items():
+        total_count, total_revenue = daily.get((day, status),
+                                               (0, Decimal(0)))
+        daily[day, status] = (total_count + count, total_revenue + revenue)
+    _upsert(CustomerOrderRollup, ('day', 'status', 'customer_id'), deltas)
+    _upsert(OrderRollup, ('day', 'status'), daily)
+
+
+def update_summaries(summaries):
+    """
+    Apply per-customer changes collected by `_add` to CustomerSummary
+    with F() updates. A customer who lost an order has their latest
+    order looked up again.
+    """
+    for customer_id, (count, spent, latest, removed) in summaries.items():
+        if not (count or spent or latest or removed):
+            continue
+        changes = {'order_count': F('order_count') + count,
+                   'total_spent': F('total_spent') + spent}
+        if removed:
+            changes['last_order_date'] = Subquery(
+                Order.objects.filter(customer_id=customer_id)
+                .order_by('-order_date').values('order_date')[:1])
+        elif latest is not None:
+            value = Value(latest, output_field=DateTimeField())
+            changes['last_order_date'] = Greatest(
+                Coalesce('last_order_date', value), value)
+        summary = CustomerSummary.objects.filter(customer_id=customer_id)
+        if summary.update(**changes) or count <= 0:
+            continue
+        # Customers inserted in bulk have no summary yet
+        try:
+            with transaction.atomic():
+                CustomerSummary.objects.create(
+                    customer_id=customer_id, order_count=count,
+                    total_spent=spent, last_order_date=latest)
+        except IntegrityError:
+            summary.update(**changes)
+
+
+def record_created(orders):
+    deltas, summaries = {}, {}
+    for order in orders:
+        _add(deltas, summaries, order.order_date, order.status,
+             order.customer_id, order.amount, 1)
+    apply(deltas)
+    update_summaries(summaries)
+
+
+def record_saved(order, previous=None):
+    """
+    Count a saved order, replacing `previous`, the (order_date, status,
+    customer_id, amount) it had before, if it already existed.
+    """
+    deltas, summaries = {}, {}
+    if previous is not None:
+        _add(deltas, summaries, *previous, -1)
+    _add(deltas, summaries, order.order_date, order.status,
+         order.customer_id, order.amount, 1)
+    if previous is not None and previous[0::2] == (order.order_date,
+                                                   order.customer_id):
+        # Still the same customer's order from the same moment
+        summaries[order.customer_id][3] = False
+    apply(deltas)
+    update_summaries(summaries)
+
+
+def record_deleted(order):
+    deltas, summaries = {}, {}
+    _add(deltas, summaries, order.order_date, order.status,
+         order.customer_id, order.amount, -1)
+    apply(deltas)
+    update_summaries(summaries)
+
+
+def reconcile_summaries(customer_ids):
+    """
+    Recompute the summaries of `customer_ids` from their orders, fixing
+    any that drifted. Returns how many were wrong or missing.
+
+    Existing summaries are locked first, so an order committed meanwhile
+    either is counted here or applies its F() update on top afterwards.
+    """
+    with transaction.atomic():
+        summaries = CustomerSummary.objects.select_for_update().in_bulk(
+            customer_ids)
+        actual = {
+            row['customer_id']: row for row in
+            Order.objects.filter(customer_id__in=customer_ids)
+            .values('customer_id')
+            .annotate(order_count=Count('id'),
+                      total_spent=Coalesce(
+                          Sum('amount', filter=~Q(
+                              status=Order.OrderStatus.CANCELLED)),
+                          Value(Decimal(0))),
+                      last_order_date=Max('order_date'))
+            .order_by()
+        }
+
+        missing, stale = [], []
+        for customer_id in customer_ids:
+            row = actual.get(customer_id, {})
+            expected = (row.get('order_count', 0),
+                        row.get('total_spent', Decimal(0)),
+                        row.get('last_order_date'))
+            summary = summaries.get(customer_id)
+            if summary is None:
+                summary = CustomerSummary(customer_id=customer_id)
+                missing.append(summary)
+            elif (summary.order_count, summary.total_spent,
+                  summary.last_order_date) != expected:
+                stale.append(summary)
+            else:
+                continue
+            (summary.order_count, summary.total_spent,
+             summary.last_order_date) = expected
+
+        CustomerSummary.objects.bulk_create(missing, ignore_conflicts=True)
+        CustomerSummary.objects.bulk_update(
+            stale, ['order_count', 'total_spent', 'last_order_date'])
+    return len(missing) + len(stale)
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def aggregate_orders(start, end):
+    """
+    Rollup deltas computed from the orders placed from the start of day
+    `start` up to the end of day `end`.
+    """
+    deltas = {}
+    rows = (Order.objects.filter(order_date__gte=start_of_day(start),
+                                 order_date__lt=start_of_day(
+                                     end + timedelta(days=1)))
+            .annotate(day=TruncDate('order_date'))
+            .values_list('day', 'status', 'customer_id')
+            .annotate(order_count=Count('id'), revenue=Sum('amount'))
+            .order_by())
+    for day, status, customer_id, count, revenue in rows:
+        deltas[day, status, customer_id] = (count, revenue)
+    return deltas
+
+
+def stats(start, end, top):
+    """
+    Order counts and revenue from day `start` to day `end`: totals, per
+    status, per day and for the `top` customers by revenue. Cancelled
+    orders count towards their own status only.
+    """
+    cancelled = Order.OrderStatus.CANCELLED
+    totals = {'orders': Sum('order_count'), 'revenue': Sum('revenue')}
+    days = OrderRollup.objects.filter(day__gte=start, day__lte=end)
+
+    by_status = list(days.values('status').annotate(**totals)
+                     .order_by('status'))
+    return {
+        'date_from': start,
+        'date_to': end,
+        'totals': {
+            'orders': sum(row['orders'] for row in by_status),
+            'revenue': sum((row['revenue'] for row in by_status
+                            if row['status'] != cancelled), Decimal(0)),
+        },
+        'by_status': by_status,
+        'daily': list(days.exclude(status=cancelled).values('day')
+                      .annotate(**totals).order_by('day')),
+        'top_customers': list(
+            CustomerOrderRollup.objects
+            .filter(day__gte=start, day__lte=end)
+            .exclude(status=cancelled)
+            .values('customer', code=F('customer__code'),
+                    name=F('customer__name'))
+            .annotate(**totals).order_by('-revenue', 'customer')[:top]),
+    }
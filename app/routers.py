@@ -0,0 +1,157 @@
+"""
+Read-replica routing.
+
+Reads of this app's models go to a replica only while a view that opted
+in with `ReplicaReadMixin` is handling a GET or HEAD request; everything
+else, writes included, uses `default`. Two guards keep replica reads from
+going stale:
+
+- a client that has just written sticks to the primary for
+  DB_REPLICA_STICKY_SECONDS, tracked per user in the shared cache so it
+  holds across workers;
+- each replica's replication lag is checked at most every
+  DB_REPLICA_LAG_CHECK_SECONDS, and a replica further behind than
+  DB_REPLICA_MAX_LAG_SECONDS, or one that can't be reached, is skipped.
+
+Anything read to be shared beyond the request, such as a cache fill, is
+read inside `primary_reads()`: a replica's lag would outlive the write's
+cache invalidation and be served to every client.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Zero when the replica has replayed everything it received, so an idle
+# primary doesn't look like lag
+POSTGRESQL_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_request = ContextVar('replica_reads_request', default=None)
+_lag_checks = {}
+
+
+def sticky_key(user_pk):
+    return f'db:sticky:{user_pk}'
+
+
+@contextmanager
+def replica_reads(request):
+    """Let reads made while handling `request` go to a replica."""
+    token = _request.set(request)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send reads made inside the block to the primary."""
+    token = _request.set(None)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def stick_to_primary(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cache.set(sticky_key(user.pk), True,
+                  timeout=settings.DB_REPLICA_STICKY_SECONDS)
+
+
+def replica_lag(alias):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRESQL_LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def healthy_replicas():
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        checked = _lag_checks.get(alias)
+        if (checked is None
+                or now - checked[0] >= settings.DB_REPLICA_LAG_CHECK_SECONDS):
+            try:
+                lag = replica_lag(alias)
+            except DatabaseError as e:
+                logger.warning(f'Replica {alias} lag check failed: {e}')
+                lag = None
+            checked = _lag_checks[alias] = (now, lag)
+        lag = checked[1]
+        if lag is not None and lag <= settings.DB_REPLICA_MAX_LAG_SECONDS:
+            healthy.append(alias)
+        else:
+            metrics.incr(f'db.{alias}.lagging')
+    return healthy
+
+
+def read_alias():
+    """
+    The database reads should use right now: a healthy replica during a
+    safe request from a client that hasn't just written, else None for
+    the primary.
+    """
+    request = _request.get()
+    if (request is None or not settings.DATABASE_REPLICAS
+            or request.method not in SAFE_METHODS):
+        return None
+
+    # Decided once per request, by the first read after authentication
+    alias = getattr(request, '_read_alias', False)
+    if alias is not False:
+        return alias
+
+    alias = None
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and cache.get(
+            sticky_key(user.pk)):
+        metrics.incr('db.read.sticky')
+    else:
+        replicas = healthy_replicas()
+        if replicas:
+            alias = random.choice(replicas)
+    metrics.incr(f'db.read.{"replica" if alias else "primary"}')
+    request._read_alias = alias
+    return alias
+
+
+class ReplicaRouter:
+    route_app_labels = {'app'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in self.route_app_labels:
+            return read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
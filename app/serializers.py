@@ -1,16 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
-from app.models.customers.models import Customer
+from app import exporters, rollups
+from app.models.customers.models import Customer, CustomerSummary
 from app.models.orders.models import Order
 
 
+class CustomerSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomerSummary
+        fields = ['order_count', 'total_spent', 'last_order_date']
+
+
 class CustomerSerializer(serializers.ModelSerializer):
+    """
+    Adds the customer's order `summary` when the context asks for it with
+    `include_summary`; load it with select_related('summary').
+    """
     class Meta:
         model = Customer
         fields = ['id', 'name', 'code', 'phone_number',
                   'email', 'customer_id', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('include_summary'):
+            fields['summary'] = serializers.SerializerMethodField()
+        return fields
+
+    def get_summary(self, customer):
+        try:
+            summary = customer.summary
+        except CustomerSummary.DoesNotExist:
+            # Not reconciled yet
+            summary = CustomerSummary(customer=customer)
+        return CustomerSummarySerializer(summary).data
+
     def validate_code(self, value):
         if Customer.objects.filter(code=value).exists():
             raise serializers.ValidationError(
@@ -30,20 +59,180 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at',
                             'order_date', 'customer']
 
+    def customer_codes(self, items):
+        """
+        The customer codes `items` name, cleaned as `customer_code` cleans
+        them (e.g. trimmed), for looking up customers ahead of validation.
+        """
+        field = self.fields['customer_code']
+        codes = set()
+        for item in items:
+            if isinstance(item, dict) and 'customer_code' in item:
+                try:
+                    codes.add(field.run_validation(item['customer_code']))
+                except serializers.ValidationError:
+                    pass
+        return codes
+
     def validate_customer_code(self, value):
-        if not Customer.objects.filter(code=value).exists():
+        # Resolve the customer here so create() doesn't look it up again.
+        # Bulk validation prefetches every customer into the context.
+        customers = self.context.get('customers')
+        if customers is not None:
+            customer = customers.get(value)
+        else:
+            customer = Customer.objects.filter(code=value).first()
+        if customer is None:
             raise serializers.ValidationError(
                 'Customer code does not exist')
-        return value
+        return customer
+
+    def create(self, validated_data):
+        validated_data['customer'] = validated_data.pop('customer_code')
+        return super().create(validated_data)
 
-    def validate_customer(self, value):
-        if not Customer.objects.filter(id=value).exists():
+
+class OrderBulkSerializer(serializers.ListSerializer):
+    """
+    Validates a batch of orders, resolving every customer_code with a single
+    query. Invalid items are collected in `rejected` with their index
+    instead of failing the whole batch.
+    """
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
             raise serializers.ValidationError(
-                'Customer does not exist')
-        return value
+                {'non_field_errors': ['Expected a list of orders']})
+        if not data:
+            raise serializers.ValidationError(
+                {'non_field_errors': ['No orders provided']})
+        if self.max_length is not None and len(data) > self.max_length:
+            raise serializers.ValidationError({'non_field_errors': [
+                f'At most {self.max_length} orders per request']})
+
+        self._context['customers'] = Customer.objects.in_bulk(
+            self.child.customer_codes(data), field_name='code')
+
+        self.accepted, self.rejected, validated = [], [], []
+        for index, item in enumerate(data):
+            try:
+                validated.append(self.child.run_validation(item))
+                self.accepted.append(index)
+            except serializers.ValidationError as exc:
+                self.rejected.append({'index': index, 'errors': exc.detail})
+        return validated
 
     def create(self, validated_data):
-        customer_code = validated_data.pop('customer_code')
-        customer = Customer.objects.get(code=customer_code)
-        validated_data['customer'] = customer
-        return super().create(validated_data)
+        orders = []
+        for item in validated_data:
+            item = dict(item)
+            item['customer'] = item.pop('customer_code')
+            orders.append(Order(**item))
+        orders = Order.objects.bulk_create(
+            orders, batch_size=settings.ORDER_BULK_CHUNK_SIZE)
+        # bulk_create sends no signals
+        rollups.record_created(orders)
+        return orders
+
+
+class CustomerSearchSerializer(serializers.Serializer):
+    """The `search` query parameter of the customer list."""
+    search = serializers.CharField(required=False, min_length=3,
+                                   max_length=255)
+
+
+class OrderFilterSerializer(serializers.Serializer):
+    """Query parameters that narrow down a set of orders."""
+    status = serializers.ChoiceField(choices=Order.OrderStatus.choices,
+                                     required=False)
+    customer = serializers.IntegerField(required=False, min_value=1)
+    customer_code = serializers.CharField(required=False)
+    order_date_after = serializers.DateTimeField(
+        required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+    order_date_before = serializers.DateTimeField(
+        required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+    amount_min = serializers.DecimalField(max_digits=10, decimal_places=2,
+                                          required=False)
+    amount_max = serializers.DecimalField(max_digits=10, decimal_places=2,
+                                          required=False)
+
+    lookups = {
+        'status': 'status',
+        'customer': 'customer_id',
+        'customer_code': 'customer__code',
+        'order_date_after': 'order_date__gte',
+        'order_date_before': 'order_date__lt',
+        'amount_min': 'amount__gte',
+        'amount_max': 'amount__lte',
+    }
+
+    def validate(self, attrs):
+        after = attrs.get('order_date_after')
+        before = attrs.get('order_date_before')
+        if after and before and after > before:
+            raise serializers.ValidationError(
+                'order_date_after must be before order_date_before')
+        low = attrs.get('amount_min')
+        high = attrs.get('amount_max')
+        if low is not None and high is not None and low > high:
+            raise serializers.ValidationError(
+                'amount_min must not be greater than amount_max')
+        return attrs
+
+    def get_filters(self):
+        return {lookup: self.validated_data[param]
+                for param, lookup in self.lookups.items()
+                if param in self.validated_data}
+
+
+class OrderExportQuerySerializer(OrderFilterSerializer):
+    """Query parameters accepted by the order export."""
+    file_format = serializers.ChoiceField(
+        choices=list(exporters.ENCODERS), default='ndjson')
+
+
+class OrderStatsQuerySerializer(serializers.Serializer):
+    """Query parameters of the order stats: a range of days, inclusive."""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    top = serializers.IntegerField(required=False, default=10, min_value=1,
+                                   max_value=100)
+
+    def validate(self, attrs):
+        date_to = attrs.setdefault('date_to', timezone.localdate())
+        date_from = attrs.setdefault('date_from', date_to - timedelta(
+            days=settings.ORDER_STATS_DEFAULT_DAYS - 1))
+        if date_from > date_to:
+            raise serializers.ValidationError(
+                'date_from must not be after date_to')
+        if (date_to - date_from).days >= settings.ORDER_STATS_MAX_DAYS:
+            raise serializers.ValidationError(
+                f'At most {settings.ORDER_STATS_MAX_DAYS} days at a time')
+        return attrs
+
+
+class OrderTotalsSerializer(serializers.Serializer):
+    orders = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=16, decimal_places=2)
+
+
+class OrderStatusTotalsSerializer(OrderTotalsSerializer):
+    status = serializers.CharField()
+
+
+class DailyOrderTotalsSerializer(OrderTotalsSerializer):
+    day = serializers.DateField()
+
+
+class CustomerOrderTotalsSerializer(OrderTotalsSerializer):
+    customer = serializers.IntegerField()
+    code = serializers.CharField()
+    name = serializers.CharField()
+
+
+class OrderStatsSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    totals = OrderTotalsSerializer()
+    by_status = OrderStatusTotalsSerializer(many=True)
+    daily = DailyOrderTotalsSerializer(many=True)
+    top_customers = CustomerOrderTotalsSerializer(many=True)
@@ -0,0 +1,83 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from oauth2_provider.models import AccessToken
+
+from app import cache as api_cache
+from app import rollups
+from app.authentication import invalidate_token
+from app.models.customers.models import Customer, CustomerSummary
+from app.models.orders.models import Order
+
+
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_customer(sender, instance, **kwargs):
+    # Orders embed the customer from its own cache entry, so this also
+    # refreshes customer_details on every cached order
+    transaction.on_commit(partial(api_cache.invalidate, 'customer',
+                                  instance.pk))
+
+
+@receiver(post_save, sender=Customer)
+def create_customer_summary(sender, instance, created, raw, **kwargs):
+    # So an order only ever has to update it, see app.rollups
+    if created and not raw:
+        CustomerSummary.objects.create(customer=instance)
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order(sender, instance, **kwargs):
+    transaction.on_commit(partial(api_cache.invalidate, 'order',
+                                  instance.pk))
+
+
+@receiver(pre_save, sender=Order)
+def remember_rollup_fields(sender, instance, using, update_fields, **kwargs):
+    # The rollup row an order leaves depends on what it was before. The
+    # row stays locked until Order.save commits, so a concurrent update
+    # waits and then sees this one's values, not the same old ones.
+    instance._rollup_previous = None
+    if instance._state.adding or (
+            update_fields is not None
+            and not set(update_fields) & {*rollups.ROLLUP_FIELDS,
+                                          'customer'}):
+        return
+    instance._rollup_previous = Order.objects.using(
+        using).select_for_update().filter(pk=instance.pk).values_list(
+            *rollups.ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=Order)
+def update_rollups_on_save(sender, instance, created, update_fields,
+                           **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if not created and previous is None and update_fields is not None:
+        return
+    rollups.record_saved(instance, previous)
+
+
+@receiver(post_delete, sender=Order)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.record_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def invalidate_access_token(sender, instance, **kwargs):
+    # Drop it straight away and again on commit, so a request that read
+    # the old row in between can't leave it cached after a revoke
+    invalidate_token(instance.token_checksum)
+    transaction.on_commit(partial(invalidate_token, instance.token_checksum))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    # Cached tokens carry the user as it was when cached, so deactivating
+    # or demoting them must not wait for the tokens to expire
+    if created:
+        return
+    for checksum in AccessToken.objects.filter(user=instance).values_list(
+            'token_checksum', flat=True):
+        invalidate_token(checksum)
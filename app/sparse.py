@@ -0,0 +1,180 @@
+"""
+Sparse fieldsets.
+
+`?fields=id,status,amount` narrows each item of a response to the named
+fields, and `?expand=` adds a nested object to them, e.g. the order's
+`customer_details` with `?expand=customer`. Fields a view adds on
+request, like the customer `summary`, are always kept. Without `fields`
+responses are unchanged.
+
+A list with sparse fields selects just the columns it needs with
+values() and renders each row with the serializer's own fields, so no
+model instances or serializer instances are built per row. Detail views
+trim their usual, cached representation.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PKOnlyObject, RelatedField
+from rest_framework.utils.serializer_helpers import ReturnList
+
+from app.routers import SAFE_METHODS
+
+
+def split_param(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class ValuesReader:
+    """
+    Renders values() rows the way `serializer` renders instances, for
+    the fields in `names`. Raises TypeError for a field that can't be
+    read from a column, such as a SerializerMethodField.
+    """
+    def __init__(self, serializer, names, prefix=''):
+        self.columns = []
+        self.readers = []
+        for name in names:
+            field = serializer.fields[name]
+            if (field.source == '*'
+                    or isinstance(field, serializers.SerializerMethodField)
+                    or isinstance(field, serializers.ListSerializer)):
+                raise TypeError(f'{name} is not read from a column')
+            lookup = prefix + field.source.replace('.', '__')
+            if isinstance(field, serializers.BaseSerializer):
+                nested = ValuesReader(
+                    field, [nested for nested, child in field.fields.items()
+                            if not child.write_only], f'{lookup}__')
+                self.columns += nested.columns
+                self.readers.append((name, nested.render))
+            else:
+                self.columns.append(lookup)
+                self.readers.append((name, self.column_reader(field,
+                                                              lookup)))
+
+    @staticmethod
+    def column_reader(field, lookup):
+        related = isinstance(field, RelatedField)
+
+        def read(row):
+            value = row[lookup]
+            if value is None:
+                return None
+            if related:
+                value = PKOnlyObject(pk=value)
+            return field.to_representation(value)
+        return read
+
+    def render(self, row):
+        return {name: read(row) for name, read in self.readers}
+
+
+class ValuesSerializer:
+    """Stands in for `serializer_class(rows, many=True)` on values()."""
+    def __init__(self, rows, reader, serializer):
+        self.rows = rows
+        self.reader = reader
+        self.serializer = serializer
+
+    @property
+    def data(self):
+        return ReturnList([self.reader.render(row) for row in self.rows],
+                          serializer=self.serializer)
+
+
+class TrimmedSerializer:
+    """Wraps a list serializer, keeping only `names` of each item."""
+    def __init__(self, serializer, names):
+        self.serializer = serializer
+        self.names = names
+
+    @property
+    def data(self):
+        return ReturnList([{name: item[name] for name in self.names}
+                           for item in self.serializer.data],
+                          serializer=self.serializer)
+
+
+class SparseFieldsMixin:
+    """
+    `?fields=` and `?expand=` for a view. `expandable_fields` maps each
+    `expand` value to the serializer field it adds.
+    """
+    expandable_fields = {}
+
+    def get_sparse_fields(self):
+        """The fields to render, or None for all of them."""
+        if hasattr(self, '_sparse_fields'):
+            return self._sparse_fields
+        self._sparse_fields = None
+        params = self.request.query_params
+        if 'fields' not in params or self.request.method not in SAFE_METHODS:
+            return None
+
+        serializer = self.sparse_serializer = self.get_serializer_class()(
+            context=self.get_serializer_context())
+        default = getattr(serializer.Meta, 'fields', ())
+        readable = [name for name, field in serializer.fields.items()
+                    if not field.write_only]
+        choices = [name for name in readable
+                   if name not in self.expandable_fields.values()]
+        names = split_param(params['fields'])
+        expand = split_param(params.get('expand', ''))
+        errors = {}
+        if not names or not set(names) <= set(choices):
+            errors['fields'] = [f'Choose from {", ".join(choices)}']
+        if not set(expand) <= set(self.expandable_fields):
+            errors['expand'] = [
+                f'Choose from {", ".join(self.expandable_fields) or "none"}']
+        if errors:
+            raise ValidationError(errors)
+
+        names += [self.expandable_fields[name] for name in expand]
+        # Fields added on request, e.g. ?include=summary
+        names += [name for name in readable if name not in default]
+        self._sparse_fields = list(dict.fromkeys(names))
+        return self._sparse_fields
+
+    def trim(self, data):
+        names = self.get_sparse_fields()
+        if names is None:
+            return data
+        return {name: data[name] for name in names}
+
+
+class SparseListMixin(SparseFieldsMixin):
+    """
+    Sparse fieldsets for a list view, read with values() when every
+    field comes straight from a column.
+    """
+    def get_values_reader(self):
+        if hasattr(self, '_values_reader'):
+            return self._values_reader
+        self._values_reader = None
+        names = self.get_sparse_fields()
+        if names is not None:
+            try:
+                self._values_reader = ValuesReader(self.sparse_serializer,
+                                                   names)
+            except TypeError:
+                pass
+        return self._values_reader
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        reader = self.get_values_reader()
+        if reader is None:
+            return queryset
+        # Pagination reads its position from the ordering columns
+        ordering = [field.lstrip('-')
+                    for field in getattr(self.paginator, 'ordering', ())]
+        return queryset.values(*dict.fromkeys([*reader.columns, *ordering]))
+
+    def get_serializer(self, *args, **kwargs):
+        names = self.get_sparse_fields()
+        if names is None or not kwargs.get('many'):
+            return super().get_serializer(*args, **kwargs)
+        reader = self.get_values_reader()
+        if reader is not None:
+            return ValuesSerializer(args[0], reader, self.sparse_serializer)
+        return TrimmedSerializer(super().get_serializer(*args, **kwargs),
+                                 names)
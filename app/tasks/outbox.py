@@ -0,0 +1,99 @@
+from functools import partial
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from app.models.notifications.models import Notification
+from app.tasks.tasks import (
+    BATCH_PENDING_KEY, BATCH_SCHEDULED_KEY, send_notification_batch,
+    send_order_notification
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_order_message(order, batched=False):
+    """
+    The order's SMS. A batched one is rendered from
+    ORDER_SMS_BATCH_TEMPLATE, so orders share a body and their
+    notifications a provider call.
+    """
+    if batched:
+        return settings.ORDER_SMS_BATCH_TEMPLATE.format(
+            name=order.customer.name, item=order.item, order_id=order.id)
+    return (f'Hello {order.customer.name}! Your order for '
+            f'{order.item} for has been received successfully.'
+            f'Order ID: {order.id}')
+
+
+def queue_order_notification(order):
+    """
+    Write the order's SMS to the outbox and enqueue it once the surrounding
+    transaction commits. Must be called inside the transaction that saves
+    the order.
+    """
+    notification = Notification.objects.create(
+        order=order,
+        phone_number=order.customer.phone_number,
+        message=build_order_message(
+            order, batched=bool(settings.SMS_BATCH_WINDOW_SECONDS)),
+    )
+    transaction.on_commit(partial(dispatch_order_notification, order.id))
+    return notification
+
+
+def queue_bulk_order_notifications(orders):
+    """
+    Write one outbox row per order and enqueue a single batch task for all
+    of them once the surrounding transaction commits.
+    """
+    notifications = Notification.objects.bulk_create([
+        Notification(order=order,
+                     phone_number=order.customer.phone_number,
+                     message=build_order_message(order, batched=True))
+        for order in orders
+    ], batch_size=settings.ORDER_BULK_CHUNK_SIZE)
+    if notifications:
+        transaction.on_commit(dispatch_notification_batch)
+    return notifications
+
+
+def dispatch_order_notification(order_id):
+    try:
+        if settings.SMS_BATCH_WINDOW_SECONDS:
+            schedule_notification_batch()
+        else:
+            send_order_notification.delay(order_id)
+        logger.info(f'Order {order_id} notification queued')
+    except Exception as e:
+        # The outbox row is already committed, the drain task will pick it up
+        logger.error(f'Error queueing order {order_id} notification, '
+                     f'leaving it in the outbox: {e}')
+
+
+def dispatch_notification_batch():
+    try:
+        send_notification_batch.delay()
+        logger.info('Notification batch queued')
+    except Exception as e:
+        logger.error(f'Error queueing notification batch, '
+                     f'leaving it in the outbox: {e}')
+
+
+def schedule_notification_batch(count=1):
+    """
+    Coalesce queued notifications into one batch task: the first
+    notification in a window schedules the batch, and the batch is sent
+    early once `SMS_BATCH_MAX_SIZE` notifications are waiting.
+    """
+    window = settings.SMS_BATCH_WINDOW_SECONDS
+    cache.add(BATCH_PENDING_KEY, 0, timeout=window * 2)
+    pending = cache.incr(BATCH_PENDING_KEY, count)
+
+    if pending >= settings.SMS_BATCH_MAX_SIZE:
+        cache.delete(BATCH_PENDING_KEY)
+        send_notification_batch.delay()
+    elif cache.add(BATCH_SCHEDULED_KEY, True, timeout=window * 2):
+        send_notification_batch.apply_async(countdown=window)
@@ -1,15 +1,165 @@
+import itertools
 import logging
+import os
+import random
+import threading
+import time
+
 from django.conf import settings
-import africastalking
+from django.utils.module_loading import import_string
+from africastalking.SMS import SMSService as AfricasTalkingSMS
+from africastalking.Service import AfricasTalkingException, validate_phone
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import metrics
+from app.models.customers.models import normalize_phone
 
 logger = logging.getLogger(__name__)
 
 
+class PooledSMSClient(AfricasTalkingSMS):
+    """
+    Africa's Talking SMS client that sends over a keep-alive session.
+
+    The SDK posts every message with a bare `requests.post`, paying for a
+    fresh TCP and TLS handshake each time. This client keeps a pooled
+    session instead, and is shared by everything in the process through
+    `get_sms_client()`. It is the default SMS_BACKEND.
+    """
+
+    def __init__(self, username=None, api_key=None):
+        super().__init__(username or settings.AFRICASTALKING_USERNAME,
+                         api_key or settings.AFRICASTALKING_API_KEY)
+        self.timeout = (settings.SMS_HTTP_CONNECT_TIMEOUT,
+                        settings.SMS_HTTP_READ_TIMEOUT)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.SMS_HTTP_POOL_SIZE))
+
+    def _make_request(self, url, method, headers, data, params,
+                      callback=None):
+        if callback is not None:
+            return super()._make_request(url, method, headers, data, params,
+                                         callback=callback)
+
+        with metrics.timer('sms.http_request'):
+            res = self.session.request(method.upper(), url, headers=headers,
+                                       data=data, params=params,
+                                       timeout=self.timeout)
+        metrics.incr('sms.http_requests')
+
+        if not 200 <= res.status_code < 300:
+            raise AfricasTalkingException(res.text)
+        if res.headers.get('content-type') == 'application/json':
+            return res.json()
+        return res.text
+
+    def connection_stats(self):
+        connections = requests_sent = 0
+        pools = self.session.get_adapter('https://').poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+        return {
+            'connections': connections,
+            'requests': requests_sent,
+            'reuse_rate': (1 - connections / requests_sent
+                           if requests_sent else 0.0),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class FakeSMSGateway:
+    """
+    In-process stand-in for Africa's Talking, for load tests and local
+    runs without the sandbox. `send` answers like the SDK after
+    SMS_FAKE_LATENCY seconds, failing each recipient with probability
+    SMS_FAKE_ERROR_RATE as the gateway does when it errors. Nothing
+    leaves the process.
+    """
+
+    def __init__(self):
+        self.latency = settings.SMS_FAKE_LATENCY
+        self.error_rate = settings.SMS_FAKE_ERROR_RATE
+        self.message_ids = itertools.count(1)
+
+    def send(self, message, recipients, sender_id=None, enqueue=False):
+        with metrics.timer('sms.http_request'):
+            time.sleep(self.latency)
+        metrics.incr('sms.http_requests')
+        results = []
+        for number in recipients:
+            if random.random() < self.error_rate:
+                results.append({'number': number, 'statusCode': 500,
+                                'status': 'InternalServerError'})
+            else:
+                results.append({'number': number, 'statusCode': 101,
+                                'status': SMSService.SUCCESS,
+                                'messageId': f'fake-{next(self.message_ids)}'})
+        sent = sum(result['statusCode'] == 101 for result in results)
+        return {'SMSMessageData': {
+            'Message': f'Sent to {sent}/{len(results)}',
+            'Recipients': results}}
+
+    def close(self):
+        pass
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_sms_client():
+    """
+    Return this process's SMS client, an instance of SMS_BACKEND, creating
+    it on first use. A client inherited across a fork is replaced, since
+    its sockets belong to the parent.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = import_string(settings.SMS_BACKEND)()
+            _client_pid = os.getpid()
+        return _client
+
+
+def reset_sms_client():
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = _client_pid = None
+
+
+def sms_metrics():
+    stats = metrics.snapshot()
+    if isinstance(_client, PooledSMSClient) and _client_pid == os.getpid():
+        stats['connections'] = _client.connection_stats()
+    return stats
+
+
+def normalize_phone_number(phone_number):
+    if not phone_number.startswith('+'):
+        phone_number = f'+{normalize_phone(phone_number)}'
+    return phone_number
+
+
 class SMSService:
+    SUCCESS = 'Success'
+    INVALID_PHONE_NUMBER = 'InvalidPhoneNumber'
+    # Recipient statuses that no retry will turn into a success
+    PERMANENT_FAILURES = frozenset({
+        INVALID_PHONE_NUMBER, 'UnsupportedNumberType', 'UserInBlacklist',
+        'DoNotDisturbRejection', 'InvalidSenderId',
+    })
+
     def __init__(self) -> None:
-        africastalking.initialize(username=settings.AFRICASTALKING_USERNAME,
-                                  api_key=settings.AFRICASTALKING_API_KEY)
-        self.sms = africastalking.SMS
+        self.sms = get_sms_client()
 
     def send_sms(self, phone_number, message):
         try:
@@ -17,14 +167,14 @@ class SMSService:
                 raise ValueError('Phone number is required')
             if not message:
                 raise ValueError('Message is required')
-            if not phone_number.startswith('+'):
-                phone_number = f'+254{phone_number.lstrip('0')}'
+            phone_number = normalize_phone_number(phone_number)
 
-            response = self.sms.send(message, [phone_number])
+            with metrics.timer('sms.send'):
+                response = self.sms.send(message, [phone_number])
 
             if response['SMSMessageData']['Recipients']:
                 recipient = response['SMSMessageData']['Recipients'][0]
-                if recipient['status'] == 'Success':
+                if recipient['status'] == self.SUCCESS:
                     logger.info(f'SMS sent to {phone_number} successfully')
                     return True
                 else:
@@ -38,3 +188,51 @@ class SMSService:
         except Exception as e:
             logger.error(f'Error sending SMS: {e}')
             raise e
+
+    def send_bulk(self, phone_numbers, message):
+        """
+        Send one message to many recipients using as few provider calls as
+        possible. Returns a mapping of normalized phone number to the
+        provider's per-recipient status; recipients missing from the
+        response, or in a call that raised, are reported as failed.
+        Numbers the SDK would refuse, failing the whole call, are left out
+        of it and reported as invalid.
+        """
+        if not message:
+            raise ValueError('Message is required')
+        phone_numbers = list(dict.fromkeys(
+            normalize_phone_number(phone_number)
+            for phone_number in phone_numbers if phone_number))
+
+        statuses = {}
+        for phone_number in phone_numbers:
+            if not validate_phone(phone_number):
+                logger.warning(f'Not sending SMS to invalid phone number '
+                               f'{phone_number!r}')
+                statuses[phone_number] = self.INVALID_PHONE_NUMBER
+        phone_numbers = [phone_number for phone_number in phone_numbers
+                         if phone_number not in statuses]
+        chunk_size = settings.SMS_BULK_MAX_RECIPIENTS
+        for start in range(0, len(phone_numbers), chunk_size):
+            chunk = phone_numbers[start:start + chunk_size]
+            try:
+                with metrics.timer('sms.send'):
+                    response = self.sms.send(message, chunk)
+                recipients = {
+                    recipient['number']: recipient['status']
+                    for recipient in response['SMSMessageData']['Recipients']
+                }
+            except Exception as e:
+                logger.error(f'Error sending bulk SMS to {len(chunk)} '
+                             f'recipients: {e}')
+                recipients = {}
+
+            for phone_number in chunk:
+                statuses[phone_number] = recipients.get(phone_number,
+                                                        'Failed')
+
+        sent = sum(status == self.SUCCESS for status in statuses.values())
+        metrics.incr('sms.recipients', len(statuses))
+        metrics.incr('sms.recipients_failed', len(statuses) - sent)
+        logger.info(f'Bulk SMS sent to {sent}/{len(statuses)} recipients')
+        return statuses
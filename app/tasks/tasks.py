@@ -1,27 +1,260 @@
+from collections import defaultdict
+from datetime import timedelta
+
 from celery import shared_task
-from app.models.orders.models import Order
-from app.tasks.sms_service import SMSService
+from celery.signals import worker_process_init
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from app import metrics, rollups
+from app.models.customers.models import Customer
+from app.models.idempotency.models import IdempotencyKey
+from app.models.notifications.models import Notification
+from app.tasks.sms_service import (
+    SMSService, get_sms_client, normalize_phone_number, reset_sms_client,
+    sms_metrics
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+NotificationStatus = Notification.NotificationStatus
 
-@shared_task
-def send_order_notification(order_id):
+# Cache keys used to coalesce order notifications into one batch per window
+BATCH_SCHEDULED_KEY = 'sms-batch-scheduled'
+BATCH_PENDING_KEY = 'sms-batch-pending'
+
+
+@worker_process_init.connect
+def warm_sms_client(**kwargs):
+    """Open the process's SMS client before the first task needs it."""
+    reset_sms_client()
     try:
-        order = Order.objects.get(id=order_id)
-        sms_service = SMSService()
-        message = (f'Hello {order.customer.name}! Your order for '
-                   f'{order.item} for has been received successfully.'
-                   f'Order ID: {order.id}')
-
-        result = sms_service.send_sms(phone_number=order.customer.phone_number,
-                                      message=message)
-        logger.info(f'SMS Notification sent for order {order.id}: {result}')
-        return result
-    except Order.DoesNotExist:
-        logger.error(f'Order with id {order_id} does not exist')
-        return False
+        get_sms_client()
     except Exception as e:
-        logger.error(f'Failed to send SMS for order {order_id}: {str(e)}')
+        logger.error(f'Could not initialize SMS client: {e}')
+
+
+class NotificationRetry(Exception):
+    """Some of the notifications a task sent failed and will be retried."""
+
+
+def retry_delay(attempts):
+    """Seconds before retrying a notification that failed `attempts` times."""
+    # Full jitter can draw 0, which would make it due again right away
+    return max(1, get_exponential_backoff_interval(
+        factor=settings.NOTIFICATION_RETRY_BACKOFF, retries=attempts - 1,
+        maximum=settings.NOTIFICATION_RETRY_BACKOFF_MAX, full_jitter=True))
+
+
+def _claim_notifications(queryset, limit):
+    """
+    Move up to `limit` notifications from `queryset` to `sending` and
+    return them. Rows locked by another worker are skipped, so a
+    notification picked up by both the per-order task and a batch is only
+    ever sent once.
+    """
+    with transaction.atomic():
+        notification_ids = list(
+            queryset.select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:limit])
+        Notification.objects.filter(id__in=notification_ids).update(
+            status=NotificationStatus.SENDING,
+            attempts=F('attempts') + 1, updated_at=timezone.now())
+    return list(Notification.objects.filter(id__in=notification_ids))
+
+
+def _send_notifications(notifications, sms_service):
+    """
+    Send claimed notifications, one provider call per distinct message.
+    Each one ends up sent; failed, to be retried after a backoff; or dead
+    once it runs out of attempts or the gateway rejects it for good.
+    Returns how many were sent and how many will be retried.
+    """
+    by_message = defaultdict(lambda: defaultdict(list))
+    for notification in notifications:
+        phone_number = normalize_phone_number(notification.phone_number)
+        by_message[notification.message][phone_number].append(notification)
+
+    # (status, last_error, attempts) to notification ids
+    outcomes = defaultdict(list)
+    for message, recipients in by_message.items():
+        try:
+            statuses = sms_service.send_bulk(list(recipients), message)
+            error = None
+        except Exception as e:
+            logger.error(f'Error sending {len(recipients)} notifications: '
+                         f'{e}')
+            statuses, error = {}, f'Gateway error: {e}'
+        for phone_number, batch in recipients.items():
+            result = statuses.get(phone_number, 'Failed')
+            if result == SMSService.INVALID_PHONE_NUMBER:
+                # Never sent, so no retry can help
+                last_error = f'Invalid phone number: {phone_number}'
+            else:
+                last_error = error or f'Rejected by gateway: {result}'
+            for notification in batch:
+                if result == SMSService.SUCCESS:
+                    outcome = (NotificationStatus.SENT, '', None)
+                elif (result in SMSService.PERMANENT_FAILURES
+                        or notification.attempts
+                        >= settings.NOTIFICATION_MAX_ATTEMPTS):
+                    outcome = (NotificationStatus.DEAD, last_error, None)
+                else:
+                    outcome = (NotificationStatus.FAILED, last_error,
+                               notification.attempts)
+                outcomes[outcome].append(notification.id)
+
+    now = timezone.now()
+    counts = defaultdict(int)
+    for (status, last_error, attempts), ids in outcomes.items():
+        changes = {'status': status, 'last_error': last_error,
+                   'next_attempt_at': None, 'updated_at': now}
+        if status == NotificationStatus.SENT:
+            changes['sent_at'] = now
+        elif status == NotificationStatus.FAILED:
+            changes['next_attempt_at'] = now + timedelta(
+                seconds=retry_delay(attempts))
+        Notification.objects.filter(id__in=ids).update(**changes)
+        counts[status] += len(ids)
+
+    if counts[NotificationStatus.DEAD]:
+        metrics.incr('sms.dead', counts[NotificationStatus.DEAD])
+        logger.warning(f'{counts[NotificationStatus.DEAD]} notifications '
+                       'moved to the dead-letter queue')
+    return counts[NotificationStatus.SENT], counts[NotificationStatus.FAILED]
+
+
+def _due(now):
+    """Failed notifications whose retry is due."""
+    return Q(status=NotificationStatus.FAILED, next_attempt_at__lte=now)
+
+
+@shared_task(autoretry_for=(NotificationRetry,),
+             max_retries=settings.NOTIFICATION_MAX_ATTEMPTS,
+             retry_backoff=settings.NOTIFICATION_RETRY_BACKOFF,
+             retry_backoff_max=settings.NOTIFICATION_RETRY_BACKOFF_MAX,
+             retry_jitter=True, rate_limit=settings.SMS_TASK_RATE_LIMIT)
+def send_order_notification(order_id):
+    """
+    Send the order's notification. Failed sends are retried by retrying
+    the task, with exponential backoff and jitter, so the worker moves on
+    to other tasks meanwhile.
+    """
+    sms_service = SMSService()
+    notifications = _claim_notifications(
+        Notification.objects.filter(
+            order_id=order_id, status__in=[NotificationStatus.QUEUED,
+                                           NotificationStatus.FAILED]),
+        settings.NOTIFICATION_OUTBOX_BATCH_SIZE)
+    if not notifications:
+        # Already sent, e.g. by a batch or the outbox drain
+        logger.info(f'No notification to send for order {order_id}')
         return False
+
+    sent, retrying = _send_notifications(notifications, sms_service)
+    logger.info(f'SMS Notification sent for order {order_id}: '
+                f'{sent}/{len(notifications)}')
+    if retrying:
+        raise NotificationRetry(f'{retrying} notifications for order '
+                                f'{order_id} failed')
+    return sent == len(notifications)
+
+
+@shared_task(rate_limit=settings.SMS_TASK_RATE_LIMIT)
+def send_notification_batch(batch_size=None):
+    """
+    Send every queued notification, and every failed one due a retry,
+    `batch_size` at a time, grouping identical messages into
+    multi-recipient provider calls.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    # Let notifications arriving from now on open a new window
+    cache.delete_many([BATCH_SCHEDULED_KEY, BATCH_PENDING_KEY])
+
+    notifications = _claim_notifications(
+        Notification.objects.filter(Q(status=NotificationStatus.QUEUED)
+                                    | _due(timezone.now())),
+        batch_size)
+    if not notifications:
+        return 0
+
+    sent, retrying = _send_notifications(notifications, SMSService())
+    logger.info(f'SMS batch sent {sent}/{len(notifications)} notifications, '
+                f'{retrying} to retry, metrics: {sms_metrics()}')
+
+    if len(notifications) == batch_size:
+        send_notification_batch.delay(batch_size)
+    return sent
+
+
+@shared_task(rate_limit=settings.SMS_TASK_RATE_LIMIT)
+def drain_notification_outbox(batch_size=None):
+    """
+    Send outbox rows that were never dispatched, e.g. because the broker
+    was down when their order was committed, and failed rows whose
+    retry is due but was never run.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    now = timezone.now()
+
+    # Release claims held by workers that died mid-send
+    stale = now - timedelta(seconds=settings.NOTIFICATION_OUTBOX_STALE_SECONDS)
+    Notification.objects.filter(
+        status=NotificationStatus.SENDING, updated_at__lt=stale
+    ).update(status=NotificationStatus.QUEUED, updated_at=now)
+
+    grace = now - timedelta(seconds=settings.NOTIFICATION_OUTBOX_GRACE_SECONDS)
+    notifications = _claim_notifications(
+        Notification.objects.filter(Q(status=NotificationStatus.QUEUED,
+                                      created_at__lt=grace) | _due(now)),
+        batch_size)
+    if not notifications:
+        return 0
+
+    sent, retrying = _send_notifications(notifications, SMSService())
+    logger.info(f'Outbox drain sent {sent}/{len(notifications)} '
+                f'notifications, {retrying} to retry')
+
+    if len(notifications) == batch_size:
+        drain_notification_outbox.delay(batch_size)
+    return sent
+
+
+@shared_task
+def reconcile_customer_summaries(chunk_size=None):
+    """
+    Recompute every customer's summary from their orders, a chunk of
+    customers at a time, fixing any that drifted from the F() updates.
+    """
+    chunk_size = chunk_size or settings.CUSTOMER_SUMMARY_RECONCILE_CHUNK_SIZE
+    fixed = last_id = 0
+    while True:
+        customer_ids = list(
+            Customer.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', flat=True)[:chunk_size])
+        if not customer_ids:
+            break
+        fixed += rollups.reconcile_summaries(customer_ids)
+        last_id = customer_ids[-1]
+    if fixed:
+        logger.warning(f'Reconciled {fixed} customer summaries')
+    return fixed
+
+
+@shared_task
+def purge_idempotency_keys(chunk_size=1000):
+    """Delete expired idempotency keys, `chunk_size` at a time."""
+    purged = 0
+    while True:
+        key_ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:chunk_size])
+        if not key_ids:
+            break
+        purged += IdempotencyKey.objects.filter(id__in=key_ids).delete()[0]
+    return purged
@@ -1,51 +1,96 @@
-from django.test import TestCase
-from django.urls import reverse
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
+import uuid
+import zoneinfo
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.db.models import QuerySet
+from django.db.utils import load_backend
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 from rest_framework.test import APITestCase
 from oauth2_provider.models import Application, AccessToken
+from psycopg_pool import ConnectionPool
 from django.contrib.auth.models import User
-from datetime import timedelta
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
+from django.utils.translation import gettext_lazy
 from unittest.mock import patch
 
-from app.models.customers.models import Customer
+from app import metrics, rollups, routers
+from app import cache as api_cache
+from app import urls as app_urls
+from app.authentication import CachedOAuth2Validator, token_cache_key
+from app.db import db_metrics
+from app.importers import CustomerImporter
+from app.models.customers.models import (
+    Customer, CustomerSummary, normalize_phone
+)
+from app.models.idempotency.models import IdempotencyKey
 from app.models.orders.models import Order
+from app.models.notifications.models import Notification
+from app.models.rollups.models import CustomerOrderRollup, OrderRollup
+from app.pagination import OrderPagination
+from app.parsers import ORJSONParser
+from app.renderers import ORJSONRenderer
+from app.serializers import OrderSerializer
+from app.views.base import (
+    AsyncListCreateAPIView, AsyncRetrieveUpdateDestroyAPIView
+)
+from app.views.orders.views import order_queryset
+from app.throttling import ScopedRateThrottle, consume
+from app.tasks.outbox import (
+    build_order_message, queue_bulk_order_notifications,
+    queue_order_notification
+)
+from app.tasks.sms_service import (
+    FakeSMSGateway, SMSService, get_sms_client, normalize_phone_number,
+    reset_sms_client
+)
+from app.tasks.tasks import (
+    NotificationRetry, drain_notification_outbox, purge_idempotency_keys,
+    reconcile_customer_summaries, retry_delay, send_notification_batch,
+    send_order_notification
+)
+from savannah_project.settings import (
+    is_worker, worker_queue, worker_threads
+)
+from ta_celery import app as celery_app
 
 
-class CustomerModelTest(TestCase):
-    def setUp(self):
-        self.customer = Customer.objects.create(
-            name='John Doe',
-            phone_number='+254722000001',
-            email='john.doe@example.com',
-            code='CUST001'
-        )
-
-    def test_customer_model_creation(self):
-        self.assertEqual(self.customer.name, 'John Doe')
-        self.assertEqual(self.customer.phone_number, '+254722000001')
-        self.assertEqual(self.customer.email, 'john.doe@example.com')
-        self.assertEqual(self.customer.code, 'CUST001')
+class AuthenticatedAPITestCase(APITestCase):
+    """An APITestCase whose client sends a 'read write' bearer token."""
+    application_options = {}
 
-    def tearDown(self) -> None:
-        self.customer.delete()
-        return super().tearDown()
-
-
-class CustomerAPITest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             username='testuser',
             password='testpassword'
         )
-
         self.application = Application.objects.create(
             name='Test Application',
             user=self.user,
             client_type=Application.CLIENT_CONFIDENTIAL,
-            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+            **self.application_options
         )
-
         self.access_token = AccessToken.objects.create(
             user=self.user,
             scope='read write',
@@ -53,11 +98,32 @@ class CustomerAPITest(APITestCase):
             token='test-token',
             application=self.application,
         )
-
         self.client.credentials(
             HTTP_AUTHORIZATION='Bearer ' + self.access_token.token
         )
 
+
+class CustomerModelTest(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001'
+        )
+
+    def test_customer_model_creation(self):
+        self.assertEqual(self.customer.name, 'John Doe')
+        self.assertEqual(self.customer.phone_number, '+254722000001')
+        self.assertEqual(self.customer.email, 'john.doe@example.com')
+        self.assertEqual(self.customer.code, 'CUST001')
+
+    def tearDown(self) -> None:
+        self.customer.delete()
+        return super().tearDown()
+
+
+class CustomerAPITest(AuthenticatedAPITestCase):
     def test_customer_creation(self):
         # Clear any existing customers first
         Customer.objects.all().delete()
@@ -160,6 +226,77 @@ class CustomerAPITest(APITestCase):
         return super().tearDown()
 
 
+class CustomerImportTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+
+    def row(self, i, **overrides):
+        return {'name': f'Customer {i}', 'code': f'CUST{i:03d}',
+                'phone_number': f'+254722000{i:03d}',
+                'email': f'customer{i}@example.com',
+                'customer_id': f'CUST{i:03d}', **overrides}
+
+    def test_jsonl_upload_reports_rejected_rows(self):
+        lines = [
+            json.dumps(self.row(2)),
+            json.dumps(self.row(3, code='CUST001')),
+            'not json',
+            json.dumps(self.row(4, phone_number='12')),
+            json.dumps(self.row(5)),
+            json.dumps(self.row(6, email='customer5@example.com')),
+        ]
+        upload = SimpleUploadedFile('customers.jsonl',
+                                    '\n'.join(lines).encode())
+        response = self.client.post(reverse('customer-import'),
+                                    {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['processed'], 6)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['rejected'], 4)
+        self.assertEqual([reject['line'] for reject in
+                          sorted(response.data['rejects'],
+                                 key=lambda reject: reject['line'])],
+                         [2, 3, 4, 6])
+        self.assertEqual(set(Customer.objects.values_list('code', flat=True)),
+                         {'CUST001', 'CUST002', 'CUST005'})
+
+    def test_ignored_conflicts_are_not_counted_as_imported(self):
+        importer = CustomerImporter(ignore_conflicts=True)
+        # As if CUST001's email was taken after the chunk was checked
+        importer.insert([
+            (2, Customer(**self.row(2))),
+            (3, Customer(**self.row(3, email='john.doe@example.com'))),
+        ])
+        self.assertEqual(importer.result.imported, 1)
+        self.assertEqual(importer.result.rejected, 1)
+        self.assertEqual(set(Customer.objects.values_list('code', flat=True)),
+                         {'CUST001', 'CUST002'})
+
+    def test_import_queries_scale_with_chunks_not_rows(self):
+        def import_csv(start, count):
+            with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.row(0)))
+                writer.writeheader()
+                for i in range(start, start + count):
+                    writer.writerow(self.row(i))
+                f.flush()
+                with CaptureQueriesContext(connection) as queries:
+                    call_command('import_customers', f.name,
+                                 chunk_size=100, stdout=io.StringIO())
+            return len(queries)
+
+        self.assertEqual(import_csv(100, 10), import_csv(200, 100))
+        self.assertEqual(Customer.objects.count(), 111)
+
+
 class OrderModelTest(TestCase):
     def setUp(self):
         self.customer = Customer.objects.create(
@@ -182,35 +319,48 @@ class OrderModelTest(TestCase):
         self.assertEqual(order.status, 'pending')
 
 
-class OrderAPITest(APITestCase):
+class OrderSerializerTest(TestCase):
     def setUp(self):
-        # Clear any existing data
-        Order.objects.all().delete()
-        Customer.objects.all().delete()
-
-        self.user = User.objects.create_user(
-            username='testuser',
-            password='testpassword'
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
         )
 
-        self.application = Application.objects.create(
-            name='Test Application',
-            user=self.user,
-            client_type=Application.CLIENT_CONFIDENTIAL,
-            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE
-        )
+    def test_create_resolves_customer_once(self):
+        serializer = OrderSerializer(data={
+            'customer_code': 'CUST001',
+            'item': 'Laptop',
+            'amount': '100000.00',
+            'status': 'pending'
+        })
+        # One customer lookup, one insert, an upsert per rollup table and
+        # the customer summary update
+        with self.assertNumQueries(5):
+            self.assertTrue(serializer.is_valid())
+            order = serializer.save()
+        self.assertEqual(order.customer, self.customer)
 
-        self.access_token = AccessToken.objects.create(
-            user=self.user,
-            scope='read write',
-            expires=timezone.now() + timedelta(seconds=3600),
-            token='test-token',
-            application=self.application,
-        )
+    def test_unknown_customer_code_is_rejected(self):
+        serializer = OrderSerializer(data={
+            'customer_code': 'MISSING',
+            'item': 'Laptop',
+            'amount': '100000.00',
+            'status': 'pending'
+        })
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['customer_code'],
+                         ['Customer code does not exist'])
 
-        self.client.credentials(
-            HTTP_AUTHORIZATION='Bearer ' + self.access_token.token
-        )
+
+class OrderAPITest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        # Clear any existing data
+        Order.objects.all().delete()
+        Customer.objects.all().delete()
 
         # Create a customer for order tests
         self.customer = Customer.objects.create(
@@ -221,7 +371,7 @@ class OrderAPITest(APITestCase):
             customer_id='CUST001'
         )
 
-    @patch('app.views.orders.views.send_order_notification')
+    @patch('app.tasks.outbox.send_order_notification')
     def test_order_creation(self, mock_send_order_notification):
         url = reverse('order-list-create')
         data = {
@@ -230,10 +380,15 @@ class OrderAPITest(APITestCase):
             'amount': 100000.00,
             'status': 'pending'
         }
-        response = self.client.post(url, data, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Order.objects.count(), 1)
-        mock_send_order_notification.assert_called_once()
+        mock_send_order_notification.delay.assert_called_once_with(
+            Order.objects.get(id=response.data['id']).id)
+        self.assertEqual(Notification.objects.filter(
+            order_id=response.data['id'],
+            status=Notification.NotificationStatus.QUEUED).count(), 1)
         self.assertEqual(
             Order.objects.get(id=response.data['id']).customer, self.customer)
         self.assertEqual(
@@ -248,3 +403,1846 @@ class OrderAPITest(APITestCase):
         self.application.delete()
         self.access_token.delete()
         return super().tearDown()
+
+
+class DetailCacheTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        self.order = Order.objects.create(customer=self.customer,
+                                          item='Laptop', amount=100000.00,
+                                          status='pending')
+        self.customer_url = reverse('customer-detail',
+                                    args=[self.customer.id])
+        self.order_url = reverse('order-detail', args=[self.order.id])
+
+    def app_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in queries
+                          if 'FROM "app_' in query['sql']]
+
+    def test_cached_detail_skips_the_database(self):
+        for url in (self.customer_url, self.order_url):
+            with self.subTest(url=url):
+                first, queries = self.app_queries(url)
+                self.assertTrue(queries)
+                second, queries = self.app_queries(url)
+                self.assertEqual(queries, [])
+                self.assertEqual(second.data, first.data)
+
+    def test_customer_update_refreshes_embedded_customer_details(self):
+        self.app_queries(self.order_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.customer_url,
+                                         {'name': 'Johnny Doe'},
+                                         format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response, _ = self.app_queries(self.order_url)
+        self.assertEqual(response.data['customer_details']['name'],
+                         'Johnny Doe')
+        response, _ = self.app_queries(self.customer_url)
+        self.assertEqual(response.data['name'], 'Johnny Doe')
+
+    def test_order_delete_invalidates_cache(self):
+        self.app_queries(self.order_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.delete()
+        response = self.client.get(self.order_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_fill_racing_an_invalidation_is_not_served(self):
+        def render():
+            # The write commits after this fill read the row
+            Customer.objects.filter(pk=self.customer.pk).update(
+                name='Johnny Doe')
+            api_cache.invalidate('customer', self.customer.pk)
+            return {'name': 'John Doe'}
+
+        stale = api_cache.get_customer(self.customer.pk, 'v1', render)
+        self.assertEqual(stale['name'], 'John Doe')
+
+        response, _ = self.app_queries(self.customer_url)
+        self.assertEqual(response.data['name'], 'Johnny Doe')
+
+    @override_settings(API_CACHE_LOCK_TIMEOUT=1)
+    def test_waiters_do_not_render_while_the_lock_is_held(self):
+        key = api_cache.cache_key('customer', self.customer.pk, 'v1')
+        cache.add(f'{key}:lock', 'holder', timeout=60)
+        renders = []
+
+        def render():
+            renders.append(True)
+            return {'name': 'John Doe'}
+
+        def fill():
+            time.sleep(1.5)
+            cache.set(key, {'name': 'Filled'})
+
+        holder = threading.Thread(target=fill)
+        holder.start()
+        value = api_cache.get_or_render(key, render, 'customer')
+        holder.join()
+        self.assertEqual(value, {'name': 'Filled'})
+        self.assertEqual(renders, [])
+
+    @override_settings(API_CACHE_LOCK_TIMEOUT=1)
+    def test_lapsed_lock_is_taken_over_by_one_waiter(self):
+        key = api_cache.cache_key('customer', self.customer.pk, 'v1')
+        cache.add(f'{key}:lock', 'holder', timeout=1)
+        renders = []
+
+        def render():
+            renders.append(True)
+            time.sleep(0.3)
+            return {'name': 'John Doe'}
+
+        values = []
+        waiters = [threading.Thread(
+            target=lambda: values.append(
+                api_cache.get_or_render(key, render, 'customer')))
+            for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        for waiter in waiters:
+            waiter.join()
+        self.assertEqual(values, [{'name': 'John Doe'}] * 3)
+        self.assertEqual(len(renders), 1)
+
+
+class OrderPaginationTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        Order.objects.bulk_create([
+            Order(customer=customer, item=f'Item {i}', amount=100,
+                  status='pending')
+            for i in range(25)
+        ])
+
+    def test_cursor_pages_cover_every_order_once(self):
+        response = self.client.get(reverse('order-list-create'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        first = response.data['results']
+
+        response = self.client.get(response.data['next'])
+        second = response.data['results']
+        self.assertIsNone(response.data['next'])
+
+        self.assertEqual((len(first), len(second)), (20, 5))
+        ids = [order['id'] for order in first + second]
+        self.assertEqual(len(set(ids)), 25)
+        dates = [order['order_date'] for order in first + second]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_page_number_mode_is_opt_in(self):
+        response = self.client.get(reverse('order-list-create'),
+                                   {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class OrderFilterTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.john = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        self.jane = Customer.objects.create(
+            name='Jane Doe',
+            phone_number='+254722000002',
+            email='jane.doe@example.com',
+            code='CUST002',
+            customer_id='CUST002'
+        )
+        for customer, amount, order_status in (
+                (self.john, 100, 'pending'), (self.john, 500, 'completed'),
+                (self.jane, 1000, 'pending'), (self.jane, 5000, 'cancelled')):
+            Order.objects.create(customer=customer, item='Laptop',
+                                 amount=amount, status=order_status)
+
+    def amounts(self, params):
+        response = self.client.get(reverse('order-list-create'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(float(order['amount'])
+                      for order in response.data['results'])
+
+    def test_filters(self):
+        cases = [
+            ({'status': 'pending'}, [100, 1000]),
+            ({'customer': self.jane.id}, [1000, 5000]),
+            ({'customer_code': 'CUST001'}, [100, 500]),
+            ({'amount_min': '500', 'amount_max': '1000'}, [500, 1000]),
+            ({'customer_code': 'CUST002', 'status': 'pending'}, [1000]),
+            ({'order_date_before': '2000-01-01'}, []),
+        ]
+        for params, expected in cases:
+            with self.subTest(params=params):
+                self.assertEqual(self.amounts(params), expected)
+
+    def test_async_list_applies_filters(self):
+        response = self.client.get(reverse('async-order-list-create'),
+                                   {'status': 'cancelled'})
+        self.assertEqual([order['amount'] for order in
+                          response.data['results']], ['5000.00'])
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({'status': 'lost'}, {'customer': 'abc'},
+                       {'amount_min': '10', 'amount_max': '5'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('order-list-create'),
+                                           params)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_use_indexes(self):
+        # SQLite's planner picks these even on a handful of rows
+        cases = [
+            ({'customer_id': self.john.id}, 'order_customer_date_idx'),
+            ({'customer__code': 'CUST001'}, 'order_customer_date_idx'),
+            ({'status': 'completed'}, 'order_status_date_idx'),
+            ({'amount__gte': 100, 'amount__lte': 500}, 'order_amount_idx'),
+        ]
+        for filters, index in cases:
+            with self.subTest(filters=filters):
+                plan = (order_queryset.filter(**filters)
+                        .order_by('-order_date', 'id')[:20].explain())
+                self.assertIn(index, plan)
+
+
+class CustomerSearchTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Customer.objects.create(
+            name='Wanjiru Kamau',
+            phone_number='0722000001',
+            email='wanjiru@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        Customer.objects.create(
+            name='Otieno Ochieng',
+            phone_number='+254733000002',
+            email='otieno@example.org',
+            code='CUST002',
+            customer_id='CUST002'
+        )
+
+    def search(self, term, url='customer-list-create'):
+        response = self.client.get(reverse(url), {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(customer['code']
+                      for customer in response.data['results'])
+
+    def test_phone_numbers_are_normalized(self):
+        self.assertEqual(
+            list(Customer.objects.order_by('code').values_list(
+                'phone_normalized', flat=True)),
+            ['254722000001', '254733000002'])
+        self.assertEqual(normalize_phone('0722 000-001'), '254722000001')
+        self.assertEqual(normalize_phone('+254722000001'), '254722000001')
+
+    def test_phone_rule_matches_sms_recipients(self):
+        Customer.objects.create(
+            name='Akinyi', phone_number='722000003',
+            email='akinyi@example.com', code='CUST003',
+            customer_id='CUST003')
+        for customer in Customer.objects.all():
+            with self.subTest(phone_number=customer.phone_number):
+                recipient = normalize_phone_number(customer.phone_number)
+                self.assertEqual(customer.phone_normalized, recipient[1:])
+                self.assertEqual(
+                    normalize_phone(customer.phone_number), recipient[1:])
+        self.assertEqual(self.search('722000003'), ['CUST003'])
+
+    def test_search(self):
+        cases = [
+            ('0722', ['CUST001']),
+            ('+254722', ['CUST001']),
+            ('0733000002', ['CUST002']),
+            ('2547', ['CUST001', 'CUST002']),
+            ('wanjiru@', ['CUST001']),
+            ('OTIENO@EXAMPLE', ['CUST002']),
+            ('kamau', ['CUST001']),
+            ('example.com', []),
+            ('000', []),
+        ]
+        for term, expected in cases:
+            with self.subTest(term=term):
+                self.assertEqual(self.search(term), expected)
+
+    def test_async_list_searches(self):
+        self.assertEqual(self.search('ochieng', 'async-customer-list-create'),
+                         ['CUST002'])
+
+    def test_short_search_is_rejected(self):
+        response = self.client.get(reverse('customer-list-create'),
+                                   {'search': 'ab'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderRollupTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        self.today = timezone.localdate()
+
+    def create_order(self, amount, order_status='pending'):
+        response = self.client.post(reverse('order-list-create'), {
+            'customer_code': 'CUST001', 'item': 'Laptop',
+            'amount': amount, 'status': order_status}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def assertRollupsMatchOrders(self):
+        expected = rollups.aggregate_orders(self.today - timedelta(days=1),
+                                            self.today + timedelta(days=1))
+        self.assertEqual(
+            {(row.day, row.status, row.customer_id):
+             (row.order_count, row.revenue)
+             for row in CustomerOrderRollup.objects.all()},
+            expected)
+        daily = {}
+        for (day, order_status, _), (count, revenue) in expected.items():
+            total = daily.get((day, order_status), (0, 0))
+            daily[day, order_status] = (total[0] + count,
+                                        total[1] + revenue)
+        self.assertEqual(
+            {(row.day, row.status): (row.order_count, row.revenue)
+             for row in OrderRollup.objects.all()},
+            daily)
+
+    def test_rollups_follow_order_writes(self):
+        order_id = self.create_order('100.00')
+        self.create_order('250.50')
+        self.assertRollupsMatchOrders()
+        self.assertEqual(CustomerOrderRollup.objects.get().order_count, 2)
+
+        url = reverse('order-detail', args=[order_id])
+        for change in ({'status': 'cancelled'}, {'amount': '80.00'}):
+            response = self.client.patch(url, change, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertRollupsMatchOrders()
+
+        self.client.delete(url)
+        self.assertRollupsMatchOrders()
+        for model in (OrderRollup, CustomerOrderRollup):
+            self.assertFalse(model.objects.filter(
+                status='cancelled').exists())
+
+    def test_update_locks_the_order_it_replaces(self):
+        order_id = self.create_order('100.00')
+        select_for_update = QuerySet.select_for_update
+        locked_in = []
+
+        def spy(queryset, *args, **kwargs):
+            locked_in.append(len(connection.atomic_blocks))
+            return select_for_update(queryset, *args, **kwargs)
+
+        outer = len(connection.atomic_blocks)
+        with patch.object(QuerySet, 'select_for_update', autospec=True,
+                          side_effect=spy):
+            response = self.client.patch(
+                reverse('order-detail', args=[order_id]),
+                {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Read under a lock, in a transaction of the update's own
+        self.assertEqual(len(locked_in), 1)
+        self.assertGreater(locked_in[0], outer)
+        self.assertRollupsMatchOrders()
+
+    def test_bulk_create_updates_rollups(self):
+        response = self.client.post(
+            reverse('order-bulk-create'),
+            [{'customer_code': 'CUST001', 'item': 'Phone',
+              'amount': '10.00', 'status': 'completed'}] * 3,
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertRollupsMatchOrders()
+
+    def test_deleting_customer_empties_rollups(self):
+        self.create_order('100.00')
+        self.customer.delete()
+        self.assertFalse(OrderRollup.objects.exists())
+        self.assertFalse(CustomerOrderRollup.objects.exists())
+
+    def test_rebuild(self):
+        self.create_order('100.00')
+        self.create_order('20.00', 'completed')
+        OrderRollup.objects.filter(status='pending').delete()
+        CustomerOrderRollup.objects.create(
+            day=self.today - timedelta(days=1), status='pending',
+            customer=self.customer, order_count=5, revenue=500)
+        call_command('rebuild_order_rollups', stdout=io.StringIO())
+        self.assertRollupsMatchOrders()
+
+    def test_stats(self):
+        self.create_order('100.00')
+        self.create_order('20.00', 'completed')
+        self.create_order('999.00', 'cancelled')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('order-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totals'],
+                         {'orders': 3, 'revenue': '120.00'})
+        self.assertEqual(
+            {row['status']: row['revenue']
+             for row in response.data['by_status']},
+            {'cancelled': '999.00', 'completed': '20.00',
+             'pending': '100.00'})
+        self.assertEqual(response.data['daily'], [
+            {'day': self.today.isoformat(), 'orders': 2,
+             'revenue': '120.00'}])
+        self.assertEqual(response.data['top_customers'], [
+            {'customer': self.customer.id, 'code': 'CUST001',
+             'name': 'John Doe', 'orders': 2, 'revenue': '120.00'}])
+
+        response = self.client.get(reverse('order-stats'), {
+            'date_to': (self.today - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.data['totals'],
+                         {'orders': 0, 'revenue': '0.00'})
+
+    def test_invalid_range_is_rejected(self):
+        for params in ({'date_from': '2026-02-01', 'date_to': '2026-01-01'},
+                       {'date_from': '2020-01-01', 'date_to': '2026-01-01'},
+                       {'top': 0}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('order-stats'), params)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+
+
+class CustomerSummaryTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+
+    def create_order(self, amount, order_status='pending'):
+        response = self.client.post(reverse('order-list-create'), {
+            'customer_code': 'CUST001', 'item': 'Laptop',
+            'amount': amount, 'status': order_status}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Order.objects.get(pk=response.data['id'])
+
+    def summary(self):
+        summary = CustomerSummary.objects.get(customer=self.customer)
+        return (summary.order_count, summary.total_spent,
+                summary.last_order_date)
+
+    def test_summary_follows_order_writes(self):
+        self.assertEqual(self.summary(), (0, 0, None))
+        first = self.create_order('100.00')
+        second = self.create_order('50.00')
+        self.assertEqual(self.summary(), (2, 150, second.order_date))
+
+        url = reverse('order-detail', args=[first.id])
+        self.client.patch(url, {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.summary(), (2, 50, second.order_date))
+
+        self.client.delete(reverse('order-detail', args=[second.id]))
+        self.assertEqual(self.summary(), (1, 0, first.order_date))
+
+    def test_bulk_created_customer_gets_summary(self):
+        CustomerSummary.objects.all().delete()
+        response = self.client.post(
+            reverse('order-bulk-create'),
+            [{'customer_code': 'CUST001', 'item': 'Phone',
+              'amount': '10.00', 'status': 'completed'}] * 2,
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.summary()[:2], (2, 20))
+
+    def test_reconcile_fixes_drift(self):
+        order = self.create_order('100.00')
+        other = Customer.objects.create(
+            name='Jane Doe', phone_number='+254722000002',
+            email='jane.doe@example.com', code='CUST002',
+            customer_id='CUST002')
+        CustomerSummary.objects.filter(customer=self.customer).update(
+            order_count=7, total_spent=1)
+        CustomerSummary.objects.filter(customer=other).delete()
+
+        self.assertEqual(reconcile_customer_summaries(chunk_size=1), 2)
+        self.assertEqual(self.summary(), (1, 100, order.order_date))
+        self.assertEqual(CustomerSummary.objects.get(
+            customer=other).order_count, 0)
+        self.assertEqual(reconcile_customer_summaries(), 0)
+
+    def test_include_summary(self):
+        self.create_order('100.00')
+        url = reverse('customer-list-create')
+        customer = self.client.get(url).data['results'][0]
+        self.assertNotIn('summary', customer)
+
+        for name in ('customer-list-create', 'async-customer-list-create'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name),
+                                           {'include': 'summary'})
+                summary = response.data['results'][0]['summary']
+                self.assertEqual((summary['order_count'],
+                                  summary['total_spent']), (1, '100.00'))
+
+        detail = reverse('customer-detail', args=[self.customer.id])
+        self.client.get(detail)
+        self.create_order('20.00')
+        response = self.client.get(detail, {'include': 'summary'})
+        self.assertEqual(response.data['summary']['order_count'], 2)
+
+
+class SparseFieldsTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        for amount in (100, 200, 300):
+            Order.objects.create(customer=self.customer, item='Laptop',
+                                 amount=amount, status='pending')
+
+    def results(self, name, params=None, *args):
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def test_sparse_list_matches_full_list(self):
+        full = self.results('order-list-create')
+        for name in ('order-list-create', 'async-order-list-create'):
+            with self.subTest(name=name):
+                sparse = self.results(name, {'fields': 'id,amount,status'})
+                self.assertEqual(sparse, [
+                    {'id': order['id'], 'amount': order['amount'],
+                     'status': order['status']} for order in full])
+
+                expanded = self.results(name, {'fields': 'id,customer',
+                                               'expand': 'customer'})
+                self.assertEqual(expanded, [
+                    {'id': order['id'], 'customer': order['customer'],
+                     'customer_details': order['customer_details']}
+                    for order in full])
+
+    def test_sparse_list_selects_only_needed_columns(self):
+        self.client.get(reverse('order-list-create'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('order-list-create'),
+                            {'fields': 'id,status'})
+        order_queries = [query['sql'] for query in queries
+                         if 'FROM "app_order"' in query['sql']]
+        self.assertEqual(len(order_queries), 1)
+        self.assertNotIn('"item"', order_queries[0])
+        self.assertNotIn('app_customer', order_queries[0])
+
+    def test_sparse_list_paginates(self):
+        expected = [order['id'] for order in self.results('order-list-create')]
+        with patch.object(OrderPagination, 'page_size', 2):
+            for params in ({'fields': 'id'}, {'fields': 'id', 'page': 1}):
+                with self.subTest(params=params):
+                    ids, url = [], reverse('order-list-create')
+                    while url:
+                        response = self.client.get(url, params)
+                        ids += [order['id']
+                                for order in response.data['results']]
+                        url, params = response.data['next'], None
+                    self.assertEqual(ids, expected)
+
+    def test_sparse_detail(self):
+        order = Order.objects.first()
+        response = self.client.get(
+            reverse('order-detail', args=[order.id]),
+            {'fields': 'id,amount'})
+        self.assertEqual(response.data, {'id': str(order.id),
+                                         'amount': f'{order.amount:.2f}'})
+
+        response = self.client.get(
+            reverse('customer-detail', args=[self.customer.id]),
+            {'fields': 'code', 'include': 'summary'})
+        self.assertEqual(response.data['code'], 'CUST001')
+        self.assertEqual(response.data['summary']['order_count'], 3)
+        self.assertEqual(list(response.data), ['code', 'summary'])
+
+    def test_sparse_customer_list_keeps_summary(self):
+        customers = self.results('customer-list-create',
+                                 {'fields': 'id,name', 'include': 'summary'})
+        self.assertEqual(list(customers[0]), ['id', 'name', 'summary'])
+        customers = self.results('customer-list-create', {'fields': 'name'})
+        self.assertEqual(customers, [{'name': 'John Doe'}])
+
+    def test_invalid_fields_are_rejected(self):
+        for params in ({'fields': 'id,secret'}, {'fields': ''},
+                       {'fields': 'customer_details'},
+                       {'fields': 'id', 'expand': 'orders'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('order-list-create'),
+                                           params)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+
+
+class ORJSONTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(
+            name='Zoë Wanjirū \u2028',
+            phone_number='+254722000001',
+            email='zoe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        for amount in ('100.00', '249.99', '0.01'):
+            Order.objects.create(customer=self.customer, item='Laptop',
+                                 amount=amount, status='pending')
+
+    def test_responses_match_json_renderer(self):
+        for name, params in (('order-list-create', {}),
+                             ('customer-list-create', {'include': 'summary'}),
+                             ('order-stats', {})):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name), params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIsInstance(response.accepted_renderer,
+                                      ORJSONRenderer)
+                self.assertEqual(response.content,
+                                 JSONRenderer().render(response.data))
+
+    def test_native_values_match_json_renderer(self):
+        nairobi = zoneinfo.ZoneInfo('Africa/Nairobi')
+        values = [
+            uuid.uuid4(), Decimal('1234.50'), Decimal('0.00001'),
+            datetime(2025, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc),
+            datetime(2025, 1, 2, 3, 4, 5, 678, tzinfo=nairobi),
+            datetime(2025, 1, 2, 3, 4, 5), date(2025, 1, 2),
+            timedelta(minutes=5), Order.OrderStatus.PENDING,
+            gettext_lazy('Not found.'), 'line\u2028break\u2029',
+            {1: 'non-string key'}, 2 ** 70, None, True, 1.5,
+            5.2e-05, -1.25e-07, 1.25e-10, 1e16, '0.00001 1e-5',
+        ]
+        for value in values:
+            with self.subTest(value=value):
+                data = {'value': value, 'list': [value]}
+                self.assertEqual(ORJSONRenderer().render(data),
+                                 JSONRenderer().render(data))
+        data = {'value': 'x'}
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'))
+
+    def test_parser_matches_json_parser(self):
+        for body in (b'{"amount": "10.50", "customer": 1, "items": [1.5]}',
+                     b'{"big": 123456789012345678901234567890}',
+                     b'"\\ud800"', '{"name": "Zo\u00eb"}'.encode()):
+            with self.subTest(body=body):
+                self.assertEqual(ORJSONParser().parse(io.BytesIO(body)),
+                                 JSONParser().parse(io.BytesIO(body)))
+        for body in (b'{"amount": ', b'NaN', b''):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as expected:
+                    JSONParser().parse(io.BytesIO(body))
+                with self.assertRaises(ParseError) as parsed:
+                    ORJSONParser().parse(io.BytesIO(body))
+                self.assertEqual(str(parsed.exception),
+                                 str(expected.exception))
+
+    def test_post_is_parsed_with_orjson(self):
+        response = self.client.post(reverse('order-list-create'), {
+            'customer_code': 'CUST001', 'item': 'Phone',
+            'amount': '12.50', 'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsInstance(response.renderer_context['request']
+                              .parsers[0], ORJSONParser)
+        self.assertEqual(response.data['amount'], '12.50')
+
+
+class IdempotencyTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        self.order = {'customer_code': 'CUST001', 'item': 'Laptop',
+                      'amount': '100.00', 'status': 'pending'}
+
+    def post(self, name, data, key='key-1'):
+        return self.client.post(reverse(name), data, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    @patch('app.tasks.outbox.send_order_notification')
+    def test_retry_replays_response(self, mock_send):
+        for name in ('order-list-create', 'async-order-list-create'):
+            with self.subTest(name=name):
+                with self.captureOnCommitCallbacks(execute=True):
+                    first = self.post(name, self.order, key=name)
+                    retry = self.post(name, self.order, key=name)
+                self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(retry.content, first.content)
+                self.assertEqual(retry['Idempotent-Replayed'], 'true')
+                self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(mock_send.delay.call_count, 2)
+
+    def test_customer_retry_replays_response(self):
+        customer = {'name': 'Jane Doe', 'code': 'CUST002',
+                    'customer_id': 'CUST002',
+                    'phone_number': '+254722000002',
+                    'email': 'jane.doe@example.com'}
+        first = self.post('customer-list-create', customer)
+        retry = self.post('customer-list-create', customer)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Customer.objects.filter(code='CUST002').count(), 1)
+
+    def test_key_reused_for_other_request_is_rejected(self):
+        self.post('order-list-create', self.order)
+        response = self.post('order-list-create',
+                             {**self.order, 'amount': '200.00'})
+        self.assertEqual(response.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        response = self.post('customer-list-create', self.order)
+        self.assertEqual(response.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_request_in_progress_conflicts(self):
+        self.post('order-list-create', self.order)
+        IdempotencyKey.objects.update(
+            status_code=None, response='',
+            expires_at=timezone.now() + timedelta(seconds=60))
+        response = self.post('order-list-create', self.order)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # Until the request holding the key is presumed dead
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        response = self.post('order-list-create', self.order)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_failed_request_releases_key(self):
+        response = self.post('order-list-create',
+                             {**self.order, 'customer_code': 'MISSING'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        response = self.post('order-list-create', self.order)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_response_is_kept_with_the_create(self):
+        views = {'order-list-create': 'OrderListCreateView',
+                 'async-order-list-create': 'AsyncOrderListCreateView'}
+        for name, view in views.items():
+            with self.subTest(name=name):
+                # The request dies before replying: any order it saved
+                # has its response kept, so the retry can't save another
+                with patch(f'app.views.orders.views.{view}'
+                           '.get_success_headers', side_effect=RuntimeError):
+                    with self.assertRaises(RuntimeError):
+                        self.post(name, self.order, key=name)
+                self.assertEqual(
+                    Order.objects.count(),
+                    IdempotencyKey.objects.filter(
+                        status_code=status.HTTP_201_CREATED).count())
+                retry = self.post(name, self.order, key=name)
+                self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 2)
+
+        # And the order isn't saved when its response can't be
+        with patch('app.idempotency.complete', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.post('order-list-create', self.order, key='lost')
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.filter(key='lost').exists())
+
+    def test_expired_keys(self):
+        self.post('order-list-create', self.order)
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        response = self.post('order-list-create', self.order)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(purge_idempotency_keys(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_invalid_key(self):
+        response = self.post('order-list-create', self.order, key='x' * 256)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Idempotency-Key', response.data)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderExportTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        for i, order_status in enumerate(['pending', 'completed',
+                                          'pending']):
+            Order.objects.create(customer=customer, item=f'Item {i}',
+                                 amount='10.50', status=order_status)
+        Order.objects.filter(item='Item 0').update(
+            order_date=timezone.now() - timedelta(days=10))
+
+    def export(self, **params):
+        response = self.client.get(reverse('order-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export_with_filters(self):
+        rows = [json.loads(line) for line in self.export(
+            status='pending',
+            order_date_after=(timezone.now() - timedelta(days=1)).date()
+        ).splitlines()]
+        self.assertEqual([row['item'] for row in rows], ['Item 2'])
+        self.assertEqual(rows[0]['customer_code'], 'CUST001')
+        self.assertEqual(rows[0]['amount'], '10.50')
+
+    def test_csv_export(self):
+        rows = list(csv.DictReader(io.StringIO(
+            self.export(file_format='csv'))))
+        self.assertEqual([row['item'] for row in rows],
+                         ['Item 0', 'Item 1', 'Item 2'])
+        self.assertEqual(rows[0]['status'], 'pending')
+
+    def test_export_reads_orders_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.export()
+        self.assertEqual(len([query for query in queries
+                              if 'FROM "app_order"' in query['sql']]), 1)
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(reverse('order-export'),
+                                   {'status': 'shipped'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderBulkAPITest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(1, 4):
+            Customer.objects.create(
+                name=f'Customer {i}',
+                phone_number=f'+25472200000{i}',
+                email=f'customer{i}@example.com',
+                code=f'CUST00{i}',
+                customer_id=f'CUST00{i}'
+            )
+
+    def orders(self, count, code='CUST001'):
+        return [{'customer_code': code, 'item': f'Item {i}',
+                 'amount': '100.00', 'status': 'pending'}
+                for i in range(count)]
+
+    @patch('app.tasks.outbox.send_notification_batch')
+    def test_bulk_creation_reports_rejected_items(self, mock_batch):
+        data = self.orders(1) + self.orders(1, code='MISSING') + [
+            {'customer_code': 'CUST002', 'item': 'Phone',
+             'amount': 'free', 'status': 'pending'},
+        ] + self.orders(1, code='CUST003')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order-bulk-create'), data,
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([order['index'] for order in response.data['orders']],
+                         [0, 3])
+        self.assertEqual([error['index'] for error in response.data['errors']],
+                         [1, 2])
+        self.assertIn('customer_code', response.data['errors'][0]['errors'])
+        self.assertIn('amount', response.data['errors'][1]['errors'])
+
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        # One batch job for the whole request
+        mock_batch.delay.assert_called_once_with()
+
+    @patch('app.tasks.outbox.send_notification_batch')
+    def test_bulk_queries_do_not_grow_with_orders(self, mock_batch):
+        url = reverse('order-bulk-create')
+        # Warm the access token cache so both counts are alike
+        self.client.get(reverse('order-list-create'))
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, self.orders(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(url, self.orders(50), format='json')
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Order.objects.count(), 52)
+
+    @patch('app.tasks.outbox.send_notification_batch')
+    def test_bulk_customer_codes_are_cleaned_like_single(self, mock_batch):
+        data = self.orders(1, code=' CUST002 ') + [
+            {'customer_code': True, 'item': 'Phone', 'amount': '1.00',
+             'status': 'pending'}]
+        response = self.client.post(reverse('order-bulk-create'), data,
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(Order.objects.get().customer.code, 'CUST002')
+        self.assertIn('customer_code', response.data['errors'][0]['errors'])
+
+    def test_bulk_rejects_non_list_payload(self):
+        response = self.client.post(reverse('order-bulk-create'),
+                                    self.orders(1)[0], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NotificationOutboxTest(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+        self.order = Order.objects.create(
+            customer=self.customer,
+            item='Laptop',
+            amount=100000.00,
+            status='pending'
+        )
+        self.notification = Notification.objects.create(
+            order=self.order,
+            phone_number=self.customer.phone_number,
+            message='Order received'
+        )
+
+    @patch('app.tasks.outbox.send_order_notification')
+    def test_broker_failure_leaves_notification_queued(
+            self, mock_send_order_notification):
+        from app.tasks.outbox import dispatch_order_notification
+
+        mock_send_order_notification.delay.side_effect = ConnectionError()
+        dispatch_order_notification(self.order.id)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status,
+                         Notification.NotificationStatus.QUEUED)
+
+    @patch('app.tasks.tasks.SMSService.__init__', return_value=None)
+    @patch('app.tasks.tasks.SMSService.send_bulk')
+    def test_drain_sends_undispatched_notifications(self, mock_send_bulk,
+                                                    mock_init):
+        mock_send_bulk.return_value = {'+254722000001': 'Success'}
+        Notification.objects.update(
+            created_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(drain_notification_outbox(), 1)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status,
+                         Notification.NotificationStatus.SENT)
+        self.assertEqual(self.notification.attempts, 1)
+        mock_send_bulk.assert_called_once_with(['+254722000001'],
+                                               'Order received')
+
+        # Already sent rows are never picked up again
+        self.assertEqual(drain_notification_outbox(), 0)
+
+    @patch('app.tasks.tasks.SMSService')
+    def test_drain_skips_recent_notifications(self, mock_sms_service):
+        self.assertEqual(drain_notification_outbox(), 0)
+        mock_sms_service.assert_not_called()
+
+    @patch('app.tasks.tasks.SMSService.__init__', return_value=None)
+    @patch('app.tasks.tasks.SMSService.send_bulk')
+    def test_failed_send_is_retried_with_backoff(self, mock_send_bulk,
+                                                 mock_init):
+        mock_send_bulk.side_effect = [
+            {'+254722000001': 'InternalServerError'},
+            ConnectionError('Gateway down'),
+            {'+254722000001': 'Success'},
+        ]
+        with self.assertRaises(NotificationRetry):
+            send_order_notification(self.order.id)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status,
+                         Notification.NotificationStatus.FAILED)
+        self.assertEqual(self.notification.last_error,
+                         'Rejected by gateway: InternalServerError')
+        self.assertGreater(self.notification.next_attempt_at, timezone.now())
+        self.assertLessEqual(
+            self.notification.next_attempt_at, timezone.now() + timedelta(
+                seconds=settings.NOTIFICATION_RETRY_BACKOFF))
+
+        # Retried by the task itself, or by the drain once due
+        with self.assertRaises(NotificationRetry):
+            send_order_notification(self.order.id)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.last_error,
+                         'Gateway error: Gateway down')
+        self.assertEqual(drain_notification_outbox(), 0)
+        Notification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_notification_outbox(), 1)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status,
+                         Notification.NotificationStatus.SENT)
+        self.assertEqual(self.notification.attempts, 3)
+
+    @patch('celery.utils.time.random.randrange', return_value=0)
+    def test_retry_is_never_due_at_once(self, mock_randrange):
+        self.assertEqual(retry_delay(1), 1)
+        mock_randrange.assert_called_once()
+
+    @patch('app.tasks.tasks.SMSService.__init__', return_value=None)
+    @patch('app.tasks.tasks.SMSService.send_bulk')
+    def test_notification_dies_after_last_attempt(self, mock_send_bulk,
+                                                  mock_init):
+        mock_send_bulk.return_value = {'+254722000001': 'GatewayError'}
+        # Celery retries the task until the notification is out of attempts
+        result = send_order_notification.apply(args=[self.order.id])
+        self.assertTrue(result.successful())
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status,
+                         Notification.NotificationStatus.DEAD)
+        self.assertEqual(self.notification.attempts,
+                         settings.NOTIFICATION_MAX_ATTEMPTS)
+        self.assertEqual(mock_send_bulk.call_count,
+                         settings.NOTIFICATION_MAX_ATTEMPTS)
+
+    @patch('app.tasks.tasks.SMSService.__init__', return_value=None)
+    @patch('app.tasks.tasks.SMSService.send_bulk')
+    def test_permanent_rejection_is_dead_at_once(self, mock_send_bulk,
+                                                 mock_init):
+        mock_send_bulk.return_value = {'+254722000001': 'UserInBlacklist'}
+        self.assertFalse(send_order_notification(self.order.id))
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status,
+                         Notification.NotificationStatus.DEAD)
+        self.assertEqual(self.notification.attempts, 1)
+
+    @patch('app.management.commands.redrive_notifications.'
+           'dispatch_notification_batch')
+    def test_redrive_requeues_dead_notifications(self, mock_dispatch):
+        Notification.objects.bulk_create([
+            Notification(order=self.order, phone_number='+254722000001',
+                         message='Order received',
+                         status=Notification.NotificationStatus.DEAD,
+                         attempts=3)
+            for _ in range(4)
+        ])
+        self.notification.status = Notification.NotificationStatus.DEAD
+        self.notification.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('redrive_notifications', batch_size=2, limit=3,
+                         stdout=io.StringIO())
+        queued = Notification.objects.filter(
+            status=Notification.NotificationStatus.QUEUED)
+        self.assertEqual(queued.count(), 3)
+        self.assertIn(self.notification, queued)
+        self.assertFalse(queued.exclude(attempts=0).exists())
+        self.assertEqual(mock_dispatch.call_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('redrive_notifications', stdout=io.StringIO())
+        self.assertFalse(Notification.objects.filter(
+            status=Notification.NotificationStatus.DEAD).exists())
+
+
+class BulkSMSTest(TestCase):
+    def setUp(self):
+        self.customers = [
+            Customer.objects.create(
+                name=f'Customer {i}',
+                phone_number=f'+25472200000{i}',
+                email=f'customer{i}@example.com',
+                code=f'CUST00{i}',
+                customer_id=f'CUST00{i}'
+            ) for i in range(1, 4)
+        ]
+        for customer in self.customers:
+            order = Order.objects.create(customer=customer, item='Laptop',
+                                         amount=100000.00, status='pending')
+            Notification.objects.create(order=order,
+                                        phone_number=customer.phone_number,
+                                        message='Flash sale order received')
+
+    @patch('app.tasks.sms_service.get_sms_client')
+    def test_send_bulk_reports_per_recipient_status(self, mock_get_client):
+        mock_get_client.return_value.send.return_value = {'SMSMessageData': {
+            'Recipients': [
+                {'number': '+254722000001', 'status': 'Success'},
+                {'number': '+254722000002', 'status': 'InvalidPhoneNumber'},
+            ]}}
+
+        statuses = SMSService().send_bulk(
+            ['0722000001', '+254722000002', '+254722000003'], 'Hello')
+        mock_get_client.return_value.send.assert_called_once_with(
+            'Hello', ['+254722000001', '+254722000002', '+254722000003'])
+        self.assertEqual(statuses, {
+            '+254722000001': 'Success',
+            '+254722000002': 'InvalidPhoneNumber',
+            '+254722000003': 'Failed',
+        })
+
+    @patch('app.tasks.sms_service.get_sms_client')
+    def test_invalid_number_is_left_out_of_the_call(self, mock_get_client):
+        mock_get_client.return_value.send.return_value = {'SMSMessageData': {
+            'Recipients': [
+                {'number': '+254722000001', 'status': 'Success'},
+                {'number': '+254722000002', 'status': 'Success'},
+            ]}}
+
+        # The SDK raises on a number like this, failing the whole call
+        statuses = SMSService().send_bulk(
+            ['0722000001', '+254 722 000 009', '+254722000002'], 'Hello')
+        mock_get_client.return_value.send.assert_called_once_with(
+            'Hello', ['+254722000001', '+254722000002'])
+        self.assertEqual(statuses, {
+            '+254722000001': 'Success',
+            '+254 722 000 009': 'InvalidPhoneNumber',
+            '+254722000002': 'Success',
+        })
+
+    @patch('app.tasks.tasks.SMSService.__init__', return_value=None)
+    @patch('app.tasks.tasks.SMSService.send_bulk')
+    def test_batch_retries_only_failed_recipients(self, mock_send_bulk,
+                                                  mock_init):
+        mock_send_bulk.return_value = {
+            '+254722000001': 'Success',
+            '+254722000002': 'Success',
+            '+254722000003': 'InternalServerError',
+        }
+        self.assertEqual(send_notification_batch(), 2)
+        # Identical messages share one provider call
+        mock_send_bulk.assert_called_once()
+
+        # The failed one waits for its backoff
+        mock_send_bulk.reset_mock()
+        self.assertEqual(send_notification_batch(), 0)
+        mock_send_bulk.assert_not_called()
+
+        Notification.objects.filter(
+            status=Notification.NotificationStatus.FAILED
+        ).update(next_attempt_at=timezone.now())
+        mock_send_bulk.return_value = {'+254722000003': 'Success'}
+        self.assertEqual(send_notification_batch(), 1)
+        mock_send_bulk.assert_called_once_with(['+254722000003'],
+                                               'Flash sale order received')
+        self.assertFalse(Notification.objects.exclude(
+            status=Notification.NotificationStatus.SENT).exists())
+
+    @patch('app.tasks.sms_service.get_sms_client')
+    def test_invalid_number_goes_dead_without_retries(self, mock_get_client):
+        mock_get_client.return_value.send.return_value = {'SMSMessageData': {
+            'Recipients': [
+                {'number': '+254722000001', 'status': 'Success'},
+                {'number': '+254722000002', 'status': 'Success'},
+            ]}}
+        bad = Notification.objects.get(phone_number='+254722000003')
+        bad.phone_number = '+254 722 000 003'
+        bad.save()
+
+        self.assertEqual(send_notification_batch(), 2)
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, Notification.NotificationStatus.DEAD)
+        self.assertEqual(bad.attempts, 1)
+        self.assertIsNone(bad.next_attempt_at)
+        self.assertIn('Invalid phone number', bad.last_error)
+        self.assertEqual(Notification.objects.filter(
+            status=Notification.NotificationStatus.SENT).count(), 2)
+
+    @patch('app.tasks.tasks.SMSService.__init__', return_value=None)
+    @patch('app.tasks.tasks.SMSService.send_bulk')
+    def test_batched_orders_share_a_provider_call(self, mock_send_bulk,
+                                                  mock_init):
+        Notification.objects.all().delete()
+        orders = list(Order.objects.select_related('customer'))
+        queue_bulk_order_notifications(orders[:2])
+        with override_settings(SMS_BATCH_WINDOW_SECONDS=5):
+            queue_order_notification(orders[2])
+        mock_send_bulk.return_value = {
+            customer.phone_number: 'Success' for customer in self.customers}
+
+        self.assertEqual(send_notification_batch(), 3)
+        mock_send_bulk.assert_called_once()
+        phone_numbers, message = mock_send_bulk.call_args.args
+        self.assertCountEqual(phone_numbers, [
+            customer.phone_number for customer in self.customers])
+        self.assertEqual(message, settings.ORDER_SMS_BATCH_TEMPLATE)
+
+    def test_orders_sent_alone_name_the_order(self):
+        order = Order.objects.select_related('customer').first()
+        message = build_order_message(order)
+        self.assertIn(str(order.id), message)
+        self.assertIn(order.customer.name, message)
+
+
+@override_settings(AFRICASTALKING_USERNAME='sandbox',
+                   AFRICASTALKING_API_KEY='test-key')
+class SMSClientTest(TestCase):
+    def setUp(self):
+        reset_sms_client()
+
+    def tearDown(self):
+        reset_sms_client()
+        return super().tearDown()
+
+    def test_client_is_shared_within_a_process(self):
+        client = get_sms_client()
+        self.assertIs(SMSService().sms, client)
+
+        with patch('app.tasks.sms_service.os.getpid', return_value=-1):
+            # A forked worker builds its own client
+            self.assertIsNot(get_sms_client(), client)
+
+    def test_requests_reuse_the_pooled_session(self):
+        client = get_sms_client()
+        with patch.object(client.session, 'request') as mock_request:
+            mock_request.return_value.status_code = 201
+            mock_request.return_value.headers = {
+                'content-type': 'application/json'}
+            mock_request.return_value.json.return_value = {
+                'SMSMessageData': {'Recipients': [
+                    {'number': '+254722000001', 'status': 'Success'}]}}
+
+            self.assertTrue(SMSService().send_sms('0722000001', 'Hello'))
+            self.assertTrue(SMSService().send_sms('0722000001', 'Hello'))
+
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(mock_request.call_args.kwargs['timeout'],
+                         client.timeout)
+
+    @override_settings(SMS_BACKEND='app.tasks.sms_service.FakeSMSGateway',
+                       SMS_FAKE_LATENCY=0, SMS_FAKE_ERROR_RATE=0)
+    def test_backend_is_configurable(self):
+        self.assertIsInstance(get_sms_client(), FakeSMSGateway)
+        self.assertTrue(SMSService().send_sms('0722000001', 'Hello'))
+        self.assertEqual(
+            SMSService().send_bulk(['0722000001', '+254722000002'], 'Hello'),
+            {'+254722000001': 'Success', '+254722000002': 'Success'})
+
+    @override_settings(SMS_BACKEND='app.tasks.sms_service.FakeSMSGateway',
+                       SMS_FAKE_LATENCY=0, SMS_FAKE_ERROR_RATE=1)
+    def test_fake_gateway_fails_at_its_error_rate(self):
+        self.assertFalse(SMSService().send_sms('0722000001', 'Hello'))
+        self.assertEqual(
+            SMSService().send_bulk(['0722000001'], 'Hello'),
+            {'+254722000001': 'InternalServerError'})
+
+
+class TaskRoutingTest(TestCase):
+    def queue(self, task):
+        return celery_app.amqp.router.route({}, task.name)['queue'].name
+
+    def test_tasks_are_routed_by_kind_of_work(self):
+        for task in (send_order_notification, send_notification_batch,
+                     drain_notification_outbox):
+            self.assertEqual(self.queue(task), 'notifications')
+        for task in (reconcile_customer_summaries, purge_idempotency_keys):
+            self.assertEqual(self.queue(task), 'analytics')
+        self.assertEqual(
+            celery_app.amqp.router.route({}, 'celery.ping')['queue'].name,
+            'default')
+
+    def test_tasks_are_acknowledged_after_running(self):
+        self.assertTrue(send_order_notification.acks_late)
+        self.assertTrue(celery_app.conf.task_reject_on_worker_lost)
+
+    def test_run_worker_uses_the_queue_profile(self):
+        out = io.StringIO()
+        with override_settings(WORKER_PROFILES={
+                'notifications': {'pool': 'threads', 'concurrency': 50,
+                                  'prefetch_multiplier': 4}}):
+            call_command('run_worker', 'notifications', '--dry-run',
+                         stdout=out)
+        self.assertEqual(out.getvalue().split(), [
+            'worker', '--queues', 'notifications',
+            '--hostname', 'notifications@%h', '--pool', 'threads',
+            '--concurrency', '50', '--prefetch-multiplier', '4',
+            '--loglevel', 'INFO'])
+
+    def test_run_worker_processes_are_workers(self):
+        self.assertEqual(
+            worker_queue(['manage.py', 'run_worker', 'notifications']),
+            'notifications')
+        self.assertIsNone(worker_queue(['manage.py', 'runserver']))
+        self.assertTrue(is_worker(['manage.py', 'run_worker', 'analytics']))
+        self.assertTrue(is_worker(['/usr/bin/celery', '-A', 'ta_celery']))
+        self.assertFalse(is_worker(['manage.py', 'runserver']))
+
+        # A connection for every thread
+        self.assertEqual(
+            worker_threads('notifications'),
+            settings.WORKER_PROFILES['notifications']['concurrency'])
+        self.assertEqual(worker_threads('analytics'), 1)
+        self.assertEqual(worker_threads(None), 1)
+
+
+class QueryCountTest(AuthenticatedAPITestCase):
+    """
+    Guards against N+1 queries: every list and detail endpoint under
+    app/views/, sync or async, must issue the same number of queries
+    however many rows it renders or relates to.
+    """
+    def seed(self, count):
+        start = Customer.objects.count()
+        for i in range(start, start + count):
+            customer = Customer.objects.create(
+                name=f'Customer {i}',
+                phone_number=f'+2547220{i:05d}',
+                email=f'customer{i}@example.com',
+                code=f'CUST{i:05d}',
+                customer_id=f'CUST{i:05d}'
+            )
+            Order.objects.create(customer=customer, item='Laptop',
+                                 amount=100000.00, status='pending')
+
+    def views(self, *bases):
+        for pattern in app_urls.urlpatterns:
+            view_class = getattr(pattern.callback, 'cls', None)
+            if view_class and issubclass(view_class, bases):
+                yield pattern
+
+    def list_urls(self):
+        for pattern in self.views(ListModelMixin, AsyncListCreateAPIView):
+            if not pattern.pattern.converters:
+                yield reverse(pattern.name)
+
+    def detail_urls(self, customer, order):
+        for pattern in self.views(RetrieveModelMixin,
+                                  AsyncRetrieveUpdateDestroyAPIView):
+            if 'customer' in pattern.name:
+                url = reverse(pattern.name, args=[customer.id])
+                yield from (url, url + '?include=summary')
+            else:
+                yield reverse(pattern.name, args=[order.id])
+
+    def count_queries(self, url):
+        if resolve(url.split('?')[0]).func.view_class.view_is_async:
+            get = async_to_sync(self.async_client.get)
+            headers = {'Authorization': 'Bearer test-token'}
+        else:
+            get, headers = self.client.get, None
+        with CaptureQueriesContext(connection) as queries:
+            response = get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        self.seed(1)
+        # Warm the access token cache so every count below is alike
+        self.client.get(reverse('customer-list-create'))
+        urls = [*self.list_urls(),
+                reverse('customer-list-create') + '?include=summary']
+        baseline = {url: self.count_queries(url) for url in urls}
+        self.assertIn(reverse('order-list-create'), baseline)
+        self.assertIn(reverse('async-order-list-create'), baseline)
+
+        self.seed(10)
+        for url, queries in baseline.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), queries)
+
+    def test_detail_queries_do_not_grow_with_related_rows(self):
+        self.seed(1)
+        customer, order = Customer.objects.get(), Order.objects.get()
+        self.client.get(reverse('customer-list-create'))
+
+        def count_uncached(url):
+            api_cache.invalidate('customer', customer.pk)
+            api_cache.invalidate('order', order.pk)
+            return self.count_queries(url)
+
+        urls = list(self.detail_urls(customer, order))
+        baseline = {url: count_uncached(url) for url in urls}
+        self.assertEqual(len(baseline), 6)
+
+        Order.objects.bulk_create([
+            Order(customer=customer, item=f'Item {i}', amount=100,
+                  status='pending')
+            for i in range(10)
+        ])
+        for url, queries in baseline.items():
+            with self.subTest(url=url):
+                self.assertEqual(count_uncached(url), queries)
+
+    def test_order_detail_fetches_customer_with_order(self):
+        self.seed(1)
+        url = reverse('order-detail', args=[Order.objects.get().id])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        order_queries = [query['sql'] for query in queries
+                         if 'FROM "app_order"' in query['sql']]
+        self.assertEqual(len(order_queries), 1)
+        self.assertIn('INNER JOIN "app_customer"', order_queries[0])
+        self.assertFalse(any('FROM "app_customer"' in query['sql']
+                             for query in queries))
+
+
+class AccessTokenCacheTest(AuthenticatedAPITestCase):
+    application_options = {'client_id': 'test-client',
+                           'client_secret': 'test-secret'}
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('customer-list-create')
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [query['sql'] for query in queries
+                          if 'FROM "oauth2_provider_accesstoken"'
+                          in query['sql']]
+
+    def test_cached_token_skips_the_database(self):
+        response, queries = self.token_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.token_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+
+    def test_cache_holds_no_secrets(self):
+        validator = CachedOAuth2Validator()
+        validator._load_access_token('test-token')
+        entry = cache.get(token_cache_key(self.access_token.token_checksum))
+        self.assertEqual(set(entry), {'id', 'scope', 'expires', 'user_id',
+                                      'application_id', 'user'})
+        self.assertNotIn('password', entry['user'])
+
+        with self.assertNumQueries(0):
+            access_token = validator._load_access_token('test-token')
+            self.assertTrue(access_token.is_valid(['read', 'write']))
+            self.assertEqual(access_token.user.pk, self.user.pk)
+            self.assertEqual(access_token.application.pk,
+                             self.application.pk)
+        # Read from the database when needed, as with .defer('password')
+        self.assertTrue(access_token.user.check_password('testpassword'))
+
+    def test_cached_token_authenticates_the_real_user(self):
+        self.user.is_staff = True
+        self.user.save()
+        metrics.reset()
+        for _ in range(2):
+            with patch('app.views.health.views.db_metrics',
+                       return_value={}) as mock_metrics:
+                response = self.client.get(reverse('health-db'))
+            user = response.wsgi_request.user
+            self.assertEqual(user.username, 'testuser')
+            self.assertTrue(user.is_staff)
+            self.assertIn('metrics', response.data)
+            mock_metrics.assert_called_once()
+        self.assertEqual(
+            metrics.snapshot()['counters']['cache.access_token.hit'], 1)
+
+    @override_settings(AUTHENTICATION_BACKENDS=[
+        'oauth2_provider.backends.OAuth2Backend',
+        'django.contrib.auth.backends.ModelBackend',
+    ], OAUTH2_TOKEN_CACHE_TIMEOUT=0)
+    def test_token_validated_once_per_request(self):
+        # Middleware and DRF authentication both verify the header
+        response, queries = self.token_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+
+    def test_cached_token_still_checks_scopes(self):
+        self.token_queries()
+        self.access_token.scope = 'read'
+        self.access_token.save()
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cache_timeout_capped_at_token_expiry(self):
+        self.access_token.expires = timezone.now() + timedelta(seconds=30)
+        self.access_token.save()
+        with patch('app.authentication.cache.set') as cache_set:
+            self.token_queries()
+        [token_set] = [call for call in cache_set.call_args_list
+                       if call.args[0].startswith('oauth2:')]
+        self.assertLessEqual(token_set.kwargs['timeout'], 30)
+
+    def test_revoke_invalidates_cached_token(self):
+        response, _ = self.token_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('oauth2_provider:revoke-token'), {
+                    'token': 'test-token',
+                    'client_id': 'test-client',
+                    'client_secret': 'test-secret',
+                })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response, _ = self.token_queries()
+        self.assertEqual(response.status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+
+class ThrottleTest(AuthenticatedAPITestCase):
+    def test_bucket_refills_over_the_period(self):
+        with patch('app.throttling.time.time', return_value=1000.0):
+            self.assertEqual([consume('bucket', 2, 60)[0] for _ in range(3)],
+                             [True, True, False])
+            self.assertEqual(consume('bucket', 2, 60)[1], 30.0)
+        with patch('app.throttling.time.time', return_value=1030.0):
+            self.assertEqual([consume('bucket', 2, 60)[0] for _ in range(2)],
+                             [True, False])
+
+    def test_concurrent_requests_never_exceed_limit(self):
+        allowed = []
+
+        def hammer():
+            for _ in range(20):
+                allowed.append(consume('shared', 50, 3600)[0])
+
+        threads = [threading.Thread(target=hammer) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 50)
+
+    def test_scope_limits_apply_per_endpoint_group(self):
+        with patch.dict(ScopedRateThrottle.THROTTLE_RATES,
+                        {'bulk': '2/minute'}):
+            url = reverse('order-export')
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code,
+                             status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn('Retry-After', response)
+
+            response = self.client.get(reverse('order-list-create'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AsyncViewTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(
+            name='John Doe',
+            phone_number='+254722000001',
+            email='john.doe@example.com',
+            code='CUST001',
+            customer_id='CUST001'
+        )
+
+    @override_settings(DATABASE_REPLICAS=['default'],
+                       DB_REPLICA_LAG_CHECK_SECONDS=0)
+    def test_replica_lag_is_checked_off_the_event_loop(self):
+        def replica_lag(alias):
+            # Queries the replica, as the PostgreSQL check does
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 0')
+            return 0.0
+
+        routers._lag_checks.clear()
+        self.addCleanup(routers._lag_checks.clear)
+        order = Order.objects.create(customer=self.customer, item='Laptop',
+                                     amount=100000.00, status='pending')
+        urls = [
+            reverse('async-customer-list-create') + '?search=John',
+            reverse('async-order-list-create'),
+            reverse('async-customer-detail', args=[self.customer.pk])
+            + '?include=summary',
+            reverse('async-order-detail', args=[order.pk]),
+        ]
+        with patch('app.routers.replica_lag',
+                   side_effect=replica_lag) as mock_lag:
+            for url in urls:
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code,
+                                     status.HTTP_200_OK)
+        self.assertTrue(mock_lag.called)
+
+    def test_async_lists_match_sync_lists(self):
+        Order.objects.create(customer=self.customer, item='Laptop',
+                             amount=100000.00, status='pending')
+        for name in ('customer-list-create', 'order-list-create'):
+            with self.subTest(name=name):
+                sync = self.client.get(reverse(name))
+                response = self.client.get(reverse(f'async-{name}'))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['results'],
+                                 sync.data['results'])
+
+    @patch('app.tasks.outbox.send_order_notification')
+    def test_async_order_creation_queues_notification(self, mock_send):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('async-order-list-create'), {
+                'customer_code': 'CUST001',
+                'item': 'Laptop',
+                'amount': 100000.00,
+                'status': 'pending'
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(id=response.data['id'])
+        self.assertEqual(order.customer, self.customer)
+        self.assertEqual(response.data['customer_details']['code'], 'CUST001')
+        self.assertEqual(Notification.objects.filter(order=order).count(), 1)
+        mock_send.delay.assert_called_once_with(order.id)
+
+    def test_async_validation_matches_sync(self):
+        invalid = [
+            ('customer-list-create', {'name': 'Jane', 'code': 'CUST001',
+                                      'phone_number': '+254722000002',
+                                      'email': 'jane@example.com',
+                                      'customer_id': 'CUST002'}),
+            ('order-list-create', {'customer_code': 'MISSING',
+                                   'item': 'Laptop', 'amount': 'x',
+                                   'status': 'pending'}),
+        ]
+        for name, data in invalid:
+            with self.subTest(name=name):
+                sync = self.client.post(reverse(name), data, format='json')
+                response = self.client.post(reverse(f'async-{name}'), data,
+                                            format='json')
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.data, sync.data)
+
+    def test_async_order_customer_code_is_cleaned_like_sync(self):
+        data = {'customer_code': ' CUST001 ', 'item': 'Laptop',
+                'amount': '100.00', 'status': 'pending'}
+        for name in ('order-list-create', 'async-order-list-create'):
+            with self.subTest(name=name):
+                response = self.client.post(reverse(name), data,
+                                            format='json')
+                self.assertEqual(response.status_code,
+                                 status.HTTP_201_CREATED)
+                self.assertEqual(response.data['customer'], self.customer.id)
+
+    def test_async_customer_detail_update_and_delete(self):
+        url = reverse('async-customer-detail', args=[self.customer.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['code'], 'CUST001')
+
+        response = self.client.patch(url, {'name': 'Johnny Doe'},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.name, 'Johnny Doe')
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Customer.objects.exists())
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_views_require_a_token(self):
+        self.client.credentials()
+        response = self.client.get(reverse('async-customer-list-create'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_views_served_on_the_event_loop(self):
+        url = reverse('async-order-detail', args=[
+            (await Order.objects.acreate(customer=self.customer,
+                                         item='Laptop', amount=100000.00,
+                                         status='pending')).id])
+        response = await self.async_client.get(
+            url, headers={'Authorization': 'Bearer test-token'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['customer_details']['code'],
+                         'CUST001')
+
+
+class DatabaseConnectionTest(APITestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_new_connections_are_timed(self):
+        conn = connection.get_new_connection(
+            connection.get_connection_params())
+        conn.close()
+        timing = db_metrics()['timings']['db.default.connect']
+        self.assertEqual(timing['count'], 1)
+
+    def test_pool_stats_report_saturation(self):
+        wrapper = load_backend('app.db.postgresql').DatabaseWrapper(
+            {**connection.settings_dict, 'ENGINE': 'app.db.postgresql'},
+            alias='pooled')
+        pool = ConnectionPool('', open=False, min_size=1, max_size=4)
+        with patch.dict(wrapper._connection_pools, {'pooled': pool}):
+            stats = wrapper.pool_stats()
+        self.assertEqual(stats['pool_max'], 4)
+        self.assertEqual(stats['saturation'], 0.25)
+
+    def test_health_check_reports_each_database(self):
+        response = self.client.get(reverse('health-db'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'databases': {'default': {'status': 'ok'}}})
+
+        # Timings and pool usage are for staff only
+        self.client.force_authenticate(User.objects.create_user(
+            username='ops', password='testpassword', is_staff=True))
+        response = self.client.get(reverse('health-db'))
+        self.assertIn('query_ms', response.data['databases']['default'])
+        self.assertIn('timings', response.data['metrics'])
+
+    def test_health_check_fails_when_database_is_down(self):
+        with patch('django.db.backends.utils.CursorWrapper.execute',
+                   side_effect=DatabaseError('down')):
+            response = self.client.get(reverse('health-db'))
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data['databases']['default']['status'],
+                         'error')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        routers._lag_checks.clear()
+        self.factory = RequestFactory()
+        self.router = routers.ReplicaRouter()
+
+    def read_alias(self, method='get', user=None):
+        request = getattr(self.factory, method)('/api/v1/orders/')
+        request.user = user or self.user
+        with routers.replica_reads(request):
+            return self.router.db_for_read(Order)
+
+    @patch('app.routers.replica_lag', return_value=0.0)
+    def test_safe_requests_read_from_replica(self, mock_lag):
+        self.assertEqual(self.read_alias(), 'replica_1')
+        self.assertIsNone(self.read_alias('post'))
+        # Outside a replica-enabled view everything uses the primary
+        self.assertIsNone(self.router.db_for_read(Order))
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+
+    @patch('app.routers.replica_lag', return_value=0.0)
+    def test_client_sticks_to_primary_after_writing(self, mock_lag):
+        request = self.factory.post('/api/v1/orders/')
+        request.user = self.user
+        routers.stick_to_primary(request)
+        self.assertIsNone(self.read_alias())
+
+        other = User.objects.create_user(username='other',
+                                         password='testpassword')
+        self.assertEqual(self.read_alias(user=other), 'replica_1')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with patch('app.routers.replica_lag', return_value=60.0):
+            self.assertIsNone(self.read_alias())
+        self.assertEqual(
+            metrics.snapshot()['counters']['db.replica_1.lagging'], 1)
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        with patch('app.routers.replica_lag',
+                   side_effect=DatabaseError('down')):
+            self.assertIsNone(self.read_alias())
+
+    @override_settings(DB_REPLICA_LAG_CHECK_SECONDS=60)
+    def test_lag_checked_at_most_once_per_interval(self):
+        with patch('app.routers.replica_lag',
+                   return_value=0.0) as mock_lag:
+            self.read_alias()
+            self.read_alias()
+        mock_lag.assert_called_once_with('replica_1')
+
+    def test_views_route_reads_and_mark_writes(self):
+        # The test database stands in for the replica
+        with patch('app.routers.healthy_replicas', return_value=['default']):
+            response = self.client.get(reverse('order-list-create'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                metrics.snapshot()['counters']['db.read.replica'], 1)
+
+            response = self.client.post(reverse('customer-list-create'), {
+                'name': 'Jane Doe', 'code': 'CUST002',
+                'phone_number': '+254722000002',
+                'email': 'jane@example.com', 'customer_id': 'CUST002'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertTrue(cache.get(routers.sticky_key(self.user.pk)))
+
+            response = self.client.get(reverse('order-list-create'))
+            self.assertEqual(
+                metrics.snapshot()['counters']['db.read.sticky'], 1)
+
+    def test_cache_fills_read_the_primary(self):
+        customer = Customer.objects.create(
+            name='New Name', code='CUST001', phone_number='+254722000001',
+            email='john@example.com', customer_id='CUST001')
+        order = Order.objects.create(customer=customer, item='Laptop',
+                                     amount=Decimal('1299.99'))
+
+        # A replica that hasn't replayed the rename yet
+        replica = {**connections.settings['default'], 'NAME': ':memory:'}
+        with patch.dict(connections.settings, {'replica_1': replica}), \
+                patch.object(type(self), 'databases',
+                             {*self.databases, 'replica_1'}), \
+                patch('app.routers.replica_lag', return_value=0.0):
+            try:
+                with connections['replica_1'].schema_editor() as editor:
+                    editor.create_model(Customer)
+                    editor.create_model(Order)
+                # bulk_create, so no signals write to the primary
+                Customer.objects.using('replica_1').bulk_create([Customer(
+                    id=customer.id, name='Old Name', code='CUST001',
+                    phone_number='+254722000001', email='john@example.com',
+                    customer_id='CUST001')])
+                Order.objects.using('replica_1').bulk_create([Order(
+                    id=order.id, customer_id=customer.id, item='Laptop',
+                    amount=Decimal('1299.99'))])
+
+                response = self.client.get(
+                    reverse('customer-detail', args=[customer.id]))
+                self.assertEqual(response.data['name'], 'New Name')
+                response = self.client.get(
+                    reverse('order-detail', args=[order.id]))
+                self.assertEqual(
+                    response.data['customer_details']['name'], 'New Name')
+                # Replica reads still serve what isn't cached
+                response = self.client.get(reverse('order-list-create'))
+                self.assertEqual(
+                    response.data['results'][0]['customer_details']['name'],
+                    'Old Name')
+            finally:
+                connections['replica_1'].close()
+                del connections['replica_1']
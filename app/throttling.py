@@ -0,0 +1,113 @@
+"""
+Token bucket throttles backed by the shared cache.
+
+DRF's stock throttles keep a list of request timestamps per client in
+the default cache, which grows with the rate and is read, modified and
+written back without a lock. Here each client has a bucket of
+`num_requests` tokens refilled evenly over the rate's period, stored as
+two numbers.
+
+With the Redis cache the bucket is updated by a single Lua script, so
+the check is atomic across every worker and node and uses Redis' clock
+rather than each host's. Any other cache backend is only shared within
+one process, so there the update is guarded by a process-local lock.
+"""
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework import throttling
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(wait)}
+"""
+
+_lock = threading.Lock()
+_script = None
+
+
+def _consume_redis(cache, key, capacity, rate):
+    global _script
+    key = cache.make_and_validate_key(key)
+    client = cache._cache.get_client(key, write=True)
+    if _script is None:
+        _script = client.register_script(TOKEN_BUCKET_SCRIPT)
+    allowed, wait = _script(keys=[key], args=[capacity, rate], client=client)
+    return bool(allowed), float(wait)
+
+
+def _consume_local(cache, key, capacity, rate):
+    with _lock:
+        now = time.time()
+        tokens, ts = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+        allowed = tokens >= 1
+        wait = 0.0
+        if allowed:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        cache.set(key, (tokens, now), timeout=int(capacity / rate) + 1)
+    return allowed, wait
+
+
+def consume(key, capacity, period):
+    """
+    Take one token from the bucket at `key`, which holds up to `capacity`
+    tokens refilled over `period` seconds. Returns (allowed, wait) where
+    `wait` is the seconds until a token is next available.
+    """
+    cache = caches['default']
+    rate = capacity / period
+    if isinstance(cache, RedisCache):
+        return _consume_redis(cache, key, capacity, rate)
+    return _consume_local(cache, key, capacity, rate)
+
+
+class TokenBucketThrottle(throttling.SimpleRateThrottle):
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        allowed, self._wait = consume(self.key, self.num_requests,
+                                      self.duration)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, TokenBucketThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, TokenBucketThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, TokenBucketThrottle):
+    """Applies the rate named by the view's `throttle_scope`, if any."""
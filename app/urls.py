@@ -1,10 +1,16 @@
 from django.urls import path
 from django.http import JsonResponse
-from app.views.orders.views import OrderListCreateView, OrderDetailView
+from app.views.orders.views import (
+    OrderListCreateView, OrderDetailView, OrderBulkCreateView,
+    OrderExportView, OrderStatsView, AsyncOrderListCreateView,
+    AsyncOrderDetailView
+)
 from app.views.customers.views import (
-    CustomerListCreateView, CustomerDetailView
+    CustomerListCreateView, CustomerDetailView, CustomerImportView,
+    AsyncCustomerListCreateView, AsyncCustomerDetailView
 )
 from app.views.auth.views import auth_info, create_oauth_application
+from app.views.health.views import database_health
 
 
 def api_v1_root(request):
@@ -13,10 +19,21 @@ def api_v1_root(request):
         'message': 'Savannah Technical Assessment API v1',
         'endpoints': {
             'customers': '/api/v1/customers/',
+            'customers_import': '/api/v1/customers/import/',
             'orders': '/api/v1/orders/',
+            'orders_bulk': '/api/v1/orders/bulk/',
+            'orders_export': '/api/v1/orders/export/',
+            'orders_stats': '/api/v1/orders/stats/',
+            'async': {
+                'customers': '/api/v1/async/customers/',
+                'orders': '/api/v1/async/orders/',
+            },
             'auth': {
                 'info': '/api/v1/auth/info/',
                 'create_app': '/api/v1/auth/create-app/'
+            },
+            'health': {
+                'database': '/api/v1/health/db/'
             }
         }
     })
@@ -28,9 +45,25 @@ urlpatterns = [
          name='customer-list-create'),
     path('customers/<int:pk>/', CustomerDetailView.as_view(),
          name='customer-detail'),
+    path('customers/import/', CustomerImportView.as_view(),
+         name='customer-import'),
     path('orders/', OrderListCreateView.as_view(), name='order-list-create'),
+    path('orders/bulk/', OrderBulkCreateView.as_view(),
+         name='order-bulk-create'),
+    path('orders/export/', OrderExportView.as_view(), name='order-export'),
+    path('orders/stats/', OrderStatsView.as_view(), name='order-stats'),
     path('orders/<uuid:pk>/', OrderDetailView.as_view(), name='order-detail'),
+    # Same API served by async views, for ASGI deployments
+    path('async/customers/', AsyncCustomerListCreateView.as_view(),
+         name='async-customer-list-create'),
+    path('async/customers/<int:pk>/', AsyncCustomerDetailView.as_view(),
+         name='async-customer-detail'),
+    path('async/orders/', AsyncOrderListCreateView.as_view(),
+         name='async-order-list-create'),
+    path('async/orders/<uuid:pk>/', AsyncOrderDetailView.as_view(),
+         name='async-order-detail'),
     path('auth/info/', auth_info, name='auth-info'),
     path('auth/create-app/', create_oauth_application,
          name='create-oauth-app'),
+    path('health/db/', database_health, name='health-db'),
 ]
@@ -0,0 +1,157 @@
+"""
+Shared view base classes.
+
+`ReplicaReadMixin` lets a view's safe requests read from a replica, see
+app/routers.py.
+
+The async views mirror DRF's generic ones. DRF's `APIView.dispatch` is
+synchronous, so under ASGI Django runs the whole view in a worker
+thread; these views keep the request on the event loop and await the
+async ORM. They use the same serializers as the sync views, so
+validation is shared; work that must stay synchronous (authentication
+and throttling, filtering, pagination, and saves that open a
+transaction) runs in a single `sync_to_async` call each. Filtering is
+among them because a filter may resolve the queryset's database, which
+can check a replica's lag with a query.
+"""
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import generics, mixins, status
+from rest_framework.response import Response
+
+from app import routers
+
+
+class ReplicaReadMixin:
+    """
+    Route this view's reads to a replica for GET and HEAD requests, and
+    keep the client on the primary for a while after a successful write.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.adispatch_with_replica(request, *args, **kwargs)
+        with routers.replica_reads(request):
+            response = super().dispatch(request, *args, **kwargs)
+        self.after_dispatch(request, response)
+        return response
+
+    async def adispatch_with_replica(self, request, *args, **kwargs):
+        with routers.replica_reads(request):
+            response = await super().dispatch(request, *args, **kwargs)
+        await sync_to_async(self.after_dispatch)(request, response)
+        return response
+
+    def after_dispatch(self, request, response):
+        if (request.method not in routers.SAFE_METHODS
+                and response.status_code < 400):
+            routers.stick_to_primary(request)
+
+
+class AsyncGenericAPIView(generics.GenericAPIView):
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication, permissions and throttling
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args,
+                                               **kwargs)
+        return self.response
+
+    async def afilter_queryset(self, queryset):
+        return await sync_to_async(self.filter_queryset)(queryset)
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError,
+                ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def avalidate(self, serializer):
+        # Model serializers check unique fields against the database,
+        # so by default validation runs in a worker thread
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+    async def aperform_create(self, serializer):
+        await sync_to_async(self.perform_create)(serializer)
+
+    async def aperform_update(self, serializer):
+        await sync_to_async(self.perform_update)(serializer)
+
+    def perform_create(self, serializer):
+        serializer.save()
+
+    def perform_update(self, serializer):
+        serializer.save()
+
+
+class AsyncListCreateAPIView(AsyncGenericAPIView):
+    get_success_headers = mixins.CreateModelMixin.get_success_headers
+
+    async def get(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await sync_to_async(self.paginate_queryset)(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer([obj async for obj in queryset],
+                                         many=True)
+        return Response(serializer.data)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.acreate(request, *args, **kwargs)
+
+    async def acreate(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await self.avalidate(serializer)
+        await self.aperform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers=headers)
+
+
+class AsyncRetrieveUpdateDestroyAPIView(AsyncGenericAPIView):
+    async def get(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
+
+    async def put(self, request, *args, partial=False, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance, data=request.data,
+                                         partial=partial)
+        await self.avalidate(serializer)
+        await self.aperform_update(serializer)
+        return Response(serializer.data)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.put(request, *args, partial=True, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        await instance.adelete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
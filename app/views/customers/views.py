@@ -1,20 +1,151 @@
-from rest_framework import generics
+import io
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import generics, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from oauth2_provider.contrib.rest_framework import TokenHasScope
 
+from app import cache as api_cache
+from app.filters import CustomerSearchBackend
+from app.idempotency import IdempotentCreateMixin
+from app.importers import (
+    FORMATS, CustomerImporter, detect_format, read_rows
+)
 from app.models.customers.models import Customer
 from app.serializers import CustomerSerializer
+from app.sparse import SparseFieldsMixin, SparseListMixin
+from app.views.base import (
+    AsyncListCreateAPIView, AsyncRetrieveUpdateDestroyAPIView,
+    ReplicaReadMixin
+)
+
+
+class CustomerSummaryMixin:
+    """
+    `?include=summary` adds each customer's order count, total spend and
+    last order date, read from CustomerSummary in the same query as the
+    customers.
+    """
+    def include_summary(self):
+        include = self.request.query_params.get('include', '')
+        return 'summary' in include.split(',')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.include_summary():
+            queryset = queryset.select_related('summary')
+        return queryset
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_summary'] = self.include_summary()
+        return context
 
-class CustomerListCreateView(generics.ListCreateAPIView):
+
+class CustomerListCreateView(IdempotentCreateMixin, SparseListMixin,
+                             CustomerSummaryMixin, ReplicaReadMixin,
+                             generics.ListCreateAPIView):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated, TokenHasScope]
     required_scopes = ['read', 'write']
+    throttle_scope = 'customers'
+    filter_backends = [CustomerSearchBackend]
 
 
-class CustomerDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CustomerDetailView(SparseFieldsMixin, CustomerSummaryMixin,
+                         ReplicaReadMixin,
+                         generics.RetrieveUpdateDestroyAPIView):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated, TokenHasScope]
     required_scopes = ['read', 'write']
+    throttle_scope = 'customers'
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.include_summary():
+            # Changes with every order, so never cached
+            data = self.get_serializer(self.get_object()).data
+        else:
+            data = api_cache.get_customer(
+                self.kwargs['pk'], request.version,
+                lambda: self.get_serializer(self.get_object()).data)
+        return Response(self.trim(data))
+
+
+class AsyncCustomerListCreateView(IdempotentCreateMixin, SparseListMixin,
+                                  CustomerSummaryMixin, ReplicaReadMixin,
+                                  AsyncListCreateAPIView):
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'customers'
+    filter_backends = [CustomerSearchBackend]
+
+
+class AsyncCustomerDetailView(SparseFieldsMixin, CustomerSummaryMixin,
+                              ReplicaReadMixin,
+                              AsyncRetrieveUpdateDestroyAPIView):
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'customers'
+
+    async def get(self, request, *args, **kwargs):
+        if self.include_summary():
+            data = self.get_serializer(await self.aget_object()).data
+        else:
+            data = await sync_to_async(api_cache.get_customer)(
+                self.kwargs['pk'], request.version,
+                lambda: self.get_serializer(self.get_object()).data)
+        return Response(self.trim(data))
+
+
+class CustomerImportView(ReplicaReadMixin, generics.GenericAPIView):
+    """
+    Import customers from an uploaded CSV or JSON Lines file. The upload is
+    parsed and inserted incrementally; the response summarises the import
+    and lists the first CUSTOMER_IMPORT_MAX_REPORTED_REJECTS rejected rows.
+    """
+    serializer_class = CustomerSerializer
+    parser_classes = [MultiPartParser]
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'bulk'
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload a file in the `file` field'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        file_format = (request.data.get('file_format')
+                       or detect_format(upload.name))
+        if file_format not in FORMATS:
+            return Response(
+                {'error': f'file_format must be one of {", ".join(FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        rejects = []
+
+        def on_reject(line_number, errors):
+            if len(rejects) < settings.CUSTOMER_IMPORT_MAX_REPORTED_REJECTS:
+                rejects.append({'line': line_number, 'errors': errors})
+
+        importer = CustomerImporter(
+            ignore_conflicts=request.data.get('ignore_conflicts') == 'true',
+            on_reject=on_reject)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig',
+                                  newline='')
+        result = importer.run(read_rows(stream, file_format))
+
+        return Response({
+            'processed': result.processed,
+            'imported': result.imported,
+            'rejected': result.rejected,
+            'rejects': rejects,
+        }, status=status.HTTP_200_OK)
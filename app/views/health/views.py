@@ -0,0 +1,47 @@
+import logging
+import time
+
+from django.db import DatabaseError, connections
+from rest_framework import status
+from rest_framework.decorators import (
+    api_view, permission_classes, throttle_classes
+)
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from app.db import db_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@throttle_classes([])
+def database_health(request):
+    """
+    Runs a trivial query on every configured database and reports whether
+    it succeeded. Staff also get how long it took, with this process's
+    connection timings and pool usage. Responds 503 if any database is
+    unreachable.
+    """
+    detailed = request.user.is_staff
+    databases = {}
+    for alias in connections:
+        start = time.perf_counter()
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            databases[alias] = {'status': 'ok'}
+            if detailed:
+                databases[alias]['query_ms'] = round(
+                    (time.perf_counter() - start) * 1000, 2)
+        except DatabaseError as e:
+            logger.error(f'Database {alias} health check failed: {e}')
+            databases[alias] = {'status': 'error'}
+
+    healthy = all(db['status'] == 'ok' for db in databases.values())
+    data = {'databases': databases}
+    if detailed:
+        data['metrics'] = db_metrics()
+    return Response(data, status=(status.HTTP_200_OK if healthy
+                                  else status.HTTP_503_SERVICE_UNAVAILABLE))
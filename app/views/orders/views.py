@@ -1,40 +1,217 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from oauth2_provider.contrib.rest_framework import TokenHasScope
 import logging
 
+from app import cache as api_cache
+from app import exporters
+from app import rollups
+from app import routers
+from app.models.customers.models import Customer
 from app.models.orders.models import Order
-from app.serializers import OrderSerializer
-from app.tasks.tasks import send_order_notification
+from app.filters import OrderFilterBackend
+from app.idempotency import IdempotentCreateMixin
+from app.pagination import OrderPagination
+from app.serializers import (
+    CustomerSerializer, OrderBulkSerializer, OrderExportQuerySerializer,
+    OrderSerializer, OrderStatsQuerySerializer, OrderStatsSerializer
+)
+from app.tasks.outbox import (
+    queue_bulk_order_notifications, queue_order_notification
+)
+from app.sparse import SparseFieldsMixin, SparseListMixin
+from app.views.base import (
+    AsyncListCreateAPIView, AsyncRetrieveUpdateDestroyAPIView,
+    ReplicaReadMixin
+)
 
 logger = logging.getLogger(__name__)
 
+# Orders are always rendered with their customer, so fetch both in one
+# query and load only the columns the serializers render
+ORDER_COLUMNS = ['id', 'customer', 'item', 'order_date', 'amount',
+                 'status', 'created_at', 'updated_at']
+order_queryset = Order.objects.select_related('customer').only(
+    *ORDER_COLUMNS,
+    *(f'customer__{field}' for field in CustomerSerializer.Meta.fields))
 
-class OrderListCreateView(generics.ListCreateAPIView):
-    queryset = Order.objects.all()
+
+def save_order(serializer):
+    # The SMS is sent by a worker after commit, never on the request path
+    with transaction.atomic():
+        order = serializer.save()
+        queue_order_notification(order)
+    return order
+
+
+async def resolve_customer(serializer):
+    """
+    Look up the order's customer with the async ORM and hand it to the
+    serializer, so validation runs without touching the database.
+    """
+    codes = serializer.customer_codes([serializer.initial_data])
+    serializer.context['customers'] = {
+        customer.code: customer
+        async for customer in Customer.objects.filter(code__in=codes)
+    } if codes else {}
+
+
+def cached_order(view):
+    def render_customer(pk):
+        customer = Customer.objects.get(pk=pk)
+        return CustomerSerializer(customer,
+                                  context=view.get_serializer_context()).data
+
+    return api_cache.get_order(
+        view.kwargs['pk'], view.request.version,
+        lambda: view.get_serializer(view.get_object()).data,
+        render_customer)
+
+
+class OrderListCreateView(IdempotentCreateMixin, SparseListMixin,
+                          ReplicaReadMixin, generics.ListCreateAPIView):
+    queryset = order_queryset
+    serializer_class = OrderSerializer
+    expandable_fields = {'customer': 'customer_details'}
+    pagination_class = OrderPagination
+    filter_backends = [OrderFilterBackend]
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'orders'
+
+    def perform_create(self, serializer):
+        save_order(serializer)
+
+
+class OrderDetailView(SparseFieldsMixin, ReplicaReadMixin,
+                      generics.RetrieveUpdateDestroyAPIView):
+    queryset = order_queryset
     serializer_class = OrderSerializer
+    expandable_fields = {'customer': 'customer_details'}
     permission_classes = [IsAuthenticated, TokenHasScope]
     required_scopes = ['read', 'write']
+    throttle_scope = 'orders'
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.trim(cached_order(self)))
+
 
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
+class AsyncOrderListCreateView(IdempotentCreateMixin, SparseListMixin,
+                               ReplicaReadMixin, AsyncListCreateAPIView):
+    queryset = order_queryset
+    serializer_class = OrderSerializer
+    expandable_fields = {'customer': 'customer_details'}
+    pagination_class = OrderPagination
+    filter_backends = [OrderFilterBackend]
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'orders'
+
+    async def avalidate(self, serializer):
+        await resolve_customer(serializer)
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
 
-        try:
-            send_order_notification(order.id)
-            logger.info(f'Order {order.id} notification sent')
-        except Exception as e:
-            logger.error(f'Error sending order {order.id} notification: {e}')
+    def perform_create(self, serializer):
+        save_order(serializer)
 
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED,
-                        headers=headers)
 
+class AsyncOrderDetailView(SparseFieldsMixin, ReplicaReadMixin,
+                           AsyncRetrieveUpdateDestroyAPIView):
+    queryset = order_queryset
+    serializer_class = OrderSerializer
+    expandable_fields = {'customer': 'customer_details'}
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'orders'
+
+    async def get(self, request, *args, **kwargs):
+        return Response(self.trim(await sync_to_async(cached_order)(self)))
+
+    async def avalidate(self, serializer):
+        await resolve_customer(serializer)
+        serializer.is_valid(raise_exception=True)
 
-class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Order.objects.all()
+
+class OrderBulkCreateView(ReplicaReadMixin, generics.GenericAPIView):
+    """
+    Create up to ORDER_BULK_MAX_ITEMS orders in one request. Valid orders
+    are inserted even if others in the batch are rejected; each rejected
+    order is reported with its index in the request.
+    """
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated, TokenHasScope]
     required_scopes = ['read', 'write']
+    throttle_scope = 'bulk'
+
+    def post(self, request, *args, **kwargs):
+        serializer = OrderBulkSerializer(
+            child=OrderSerializer(), data=request.data,
+            max_length=settings.ORDER_BULK_MAX_ITEMS,
+            context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            orders = serializer.save()
+            queue_bulk_order_notifications(orders)
+
+        return Response({
+            'created': len(orders),
+            'rejected': len(serializer.rejected),
+            'orders': [{'index': index, 'id': order.id}
+                       for index, order in zip(serializer.accepted, orders)],
+            'errors': serializer.rejected,
+        }, status=(status.HTTP_201_CREATED if orders
+                   else status.HTTP_400_BAD_REQUEST))
+
+
+class OrderExportView(ReplicaReadMixin, generics.GenericAPIView):
+    """
+    Stream every order matching the filters as NDJSON or CSV, oldest
+    first. Filters: `status`, `order_date_after`, `order_date_before`;
+    pick the encoding with `file_format`.
+    """
+    serializer_class = OrderExportQuerySerializer
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'bulk'
+
+    def get(self, request, *args, **kwargs):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        file_format = query.validated_data['file_format']
+
+        # Rows are read after the view returns, so pick the database now
+        rows = exporters.export_rows(query.get_filters(),
+                                     using=routers.read_alias())
+        response = StreamingHttpResponse(
+            exporters.ENCODERS[file_format](rows),
+            content_type=exporters.CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = (
+            f'attachment; filename="orders.{file_format}"')
+        return response
+
+
+class OrderStatsView(ReplicaReadMixin, generics.GenericAPIView):
+    """
+    Order counts and revenue over a range of days (`date_from`,
+    `date_to`, the last ORDER_STATS_DEFAULT_DAYS by default): totals, per
+    status, per day and for the `top` customers by revenue. Read from
+    the rollups in app/rollups.py, never from the orders themselves.
+    """
+    serializer_class = OrderStatsQuerySerializer
+    permission_classes = [IsAuthenticated, TokenHasScope]
+    required_scopes = ['read', 'write']
+    throttle_scope = 'orders'
+
+    def get(self, request, *args, **kwargs):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = rollups.stats(query.validated_data['date_from'],
+                             query.validated_data['date_to'],
+                             query.validated_data['top'])
+        return Response(OrderStatsSerializer(data).data)
@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+
+from corsheaders.defaults import default_headers
 
 # flake8: noqa
 
@@ -45,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'oauth2_provider',
@@ -57,9 +61,11 @@ if ENVIRONMENT == 'development':
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
-    'oauth2_provider.middleware.OAuth2TokenMiddleware',
+    # Async-capable subclasses of the oauth2_provider and whitenoise
+    # middleware, so ASGI requests stay on the event loop
+    'app.middleware.OAuth2TokenMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'app.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,30 +96,173 @@ ASGI_APPLICATION = 'savannah_project.asgi.application'
 WSGI_APPLICATION = 'savannah_project.wsgi.application'
 
 
+# Celery workers
+# Worker for each queue, started with `manage.py run_worker <queue>`.
+# SMS sends spend their time waiting on the gateway, so one process runs
+# many threads, each prefetching a few tasks. Analytics tasks are long
+# and database-bound: processes that reserve only the task they run.
+WORKER_PROFILES = {
+    'notifications': {
+        'pool': os.getenv('NOTIFICATIONS_WORKER_POOL', default='threads'),
+        'concurrency': int(os.getenv('NOTIFICATIONS_WORKER_CONCURRENCY',
+                                     default='32')),
+        'prefetch_multiplier': int(os.getenv(
+            'NOTIFICATIONS_WORKER_PREFETCH', default='4')),
+    },
+    'analytics': {
+        'pool': 'prefork',
+        'concurrency': int(os.getenv('ANALYTICS_WORKER_CONCURRENCY',
+                                     default='2')),
+        'prefetch_multiplier': 1,
+    },
+    'default': {
+        'pool': 'prefork',
+        'concurrency': int(os.getenv('DEFAULT_WORKER_CONCURRENCY',
+                                     default=str(os.cpu_count() or 1))),
+        'prefetch_multiplier': 1,
+    },
+}
+
+
+def worker_queue(argv):
+    """The queue a process started with `argv` works on, if run_worker."""
+    if argv[1:2] != ['run_worker']:
+        return None
+    return next((arg for arg in argv[2:] if arg in WORKER_PROFILES), None)
+
+
+def is_worker(argv):
+    """Whether a process started with `argv` is a Celery worker."""
+    return Path(argv[0]).name == 'celery' or worker_queue(argv) is not None
+
+
+def worker_threads(queue):
+    """Tasks a worker for `queue` runs at once, each needing a connection."""
+    if queue is None or WORKER_PROFILES[queue]['pool'] == 'prefork':
+        return 1
+    return WORKER_PROFILES[queue]['concurrency']
+
+
+WORKER_QUEUE = worker_queue(sys.argv)
+
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Celery workers live for hours and run one task at a time per process,
+# or per thread in a thread pool; web workers (gunicorn) are recycled and
+# may serve requests on threads
+DB_PROCESS = os.getenv('DB_PROCESS', default=(
+    'worker' if is_worker(sys.argv) else 'web'))
+IS_WORKER = DB_PROCESS == 'worker'
+WORKER_THREADS = worker_threads(WORKER_QUEUE)
+
+# Persistent connections, reused for up to DB_CONN_MAX_AGE seconds and
+# checked before reuse when DB_CONN_HEALTH_CHECKS is on
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE',
+                                default='300' if IS_WORKER else '60'))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS',
+                                  default='True') == 'True'
+# Or psycopg's connection pool (needs psycopg[pool]); pooled connections
+# are health checked on checkout under the same setting
+DB_POOL = os.getenv('DB_POOL', default='False') == 'True'
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', default='1'))
+DB_POOL_MAX_SIZE = int(os.getenv(
+    'DB_POOL_MAX_SIZE',
+    default=str(max(2, WORKER_THREADS)) if IS_WORKER else '4'))
+# Seconds to wait for a free pooled connection before failing
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', default='10'))
+
 if ENVIRONMENT == 'production':
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            # Django's backend plus connection timings, see app/db/
+            'ENGINE': 'app.db.postgresql',
             'NAME': os.getenv('DB_NAME'),
             'USER': os.getenv('DB_USER'),
             'PASSWORD': os.getenv('DB_PASSWORD'),
             'HOST': os.getenv('DB_HOST'),
             'PORT': os.getenv('DB_PORT'),
+            # Pooled connections are returned to the pool instead
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': DB_POOL_MIN_SIZE,
+                    'max_size': DB_POOL_MAX_SIZE,
+                    'timeout': DB_POOL_TIMEOUT,
+                },
+            } if DB_POOL else {},
         }
     }
 else:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
+            'ENGINE': 'app.db.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
 
+# Read replicas, see app/routers.py. In production each host in
+# DB_REPLICA_HOSTS becomes a `replica_<n>` alias with the primary's
+# credentials; locally DB_REPLICA_SQLITE names a second SQLite file (or
+# the same one) to read from.
+if ENVIRONMENT == 'production':
+    DB_REPLICA_HOSTS = [host for host in os.getenv(
+        'DB_REPLICA_HOSTS', default='').split(',') if host]
+    for number, host in enumerate(DB_REPLICA_HOSTS, start=1):
+        DATABASES[f'replica_{number}'] = {
+            **DATABASES['default'], 'HOST': host,
+            'TEST': {'MIRROR': 'default'}}
+elif os.getenv('DB_REPLICA_SQLITE'):
+    DATABASES['replica_1'] = {
+        **DATABASES['default'], 'NAME': os.getenv('DB_REPLICA_SQLITE'),
+        'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES
+                     if alias.startswith('replica_')]
+DATABASE_ROUTERS = ['app.routers.ReplicaRouter']
+# Keep a client on the primary this long after it writes
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS',
+                                          default='10'))
+# Skip replicas further behind than this; lag is rechecked at most every
+# DB_REPLICA_LAG_CHECK_SECONDS per process
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS',
+                                             default='5'))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv(
+    'DB_REPLICA_LAG_CHECK_SECONDS', default='5'))
+
+# Cache
+# Redis when CACHE_URL (or REDIS_URL) is set, so every worker shares one
+# cache; otherwise a per-process local memory cache
+CACHE_URL = os.getenv('CACHE_URL', default=os.getenv('REDIS_URL'))
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'savannah',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Serialized customer and order detail responses, see app/cache.py
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', default='300'))
+# How long one request may render a missing entry before a waiter takes over
+API_CACHE_LOCK_TIMEOUT = int(os.getenv('API_CACHE_LOCK_TIMEOUT', default='5'))
+
 # REST Framework
 # https://www.django-rest-framework.org/
+# Render and parse JSON with orjson when it is installed, see
+# app/renderers.py
+API_ORJSON = os.getenv('API_ORJSON', default='True') == 'True'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
@@ -123,23 +272,32 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'app.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'app.renderers.ORJSONRenderer' if API_ORJSON
+        else 'rest_framework.renderers.JSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'app.parsers.ORJSONParser' if API_ORJSON
+        else 'rest_framework.parsers.JSONParser',
     ),
     'DEFAULT_METADATA_CLASS': 'rest_framework.metadata.SimpleMetadata',
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    # Token buckets in the shared cache, see app/throttling.py
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'app.throttling.AnonRateThrottle',
+        'app.throttling.UserRateThrottle',
+        'app.throttling.ScopedRateThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/day',
-        'user': '1000/day',
+        'anon': os.getenv('THROTTLE_RATE_ANON', default='100/day'),
+        'user': os.getenv('THROTTLE_RATE_USER', default='1000/day'),
+        # Per endpoint group, matched by each view's throttle_scope
+        'customers': os.getenv('THROTTLE_RATE_CUSTOMERS',
+                               default='600/minute'),
+        'orders': os.getenv('THROTTLE_RATE_ORDERS', default='600/minute'),
+        'bulk': os.getenv('THROTTLE_RATE_BULK', default='30/minute'),
     },
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
     'DEFAULT_VERSION': 'v1',
@@ -149,6 +307,36 @@ REST_FRAMEWORK = {
     'DEFAULT_VERSION_AUTO_DISCOVER_FROM_INSTALLED_APPS': True,
 }
 
+# Bulk ingestion
+ORDER_BULK_MAX_ITEMS = int(os.getenv('ORDER_BULK_MAX_ITEMS', default='5000'))
+# Rows per INSERT statement when bulk creating
+ORDER_BULK_CHUNK_SIZE = int(os.getenv('ORDER_BULK_CHUNK_SIZE', default='500'))
+
+# Order export: rows fetched per server-side cursor round trip
+ORDER_EXPORT_CHUNK_SIZE = int(
+    os.getenv('ORDER_EXPORT_CHUNK_SIZE', default='2000'))
+
+# Order stats, see app/rollups.py: default and longest reporting period
+ORDER_STATS_DEFAULT_DAYS = int(
+    os.getenv('ORDER_STATS_DEFAULT_DAYS', default='30'))
+ORDER_STATS_MAX_DAYS = int(os.getenv('ORDER_STATS_MAX_DAYS', default='366'))
+
+# Idempotency-Key on creates, see app/idempotency.py: responses are
+# replayed for IDEMPOTENCY_KEY_TTL seconds, and a key held for longer than
+# IDEMPOTENCY_LOCK_TIMEOUT by a request still running is assumed
+# abandoned, so keep it above the worker timeout
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', default='86400'))
+IDEMPOTENCY_LOCK_TIMEOUT = int(
+    os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', default='60'))
+IDEMPOTENCY_KEY_PURGE_INTERVAL = int(
+    os.getenv('IDEMPOTENCY_KEY_PURGE_INTERVAL', default='3600'))
+
+# Customer import
+CUSTOMER_IMPORT_CHUNK_SIZE = int(
+    os.getenv('CUSTOMER_IMPORT_CHUNK_SIZE', default='1000'))
+CUSTOMER_IMPORT_MAX_REPORTED_REJECTS = int(
+    os.getenv('CUSTOMER_IMPORT_MAX_REPORTED_REJECTS', default='100'))
+
 # OAuth2 Provider
 OAUTH2_PROVIDER = {
     'SCOPES': {
@@ -157,7 +345,13 @@ OAUTH2_PROVIDER = {
     },
     'ACCESS_TOKEN_EXPIRE_SECONDS': 3600,
     'REFRESH_TOKEN_EXPIRE_SECONDS': 3600 * 24 * 7,
+    'OAUTH2_VALIDATOR_CLASS': 'app.authentication.CachedOAuth2Validator',
+    'OAUTH2_BACKEND_CLASS': 'app.authentication.CachedOAuthLibCore',
 }
+# Validated access tokens, see app/authentication.py. Never cached past
+# the token's own expiry.
+OAUTH2_TOKEN_CACHE_TIMEOUT = int(os.getenv('OAUTH2_TOKEN_CACHE_TIMEOUT',
+                                           default='300'))
 
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('REDIS_URL', default='redis://localhost:6379/0')
@@ -167,6 +361,72 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Africa/Nairobi'
+# Tasks live in app/tasks/tasks.py, which autodiscovery does not import
+CELERY_IMPORTS = ('app.tasks.tasks',)
+# Don't block the request on broker retries; the outbox drain resends
+CELERY_TASK_PUBLISH_RETRY = False
+# Each kind of work has its own queue and worker, so a long rollup never
+# holds up an SMS. Tasks not routed here go to `default`.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'app.tasks.tasks.send_order_notification': {'queue': 'notifications'},
+    'app.tasks.tasks.send_notification_batch': {'queue': 'notifications'},
+    'app.tasks.tasks.drain_notification_outbox': {'queue': 'notifications'},
+    'app.tasks.tasks.reconcile_customer_summaries': {'queue': 'analytics'},
+    'app.tasks.tasks.purge_idempotency_keys': {'queue': 'analytics'},
+}
+# Acknowledge a task once it has run, so one whose worker dies is run
+# again. Every task is safe to repeat: notifications are claimed in the
+# database before they are sent, and the others recompute or delete.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# Workers are started per queue, see WORKER_PROFILES
+
+# Notification outbox
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(
+    os.getenv('NOTIFICATION_OUTBOX_BATCH_SIZE', default='100'))
+# Rows younger than this are left to their own on_commit dispatch
+NOTIFICATION_OUTBOX_GRACE_SECONDS = int(
+    os.getenv('NOTIFICATION_OUTBOX_GRACE_SECONDS', default='60'))
+# Rows stuck in `sending` longer than this are assumed abandoned
+NOTIFICATION_OUTBOX_STALE_SECONDS = int(
+    os.getenv('NOTIFICATION_OUTBOX_STALE_SECONDS', default='300'))
+NOTIFICATION_OUTBOX_DRAIN_INTERVAL = int(
+    os.getenv('NOTIFICATION_OUTBOX_DRAIN_INTERVAL', default='30'))
+# Sends attempted before a notification the gateway fails is dead, see
+# app/models/notifications/models.py
+NOTIFICATION_MAX_ATTEMPTS = int(
+    os.getenv('NOTIFICATION_MAX_ATTEMPTS', default='3'))
+# Failed sends are retried after an exponential backoff with full
+# jitter: up to NOTIFICATION_RETRY_BACKOFF seconds, doubling with each
+# attempt up to NOTIFICATION_RETRY_BACKOFF_MAX
+NOTIFICATION_RETRY_BACKOFF = int(
+    os.getenv('NOTIFICATION_RETRY_BACKOFF', default='30'))
+NOTIFICATION_RETRY_BACKOFF_MAX = int(
+    os.getenv('NOTIFICATION_RETRY_BACKOFF_MAX', default='900'))
+
+# Customer summaries, see app/rollups.py: recomputed from the orders
+# every CUSTOMER_SUMMARY_RECONCILE_INTERVAL seconds, this many customers
+# per transaction
+CUSTOMER_SUMMARY_RECONCILE_INTERVAL = int(
+    os.getenv('CUSTOMER_SUMMARY_RECONCILE_INTERVAL', default='86400'))
+CUSTOMER_SUMMARY_RECONCILE_CHUNK_SIZE = int(
+    os.getenv('CUSTOMER_SUMMARY_RECONCILE_CHUNK_SIZE', default='1000'))
+
+CELERY_BEAT_SCHEDULE = {
+    'drain-notification-outbox': {
+        'task': 'app.tasks.tasks.drain_notification_outbox',
+        'schedule': NOTIFICATION_OUTBOX_DRAIN_INTERVAL,
+    },
+    'reconcile-customer-summaries': {
+        'task': 'app.tasks.tasks.reconcile_customer_summaries',
+        'schedule': CUSTOMER_SUMMARY_RECONCILE_INTERVAL,
+    },
+    'purge-idempotency-keys': {
+        'task': 'app.tasks.tasks.purge_idempotency_keys',
+        'schedule': IDEMPOTENCY_KEY_PURGE_INTERVAL,
+    },
+}
 
 # AfricasTalking Configuration
 AFRICASTALKING_USERNAME = os.getenv('AFRICASTALKING_USERNAME',
@@ -174,6 +434,45 @@ AFRICASTALKING_USERNAME = os.getenv('AFRICASTALKING_USERNAME',
 
 AFRICASTALKING_API_KEY = os.getenv('AFRICASTALKING_API_KEY')
 
+# Class that sends SMS, see app/tasks/sms_service.py: built with no
+# arguments, it has `send(message, recipients)` returning the response
+# of the Africa's Talking SDK, and `close()`. `FakeSMSGateway` sends
+# nothing, answering after SMS_FAKE_LATENCY seconds and failing
+# SMS_FAKE_ERROR_RATE of recipients, for load tests.
+SMS_BACKEND = os.getenv('SMS_BACKEND',
+                        default='app.tasks.sms_service.PooledSMSClient')
+SMS_FAKE_LATENCY = float(os.getenv('SMS_FAKE_LATENCY', default='0.2'))
+SMS_FAKE_ERROR_RATE = float(os.getenv('SMS_FAKE_ERROR_RATE', default='0'))
+
+# Recipients per Africa's Talking send call
+SMS_BULK_MAX_RECIPIENTS = int(
+    os.getenv('SMS_BULK_MAX_RECIPIENTS', default='100'))
+# When set, order notifications are coalesced into one batch task per
+# window instead of one task per order
+SMS_BATCH_WINDOW_SECONDS = int(
+    os.getenv('SMS_BATCH_WINDOW_SECONDS', default='0'))
+# Body of batched order SMS: bulk orders, and every order while
+# SMS_BATCH_WINDOW_SECONDS is set. Only identical bodies share a provider
+# call, so leave out {name}, {item} and {order_id}, which differ per
+# order. Orders sent one at a time name the customer, item and order.
+ORDER_SMS_BATCH_TEMPLATE = os.getenv(
+    'ORDER_SMS_BATCH_TEMPLATE',
+    default='Hello! Your order has been received successfully.')
+# A batch is sent before its window closes once this many are waiting
+SMS_BATCH_MAX_SIZE = int(os.getenv('SMS_BATCH_MAX_SIZE', default='500'))
+# Keep-alive connection pool shared by all sends in a worker process;
+# by default one connection per notifications worker thread
+SMS_HTTP_POOL_SIZE = int(os.getenv(
+    'SMS_HTTP_POOL_SIZE',
+    default=str(WORKER_PROFILES['notifications']['concurrency'])))
+SMS_HTTP_CONNECT_TIMEOUT = float(
+    os.getenv('SMS_HTTP_CONNECT_TIMEOUT', default='5'))
+SMS_HTTP_READ_TIMEOUT = float(os.getenv('SMS_HTTP_READ_TIMEOUT', default='15'))
+# Sending tasks each worker starts, as a Celery rate limit. Each task
+# makes one provider call per distinct message, so set this to the
+# gateway's request quota divided by the number of workers.
+SMS_TASK_RATE_LIMIT = os.getenv('SMS_TASK_RATE_LIMIT', default='10/s')
+
 # Security
 CSRF_TRUSTED_ORIGINS = os.getenv('CSRF_TRUSTED_ORIGINS',
                                  default='http://localhost:3000').split(',')
@@ -188,6 +487,9 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS',
                                  default='http://localhost:3000').split(',')
+# Idempotent creates, see app/idempotency.py
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ('idempotent-replayed',)
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators